@@ -0,0 +1,11 @@
+"""
+Puts the root of the repository on the import path, so that the benchmarks run from a checkout (python
+benchmarks/<name>.py) without installing sentient. Imported by every benchmark before sentient.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
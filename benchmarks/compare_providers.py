@@ -0,0 +1,76 @@
+"""
+Compares LLM providers and models on the same goal: the tokens, latency and retries of their LLM calls.
+
+Runs the goal once per provider and model, one after the other, in the Chrome listening on localhost:9222 (see the
+README), and prints the LLM usage of every run: calls, prompt tokens (and how many of them were read from the
+provider's prompt cache), completion tokens, total and mean latency of the calls, retries and validation failures,
+and the wall time of the run.
+
+Usage: python benchmarks/compare_providers.py "<goal>" openai:gpt-4o-2024-08-06 anthropic:claude-3-5-sonnet-20240620 [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import _bootstrap  # noqa: F401
+from sentient import Sentient
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("goal")
+    parser.add_argument(
+        "models", nargs="+", help="provider:model, e.g. openai:gpt-4o-2024-08-06"
+    )
+    parser.add_argument("--custom-base-url", default=None)
+    parser.add_argument("--json", action="store_true", help="print the usage as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for provider_and_model in args.models:
+        provider, _, model = provider_and_model.partition(":")
+        # a new instance per model, since an instance keeps the agent of its first goal
+        sentient = Sentient()
+        start = time.perf_counter()
+        try:
+            final_response, usage = await sentient.invoke(
+                args.goal,
+                provider=provider,
+                model=model,
+                custom_base_url=args.custom_base_url,
+                return_usage=True,
+            )
+        finally:
+            await sentient.shutdown()
+        results.append(
+            {
+                "provider": provider,
+                "model": model,
+                "wall_time": time.perf_counter() - start,
+                "final_response": final_response,
+                "usage": usage.model_dump(),
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'provider:model':<48} {'calls':>5} {'prompt':>8} {'cached':>8} {'output':>7} "
+        f"{'llm s':>7} {'mean s':>7} {'retries':>7} {'invalid':>7} {'wall s':>7}"
+    )
+    for result in results:
+        usage = result["usage"]
+        mean_latency = usage["latency"] / usage["calls"] if usage["calls"] else 0.0
+        print(
+            f"{result['provider'] + ':' + result['model']:<48} {usage['calls']:>5} {usage['prompt_tokens']:>8} "
+            f"{usage['cached_tokens']:>8} {usage['completion_tokens']:>7} {usage['latency']:>7.1f} "
+            f"{mean_latency:>7.2f} {usage['retries']:>7} {usage['validation_failures']:>7} "
+            f"{result['wall_time']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""
+Overlap of concurrent agent runs against a local stub of the OpenAI API.
+
+Starts an OpenAI compatible stub server (in its own thread) that answers every chat completion after a fixed delay,
+then runs N agents at the same time, first with a blocking client called from the event loop, as BaseAgent used to,
+then with BaseAgent and its async client. Prints the wall time of each and the longest the event loop was blocked,
+measured by a ticker running alongside. With the async client the N requests overlap: the wall time stays close to
+one delay and the event loop is never blocked for long.
+
+Usage: python benchmarks/concurrent_agents.py [--agents N] [--delay SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+import instructor
+import openai
+from aiohttp import web
+
+import _bootstrap  # noqa: F401
+from sentient.core.agent.agent import Agent
+from sentient.core.models.models import AgentInput, AgentOutput
+from sentient.utils.providers import CustomProvider
+
+AGENT_OUTPUT = {
+    "thought": "The objective is done",
+    "plan": [{"id": 1, "description": "Search", "url": None, "result": None}],
+    "next_task": None,
+    "next_task_actions": None,
+    "is_complete": True,
+    "final_response": "done",
+}
+
+
+def start_stub_server(delay: float) -> str:
+    """
+    Starts the stub server in a background thread and returns its base url.
+    """
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(delay)
+        return web.json_response(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": "call_stub",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "AgentOutput",
+                                        "arguments": json.dumps(AGENT_OUTPUT),
+                                    },
+                                }
+                            ],
+                        },
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 10,
+                    "total_tokens": 20,
+                },
+            }
+        )
+
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.add_routes([web.post("/v1/chat/completions", chat_completions)])
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        address["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}/v1"
+
+
+async def measure(run_agents) -> tuple:
+    """
+    Runs the agents with a ticker alongside, and returns the wall time and the longest gap between two ticks.
+    """
+    max_gap = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal max_gap
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            max_gap = max(max_gap, now - last)
+            last = now
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await run_agents()
+    wall_time = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return wall_time, max_gap
+
+
+def make_input(i: int) -> AgentInput:
+    return AgentInput(
+        objective=f"objective {i}",
+        completed_tasks=[],
+        current_page_url="https://example.com",
+        current_page_dom="{'role': 'WebArea'}",
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CUSTOM_API_KEY", "stub")
+    base_url = start_stub_server(args.delay)
+    provider = CustomProvider(base_url)
+
+    blocking_client = instructor.from_openai(
+        openai.Client(**provider.get_client_config()), mode=instructor.Mode.TOOLS
+    )
+
+    async def run_blocking():
+        async def run(i: int):
+            # a synchronous client called from a coroutine blocks the event loop for the whole request
+            return blocking_client.chat.completions.create(
+                model="stub",
+                messages=[{"role": "user", "content": make_input(i).model_dump_json()}],
+                response_model=AgentOutput,
+            )
+
+        await asyncio.gather(*(run(i) for i in range(args.agents)))
+
+    agents = [Agent(provider=provider, model_name="stub") for _ in range(args.agents)]
+
+    async def run_async():
+        results = await asyncio.gather(
+            *(agent.run(make_input(i)) for i, agent in enumerate(agents))
+        )
+        assert all(result.is_complete for result in results)
+
+    print(f"{args.agents} agents, {args.delay}s per request")
+    for name, run_agents in (
+        ("blocking client", run_blocking),
+        ("async client", run_async),
+    ):
+        wall_time, max_gap = await measure(run_agents)
+        print(
+            f"{name:<16} wall time {wall_time:6.2f}s  event loop blocked up to {max_gap:6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+Measures the tokens of the DOM sent to the agent with and without the delta mode.
+
+Builds a synthetic result page (a search form and a list of product cards), then applies the kind of small change a
+step makes: a text typed in the search box, a toast that appears, a card whose price changes and a banner that is
+closed. For every page size, prints the tokens of the full tree and of the delta with its index of the unchanged
+elements, both as the repr sent by default and as the compact lines of serialize_dom. Tokens are counted with
+count_tokens, which estimates them from the text length when no tiktoken encoding can be loaded.
+
+Usage: python benchmarks/dom_delta.py [--products N [N ...]] [--model MODEL]
+"""
+
+import argparse
+import copy
+import random
+from typing import Any, Dict
+
+import _bootstrap  # noqa: F401
+from sentient.utils.dom_diff import DomDeltaTracker, flatten_dom_tree
+from sentient.utils.dom_serializer import count_tokens, serialize_dom
+
+
+def product_page(product_count: int, rng: random.Random) -> Dict[str, Any]:
+    mmid = 0
+
+    def next_mmid() -> str:
+        nonlocal mmid
+        mmid += 1
+        return str(mmid)
+
+    banner = {
+        "role": "region",
+        "name": "Free shipping on orders over $50",
+        "children": [
+            {"role": "button", "tag": "button", "name": "Close", "mmid": next_mmid()}
+        ],
+    }
+    search = {
+        "role": "search",
+        "name": "",
+        "children": [
+            {
+                "role": "searchbox",
+                "tag": "input",
+                "name": "Search products",
+                "mmid": next_mmid(),
+                "placeholder": "What are you looking for?",
+                "autocomplete": "off",
+            },
+            {"role": "button", "tag": "button", "name": "Search", "mmid": next_mmid()},
+        ],
+    }
+    cards = []
+    for index in range(product_count):
+        cards.append(
+            {
+                "role": "listitem",
+                "name": "",
+                "children": [
+                    {
+                        "role": "link",
+                        "tag": "a",
+                        "name": f"Wireless noise cancelling headphones, model {index}",
+                        "mmid": next_mmid(),
+                        "description": "Over-ear, 30 hours of battery, fast charging",
+                    },
+                    {"role": "text", "name": f"${rng.randint(20, 400)}.99"},
+                    {"role": "text", "name": f"{rng.randint(1, 5000)} reviews"},
+                    {
+                        "role": "button",
+                        "tag": "button",
+                        "name": "Add to cart",
+                        "mmid": next_mmid(),
+                        "aria-label": f"Add model {index} to cart",
+                    },
+                ],
+            }
+        )
+    return {
+        "role": "WebArea",
+        "name": "Headphones - Example Store",
+        "children": [banner, search, {"role": "list", "name": "", "children": cards}],
+    }
+
+
+def step_change(page: Dict[str, Any]) -> Dict[str, Any]:
+    """The page after a step: text typed, a toast shown, a price changed and the banner closed."""
+    page = copy.deepcopy(page)
+    banner, search, products = page["children"]
+    search["children"][0]["value"] = "sony wh-1000xm5"
+    products["children"][0]["children"][1]["name"] = "$279.99"
+    page["children"] = [
+        {"role": "status", "name": "Added to cart", "mmid": "toast"},
+        search,
+        products,
+    ]
+    return page
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--model", default="gpt-4o")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    tracker = DomDeltaTracker()
+    print(
+        f"{'products':>9}{'full repr':>12}{'delta repr':>12}{'saved':>8}{'full lines':>12}{'delta lines':>13}{'saved':>8}"
+    )
+    for product_count in args.products:
+        before = product_page(product_count, rng)
+        after = step_change(before)
+        delta = tracker.get_delta(
+            after, flatten_dom_tree(before), flatten_dom_tree(after)
+        )
+        assert delta.get("dom_delta"), "The change is too large to be sent as a delta"
+
+        full_repr = count_tokens(str(after), args.model)
+        delta_repr = count_tokens(str(delta), args.model)
+        full_lines = serialize_dom(after, model=args.model).tokens
+        delta_lines = serialize_dom(delta, model=args.model).tokens
+        print(
+            f"{product_count:>9}{full_repr:>12}{delta_repr:>12}{1 - delta_repr / full_repr:>8.0%}"
+            f"{full_lines:>12}{delta_lines:>13}{1 - delta_lines / full_lines:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
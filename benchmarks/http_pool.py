@@ -0,0 +1,142 @@
+"""
+Connection reuse of the LLM clients, against a local stub of the OpenAI API.
+
+Starts an OpenAI compatible stub server (in its own thread) that answers every chat completion after a fixed delay and
+counts the connections it accepts. Then runs several sessions of several steps, a new agent per session as
+Sentient creates them, with a pause between the steps standing for the browser actions: first with a client of its
+own per agent, as every agent used to create, then with the HTTP client shared by the agents of the provider. Prints
+the connections the server accepted and the wall time of each, and the reuse metrics of the shared clients.
+
+Usage: python benchmarks/http_pool.py [--sessions N] [--steps N] [--pause SECONDS] [--delay SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+import httpx
+from aiohttp import web
+from concurrent_agents import AGENT_OUTPUT, make_input
+
+import _bootstrap  # noqa: F401
+from sentient.core.agent.agent import Agent
+from sentient.utils.http_clients import get_http_client_stats
+from sentient.utils.providers import CustomProvider
+
+
+class UnsharedProvider(CustomProvider):
+    """
+    A provider whose every agent gets an HTTP client of its own, with the default pool of httpx.
+    """
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient()
+
+
+def start_stub_server(delay: float, connections: set) -> str:
+    """
+    Starts the stub server in a background thread, adding every connection it accepts to `connections`, and
+    returns its base url.
+    """
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        connections.add(request.transport)
+        body = await request.json()
+        await asyncio.sleep(delay)
+        return web.json_response(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": "call_stub",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "AgentOutput",
+                                        "arguments": json.dumps(AGENT_OUTPUT),
+                                    },
+                                }
+                            ],
+                        },
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 10,
+                    "total_tokens": 20,
+                },
+            }
+        )
+
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.add_routes([web.post("/v1/chat/completions", chat_completions)])
+        runner = web.AppRunner(app, keepalive_timeout=75)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        address["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}/v1"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CUSTOM_API_KEY", "stub")
+    connections: set = set()
+    base_url = start_stub_server(args.delay, connections)
+
+    print(
+        f"{args.sessions} sessions of {args.steps} steps, {args.pause}s between the steps"
+    )
+    for name, provider in (
+        ("client per agent", UnsharedProvider(base_url)),
+        ("shared client", CustomProvider(base_url)),
+    ):
+        connections.clear()
+        start = time.perf_counter()
+        for session in range(args.sessions):
+            agent = Agent(provider=provider, model_name="stub")
+            for step in range(args.steps):
+                await agent.run(make_input(step))
+                await asyncio.sleep(args.pause)
+        wall_time = time.perf_counter() - start
+        print(
+            f"{name:<17} connections {len(connections):>3}  wall time {wall_time:6.2f}s"
+        )
+
+    for key, stats in get_http_client_stats().items():
+        print(
+            f"{key}: {stats['requests']} requests over {stats['connections']} connections, "
+            f"reuse rate {stats['reuse_rate']:.0%}, {stats['http2_requests']} over HTTP/2"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
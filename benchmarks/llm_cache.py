@@ -0,0 +1,55 @@
+"""
+Replay of LLM responses from the response cache against a local stub of the OpenAI API.
+
+Starts an OpenAI compatible stub server (in its own thread) that answers every chat completion after a fixed delay,
+then runs the same N agent requests three times with a cache in a temporary SQLite file: cold (every request misses
+and is written), warm (every request is replayed), and with the cache read only, as a benchmark would. Prints the
+wall time, the requests that reached the server and the hit rate of each run.
+
+Usage: python benchmarks/llm_cache.py [--requests N] [--delay SECONDS]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from concurrent_agents import make_input, start_stub_server
+
+import _bootstrap  # noqa: F401
+from sentient.core.agent.agent import Agent
+from sentient.utils.llm_cache import LLMResponseCache
+from sentient.utils.providers import CustomProvider
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--delay", type=float, default=0.3)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CUSTOM_API_KEY", "stub")
+    provider = CustomProvider(start_stub_server(args.delay))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "llm_cache.sqlite")
+        print(f"{args.requests} requests, {args.delay}s per request")
+        for name, read_only in (("cold", False), ("warm", False), ("read only", True)):
+            cache = LLMResponseCache(path, read_only=read_only)
+            agent = Agent(provider=provider, model_name="stub", cache=cache)
+            start = time.perf_counter()
+            for i in range(args.requests):
+                result = await agent.run(make_input(i))
+                assert result.is_complete
+            wall_time = time.perf_counter() - start
+            stats = cache.get_stats()
+            print(
+                f"{name:<10} wall time {wall_time:6.2f}s  requests sent {stats['misses']:>4}  "
+                f"hit rate {stats['hit_rate']:6.1%}  cached {stats['entries']} responses ({stats['bytes']} bytes)"
+            )
+            cache.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""
+End to end timings of the orchestrator loop with the mock provider, against local pages, without any network.
+
+Serves a few local pages (in its own thread), then runs the same objective several times through
+Orchestrator.execute_command with an agent of the mock provider, whose script goes to the first page, scrolls it,
+goes to the second page and completes the objective. The mock answers every LLM call after a fixed latency, so what
+varies between the runs is the orchestrator and the browser: prints the wall time of every run and the median time
+of every phase of the steps (observation, LLM call, actions). Uses the Chrome listening on localhost:9222 (see the
+README), or a browser of its own with --eval-mode.
+
+Usage: python benchmarks/mock_orchestrator.py [--runs N] [--latency SECONDS] [--stream] [--eval-mode]
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+import _bootstrap  # noqa: F401
+from sentient.core.agent.agent import Agent
+from sentient.core.models.models import State
+from sentient.core.orchestrator.orchestrator import Orchestrator
+from sentient.utils.providers import MockProvider
+
+PAGE = """<!doctype html>
+<html><head><title>{title}</title></head>
+<body>
+<h1>{title}</h1>
+<form><input name="q" placeholder="Search"><button type="submit">Search</button></form>
+<ul>{items}</ul>
+</body></html>
+"""
+
+
+def start_pages_server() -> str:
+    """
+    Starts the server of the local pages in a background thread and returns its base url.
+    """
+
+    async def page(request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        items = "".join(
+            f'<li><a href="/{name}/item/{i}">Item {i} of {name}</a> <button>Add</button></li>'
+            for i in range(200)
+        )
+        return web.Response(
+            text=PAGE.format(title=f"Page {name}", items=items),
+            content_type="text/html",
+        )
+
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.add_routes([web.get("/{name}", page)])
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        address["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}"
+
+
+def make_script(base_url: str) -> List[Dict[str, Any]]:
+    """
+    Returns the outputs of the agent for the objective, one per step.
+    """
+    plan = [
+        {"id": 1, "description": "Go to page a", "url": None, "result": None},
+        {"id": 2, "description": "Scroll page a", "url": None, "result": None},
+        {"id": 3, "description": "Go to page b", "url": None, "result": None},
+    ]
+
+    def step(task_id: int, actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "thought": f"Next is task {task_id}",
+            "plan": plan,
+            "next_task": plan[task_id - 1],
+            "next_task_actions": actions,
+            "is_complete": False,
+            "final_response": None,
+        }
+
+    return [
+        step(1, [{"type": "GOTO_URL", "website": f"{base_url}/a", "timeout": 2}]),
+        step(2, [{"type": "SCROLL", "direction": "down"}]),
+        step(3, [{"type": "GOTO_URL", "website": f"{base_url}/b", "timeout": 2}]),
+        {
+            "thought": "All the tasks are done",
+            "plan": plan,
+            "next_task": None,
+            "next_task_actions": None,
+            "is_complete": True,
+            "final_response": "Visited page a and page b",
+        },
+    ]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument(
+        "--stream", action="store_true", help="stream the output and its actions"
+    )
+    parser.add_argument(
+        "--eval-mode", action="store_true", help="launch a browser of its own"
+    )
+    args = parser.parse_args()
+
+    base_url = start_pages_server()
+    provider = MockProvider(
+        make_script(base_url), latency=args.latency, jitter=args.jitter
+    )
+    orchestrator = Orchestrator(
+        state_to_agent_map={
+            State.BASE_AGENT: Agent(provider=provider, model_name="mock")
+        },
+        eval_mode=args.eval_mode,
+        stream_actions=args.stream,
+    )
+    await orchestrator.start()
+
+    wall_times = []
+    phases = defaultdict(list)
+    try:
+        for run in range(args.runs):
+            provider.llm.reset()
+            start = time.perf_counter()
+            final_response = await orchestrator.execute_command(
+                f"Visit page a and page b (run {run})"
+            )
+            wall_times.append(time.perf_counter() - start)
+            if final_response is None:
+                raise SystemExit(f"Run {run} failed, see the logs above")
+            for timings in orchestrator.step_timings:
+                for phase, seconds in timings.items():
+                    phases[phase].append(seconds)
+    finally:
+        await orchestrator.shutdown()
+
+    print(
+        f"{args.runs} runs of {len(orchestrator.step_timings)} steps, "
+        f"LLM latency {args.latency}s, {'streamed' if args.stream else 'not streamed'}"
+    )
+    print(
+        f"run wall time: p50 {statistics.median(wall_times):.2f}s, "
+        f"min {min(wall_times):.2f}s, max {max(wall_times):.2f}s"
+    )
+    print(f"{'phase':<24} {'p50 ms':>8} {'max ms':>8}")
+    for phase, seconds in phases.items():
+        print(
+            f"{phase:<24} {statistics.median(seconds) * 1000:>8.1f} {max(seconds) * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
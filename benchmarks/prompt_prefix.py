@@ -0,0 +1,171 @@
+"""
+Stability of the prompt prefix cached by the providers, against a local stub of the OpenAI API.
+
+Starts an OpenAI compatible stub server (in its own thread) that records the messages of every chat completion and
+reports as cached the prompt tokens shared with an earlier request, in blocks of 128 tokens from 1024 tokens on, as
+the automatic prefix caching of OpenAI does (tokens are approximated as 4 bytes). Then runs several sessions of
+several steps, each step with a new DOM and one more completed task, checks that the system prompt and its
+acknowledgement are byte-identical in every request, and prints the prompt and cached tokens the agent reports for
+every call.
+
+Usage: python benchmarks/prompt_prefix.py [--sessions N] [--steps N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+from aiohttp import web
+from concurrent_agents import AGENT_OUTPUT
+
+import _bootstrap  # noqa: F401
+from sentient.core.agent.agent import Agent
+from sentient.core.models.models import AgentInput, Task
+from sentient.utils.providers import CustomProvider
+
+BYTES_PER_TOKEN = 4
+MIN_CACHED_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def start_stub_server(requests: List[List[Dict[str, Any]]]) -> str:
+    """
+    Starts the stub server in a background thread, appending the messages of every request to `requests`, and
+    returns its base url.
+    """
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        prompt = json.dumps(body["messages"], ensure_ascii=False)
+        shared_bytes = max(
+            (
+                common_prefix_length(prompt, json.dumps(previous, ensure_ascii=False))
+                for previous in requests
+            ),
+            default=0,
+        )
+        requests.append(body["messages"])
+        prompt_tokens = len(prompt.encode("utf-8")) // BYTES_PER_TOKEN
+        cached_tokens = shared_bytes // BYTES_PER_TOKEN
+        cached_tokens = (
+            cached_tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+            if cached_tokens >= MIN_CACHED_TOKENS
+            else 0
+        )
+        return web.json_response(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": "call_stub",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "AgentOutput",
+                                        "arguments": json.dumps(AGENT_OUTPUT),
+                                    },
+                                }
+                            ],
+                        },
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": 10,
+                    "total_tokens": prompt_tokens + 10,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            }
+        )
+
+    ready = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.add_routes([web.post("/v1/chat/completions", chat_completions)])
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        address["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}/v1"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CUSTOM_API_KEY", "stub")
+    requests: List[List[Dict[str, Any]]] = []
+    provider = CustomProvider(start_stub_server(requests))
+
+    print(f"{'session':>7} {'step':>4} {'prompt tokens':>14} {'cached tokens':>14}")
+    total_prompt, total_cached = 0, 0
+    for session in range(args.sessions):
+        # a new agent, as a new session would create
+        agent = Agent(provider=provider, model_name="stub")
+        completed_tasks: List[Task] = []
+        for step in range(args.steps):
+            input_data = AgentInput(
+                objective=f"objective of session {session}",
+                completed_tasks=completed_tasks,
+                current_page_url=f"https://example.com/{step}",
+                current_page_dom=str(
+                    {"role": "WebArea", "step": step, "children": ["link"] * 50}
+                ),
+            )
+            await agent.run(input_data)
+            usage = agent.last_usage
+            total_prompt += usage.prompt_tokens
+            total_cached += usage.cached_tokens
+            print(
+                f"{session:>7} {step:>4} {usage.prompt_tokens:>14} {usage.cached_tokens:>14}"
+            )
+            completed_tasks = completed_tasks + [
+                Task(id=step + 1, description=f"task {step}", result="done")
+            ]
+
+    prefixes = {json.dumps(messages[:2], ensure_ascii=False) for messages in requests}
+    prefix_bytes = len(next(iter(prefixes)).encode("utf-8"))
+    print(
+        f"static prefix: {prefix_bytes} bytes, "
+        f"{'identical' if len(prefixes) == 1 else 'DIFFERENT'} in all {len(requests)} requests"
+    )
+    print(f"cached share of the prompt tokens: {total_cached / total_prompt:.1%}")
+    if len(prefixes) != 1:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,184 @@
+"""
+Micro-benchmark of the accessibility tree pruning.
+
+Compares the single-pass iterative __prune_tree with the previous recursive implementation, kept below as
+legacy_prune_tree, on large synthetic trees, and checks that both give the same output. On random trees, where
+half of the nodes have children, the iterative one is about 10% slower: the price of its explicit stack and of the
+second pass over the nodes with children, for a linear time on wide containers with unraveled children (quadratic
+before) and no recursion limit on deep trees.
+
+Usage: python benchmarks/prune_tree.py [--repeat N]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import _bootstrap  # noqa: F401
+from sentient.utils import get_detailed_accessibility_tree
+
+prune_tree = getattr(get_detailed_accessibility_tree, "__prune_tree")
+should_prune_node = getattr(get_detailed_accessibility_tree, "__should_prune_node")
+
+ROLES = ["generic", "link", "button", "text", "listitem", "separator", "heading"]
+
+
+def legacy_prune_tree(
+    node: Dict[str, Any], only_input_fields: bool
+) -> Optional[Dict[str, Any]]:
+    if "marked_for_deletion_by_mm" in node:
+        return None
+
+    if "children" in node:
+        i = 0
+        while i < len(node["children"]):
+            child = node["children"][i]
+            if "marked_for_unravel_children" in child:
+                if "children" in child:
+                    node["children"] = (
+                        node["children"][:i]
+                        + child["children"]
+                        + node["children"][i + 1 :]
+                    )
+                    i += len(child["children"]) - 1
+                else:
+                    node["children"].pop(i)
+                    i -= 1
+            else:
+                pruned_child = legacy_prune_tree(child, only_input_fields)
+                if pruned_child is None:
+                    node["children"].pop(i)
+                    i -= 1
+                else:
+                    node["children"][i] = pruned_child
+            i += 1
+
+        if not node["children"]:
+            del node["children"]
+
+    return None if should_prune_node(node, only_input_fields) else node
+
+
+def random_node(rng: random.Random, mmid: int) -> Dict[str, Any]:
+    node: Dict[str, Any] = {"role": rng.choice(ROLES), "name": f"node {mmid}"}
+    draw = rng.random()
+    if draw < 0.3:
+        node.update({"mmid": str(mmid), "tag": rng.choice(["a", "button", "input"])})
+    elif draw < 0.35:
+        node["marked_for_deletion_by_mm"] = True
+    elif draw < 0.5:
+        node["marked_for_unravel_children"] = True
+    return node
+
+
+def random_tree(rng: random.Random, node_count: int) -> Dict[str, Any]:
+    root: Dict[str, Any] = {"role": "WebArea", "name": "root", "children": []}
+    nodes = [root]
+    for mmid in range(1, node_count):
+        parent = rng.choice(nodes)
+        node = random_node(rng, mmid)
+        parent.setdefault("children", []).append(node)
+        nodes.append(node)
+    return root
+
+
+def wide_tree(rng: random.Random, list_count: int, list_width: int) -> Dict[str, Any]:
+    """Lists of `list_width` items where every other item is a wrapper to unravel."""
+    root: Dict[str, Any] = {"role": "WebArea", "name": "root", "children": []}
+    mmid = 0
+    for _ in range(list_count):
+        items = []
+        for index in range(list_width):
+            mmid += 1
+            item = {"role": "listitem", "name": f"item {mmid}", "mmid": str(mmid)}
+            if index % 2:
+                item = {
+                    "role": "generic",
+                    "marked_for_unravel_children": True,
+                    "children": [item],
+                }
+            items.append(item)
+        root["children"].append({"role": "list", "name": "list", "children": items})
+    return root
+
+
+def deep_tree(depth: int) -> Dict[str, Any]:
+    root: Dict[str, Any] = {"role": "WebArea", "name": "root"}
+    node = root
+    for mmid in range(1, depth):
+        child = {"role": "generic", "name": f"wrapper {mmid}", "mmid": str(mmid)}
+        node["children"] = [child]
+        node = child
+    return root
+
+
+def copy_tree(tree: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep copy without recursion, so that deep trees can be copied."""
+    root = dict(tree)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if "children" in node:
+            node["children"] = [dict(child) for child in node["children"]]
+            stack.extend(node["children"])
+    return root
+
+
+def count_nodes(tree: Dict[str, Any]) -> int:
+    count, stack = 0, [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get("children", []))
+    return count
+
+
+def time_prune(function, tree: Dict[str, Any], repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        tree_copy = copy_tree(tree)
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        try:
+            result = function(tree_copy, False)
+        except RecursionError:
+            return None, "RecursionError"
+        finally:
+            gc.enable()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cases = {
+        "random, 100k nodes": random_tree(rng, 100_000),
+        "20 lists of 5k items": wide_tree(rng, 20, 5_000),
+        "chain of 5k nodes": deep_tree(5_000),
+    }
+    print(f"{'tree':<24}{'nodes':>9}{'recursive':>14}{'iterative':>14}{'speedup':>10}")
+    for name, tree in cases.items():
+        sys.setrecursionlimit(1_000)
+        legacy_time, legacy_result = time_prune(legacy_prune_tree, tree, args.repeat)
+        new_time, new_result = time_prune(prune_tree, tree, args.repeat)
+        if legacy_time is not None:
+            assert legacy_result == new_result, f"Different output for {name}"
+            speedup = f"{legacy_time / new_time:.1f}x"
+            legacy_column = f"{legacy_time * 1000:.1f} ms"
+        else:
+            speedup, legacy_column = "-", legacy_result
+        print(
+            f"{name:<24}{count_nodes(tree):>9}{legacy_column:>14}{new_time * 1000:>11.1f} ms{speedup:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
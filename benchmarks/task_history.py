@@ -0,0 +1,102 @@
+"""
+Prompt growth with and without the compaction of the completed tasks.
+
+Simulates a long run whose tasks carry long skill results (outer HTML, DOM changes), and prints, for some of the
+steps, the tokens the completed tasks take in the input of the agent when they are all sent as they are and when
+they go through the TaskHistoryManager of the orchestrator.
+
+Usage: python benchmarks/task_history.py [--steps N] [--keep-last K] [--budget TOKENS]
+"""
+
+import argparse
+import random
+
+import _bootstrap  # noqa: F401
+from sentient.core.memory.history import TaskHistoryManager
+from sentient.core.models.models import AgentInput, Task
+from sentient.utils.dom_serializer import count_tokens
+
+RESULTS = [
+    "Success. Clicked element with selector [mmid='{mmid}']. Outer HTML of the clicked element: {html}. "
+    "As a consequence of this action, new elements have appeared in view: {changes}.",
+    "Success. Text \"{text}\" set successfully in the element with selector [mmid='{mmid}'] and pressed Enter.",
+    "Navigated to {url}, the page title is {text}.",
+]
+
+
+def make_task(task_id: int, rng: random.Random) -> Task:
+    html = "".join(
+        f'<div class="c{rng.randint(0, 999)}"><a href="/item/{rng.randint(0, 99999)}">Item {i}</a></div>'
+        for i in range(rng.randint(5, 40))
+    )
+    changes = ", ".join(
+        f"[{rng.randint(100, 999)}] button 'Option {i}'"
+        for i in range(rng.randint(0, 30))
+    )
+    result = rng.choice(RESULTS).format(
+        mmid=rng.randint(1, 999),
+        html=html,
+        changes=changes,
+        text=f"query {task_id}",
+        url=f"https://example.com/page/{task_id}",
+    )
+    return Task(
+        id=task_id,
+        description=f"Step {task_id}: open the next result and check its details",
+        url=f"https://example.com/page/{task_id}",
+        result=result,
+    )
+
+
+def prompt_tokens(input_data: AgentInput) -> int:
+    # what BaseAgent.run sends besides the DOM and the URL
+    return count_tokens(
+        input_data.model_dump_json(exclude={"current_page_dom", "current_page_url"})
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, default=80)
+    parser.add_argument("--keep-last", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=2500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    manager = TaskHistoryManager(
+        keep_last=args.keep_last, max_history_tokens=args.budget
+    )
+    completed_tasks = []
+    reported_steps = {1, 2, 5, 10, 20, 40, args.steps} | set(
+        range(0, args.steps + 1, 20)
+    )
+    print(
+        f"{'step':>5} {'all tasks':>10} {'compacted':>10} {'summarized':>11} {'left out':>9}"
+    )
+    for step in range(1, args.steps + 1):
+        objective = "Find the cheapest flight from Helsinki to Stockholm"
+        full = AgentInput(
+            objective=objective,
+            completed_tasks=completed_tasks,
+            current_page_url="",
+            current_page_dom="",
+        )
+        history = manager.compact(completed_tasks)
+        compacted = AgentInput(
+            objective=objective,
+            completed_tasks=history.tasks,
+            completed_tasks_summary=history.summary,
+            current_page_url="",
+            current_page_dom="",
+        )
+        if step in reported_steps:
+            summarized = len(history.summary.splitlines()) if history.summary else 0
+            print(
+                f"{step:>5} {prompt_tokens(full):>10} {prompt_tokens(compacted):>10} "
+                f"{summarized:>11} {history.omitted:>9}"
+            )
+        completed_tasks.append(make_task(step, rng))
+
+
+if __name__ == "__main__":
+    main()
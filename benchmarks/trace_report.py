@@ -0,0 +1,42 @@
+"""
+Summary of the traces written with SENTIENT_TRACE=1.
+
+Prints, for every phase (span name) of all the runs traced in a folder, how many times it ran, the p50, p95 and mean
+of its duration, and the mean of its sizes and token counts.
+
+Usage: python benchmarks/trace_report.py [DIRECTORY] [--json]
+"""
+
+import argparse
+import json
+
+import _bootstrap  # noqa: F401
+from sentient.utils.tracing import format_trace_summary, summarize_traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=None,
+        help="The folder of the trace files, defaults to SENTIENT_TRACE_DIR or log_files/traces",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the summary as JSON instead of a table",
+    )
+    args = parser.parse_args()
+
+    summary = summarize_traces(args.directory)
+    if not summary:
+        print("No spans found")
+    elif args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(format_trace_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,30 @@
+import asyncio
+from typing import Any, List
+
 from sentient.core.orchestrator.orchestrator import Orchestrator
+from sentient.core.web_driver.context_pool import BrowserContextPool
 from sentient.core.agent.agent import Agent
+from sentient.core.agent.router import ModelRouter
 from sentient.core.models.models import State
 from sentient.core.memory import ltm
+from sentient.utils.logger import logger
 from sentient.utils.providers import get_provider
 
 class Sentient:
     def __init__(self):
         self.orchestrator = None
     
-    def _create_state_to_agent_map(self, provider: str, model: str, custom_base_url: str = None):
+    def _create_state_to_agent_map(self, provider: str, model: str, custom_base_url: str = None, fast_model: str = None):
         provider_instance = get_provider(provider, custom_base_url)
+        # with a fast model, the steps go to it unless they need `model`, see ModelRouter
+        router = ModelRouter(fast_model=fast_model, strong_model=model) if fast_model else None
         return {
-            State.BASE_AGENT: Agent(provider=provider_instance, model_name=model),
+            State.BASE_AGENT: Agent(provider=provider_instance, model_name=model, router=router),
         }
 
-    async def _initialize(self, provider: str, model: str, custom_base_url: str = None):
+    async def _initialize(self, provider: str, model: str, custom_base_url: str = None, fast_model: str = None):
         if not self.orchestrator:
-            state_to_agent_map = self._create_state_to_agent_map(provider, model, custom_base_url)
+            state_to_agent_map = self._create_state_to_agent_map(provider, model, custom_base_url, fast_model)
             self.orchestrator = Orchestrator(state_to_agent_map=state_to_agent_map)
             await self.orchestrator.start()
 
@@ -26,14 +34,59 @@ class Sentient:
             provider: str = "openai", 
             model: str = "gpt-4o-2024-08-06", 
             task_instructions: str = None, 
-            custom_base_url: str = None
+            custom_base_url: str = None,
+            return_usage: bool = False,
+            fast_model: str = None
             ):
+        """
+        Runs a goal and returns the final response of the agent, or, with `return_usage`, the final response and the
+        LLMUsage of the run (tokens, latency, retries of the LLM calls), e.g. to compare providers on the same goal.
+        With a `fast_model` of the same provider, the steps go to it and are escalated to `model` when they need it.
+        """
         if task_instructions:
             ltm.set_task_instructions(task_instructions)
-        await self._initialize(provider, model, custom_base_url)
+        await self._initialize(provider, model, custom_base_url, fast_model)
         result = await self.orchestrator.execute_command(goal)
+        if return_usage:
+            return result, self.orchestrator.memory.usage
         return result
 
+    async def invoke_many(
+            self,
+            goals: List[str],
+            provider: str = "openai",
+            model: str = "gpt-4o-2024-08-06",
+            task_instructions: str = None,
+            custom_base_url: str = None,
+            pool_size: int = 4,
+            fast_model: str = None,
+            ) -> List[Any]:
+        """
+        Runs several goals concurrently, each with its own orchestrator (and memory) in its own browser context.
+        At most `pool_size` goals run at the same time.
+
+        Returns:
+            List[Any]: The final response of every goal, in the order of the goals. None for a goal that failed.
+        """
+        if task_instructions:
+            ltm.set_task_instructions(task_instructions)
+        pool = BrowserContextPool(size=pool_size)
+
+        async def run(goal: str):
+            async with pool.session():
+                state_to_agent_map = self._create_state_to_agent_map(provider, model, custom_base_url, fast_model)
+                orchestrator = Orchestrator(state_to_agent_map=state_to_agent_map)
+                return await orchestrator.execute_command(goal)
+
+        try:
+            results = await asyncio.gather(*(run(goal) for goal in goals), return_exceptions=True)
+        finally:
+            await pool.close()
+        for goal, result in zip(goals, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Error executing the goal {goal}: {result}")
+        return [None if isinstance(result, BaseException) else result for result in results]
+
     async def shutdown(self):
         if self.orchestrator:
             await self.orchestrator.shutdown()
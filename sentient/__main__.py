@@ -1,4 +1,6 @@
+import argparse
 import asyncio
+import sys
 
 from sentient.core.agent.agent import Agent
 from sentient.core.models.models import State
@@ -15,5 +17,51 @@ async def main():
     await orchestrator.start()
 
 
+def serve_main(args):
+    parser = argparse.ArgumentParser(
+        prog="python -m sentient serve",
+        description="Keeps a browser warm and runs the goals it receives over a local HTTP/WebSocket API.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--provider", default="openai")
+    parser.add_argument("--model", default="gpt-4o-2024-08-06")
+    parser.add_argument("--custom-base-url", default=None)
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=4,
+        help="The number of goals running at the same time",
+    )
+    parser.add_argument(
+        "--skip-homepage",
+        action="store_true",
+        help="Start every goal on a blank page instead of the homepage",
+    )
+    parser.add_argument(
+        "--eval-mode",
+        action="store_true",
+        help="Launch a new Chrome instead of connecting to the one listening on localhost:9222",
+    )
+    options = parser.parse_args(args)
+
+    # imported here, so that running the agent does not import the server
+    from sentient.core.server.server import serve
+
+    serve(
+        host=options.host,
+        port=options.port,
+        provider=options.provider,
+        model=options.model,
+        custom_base_url=options.custom_base_url,
+        pool_size=options.pool_size,
+        go_to_homepage=not options.skip_homepage,
+        eval_mode=options.eval_mode,
+    )
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:2] == ["serve"]:
+        serve_main(sys.argv[2:])
+    else:
+        asyncio.run(main())
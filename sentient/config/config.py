@@ -1,5 +1,6 @@
 # config.py at the project source code root
 import os
+from typing import Any, Dict, Optional, Sequence
 
 # Get the absolute path of the current file (config.py)
 CURRENT_FILE_PATH = os.path.abspath(__file__)
@@ -27,3 +28,116 @@ if not os.path.exists(TASK_INSTRUCTION_PATH):
 if not os.path.exists(PROJECT_TEMP_PATH):
     os.makedirs(PROJECT_TEMP_PATH)
     print(f"Created temp folder at: {PROJECT_TEMP_PATH}")
+
+
+# The options of the modules configured from the environment (tracing, debug artifacts, LLM cache, HTTP clients...)
+# are read with the helpers below when the module is imported, so that a malformed value fails right away, naming the
+# variable, instead of silently falling back to the default
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+
+def __get_env(name: str) -> Optional[str]:
+    # an empty variable counts as unset, e.g. VAR= in a .env file
+    value = os.environ.get(name, "").strip()
+    return value or None
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the value of an environment variable, or the default if it is unset or empty.
+    """
+    value = __get_env(name)
+    return default if value is None else value
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    """
+    Returns the flag set by an environment variable, one of TRUE_VALUES or FALSE_VALUES, or the default if it is
+    unset or empty.
+
+    Raises:
+        ValueError: If the variable is set to anything else.
+    """
+    value = __get_env(name)
+    if value is None:
+        return default
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValueError(
+        f"{name} must be one of {TRUE_VALUES + FALSE_VALUES}, not {value!r}"
+    )
+
+
+def env_int(name: str, default: int) -> int:
+    """
+    Returns the integer set by an environment variable, or the default if it is unset or empty.
+
+    Raises:
+        ValueError: If the variable is not an integer.
+    """
+    value = __get_env(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, not {value!r}") from None
+
+
+def env_float(name: str, default: float) -> float:
+    """
+    Returns the number set by an environment variable, or the default if it is unset or empty.
+
+    Raises:
+        ValueError: If the variable is not a number.
+    """
+    value = __get_env(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, not {value!r}") from None
+
+
+def env_choice(
+    name: str,
+    choices: Sequence[str],
+    default: str,
+    aliases: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Returns the mode set by an environment variable, one of `choices` (case insensitive), or the default if it is
+    unset or empty.
+
+    Args:
+        name (str): The variable.
+        choices (Sequence[str]): The modes.
+        default (str): The mode when the variable is unset.
+        aliases (Optional[Dict[str, str]], optional): Other values accepted for the modes, e.g. {"1": "on"}.
+            Defaults to None.
+
+    Raises:
+        ValueError: If the variable is set to anything else.
+    """
+    value = __get_env(name)
+    if value is None:
+        return default
+    value = value.lower()
+    value = (aliases or {}).get(value, value)
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {tuple(choices)}, not {value!r}")
+    return value
+
+
+def override_config(config: Dict[str, Any], **values: Any):
+    """
+    Overrides the options of a module read from the environment with the arguments of its configure_* function,
+    leaving the options whose argument is None unchanged.
+    """
+    for key, value in values.items():
+        if value is not None:
+            config[key] = value
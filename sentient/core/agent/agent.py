@@ -1,15 +1,18 @@
 from datetime import datetime
 from string import Template
+from typing import Optional
 
 from sentient.core.agent.base import BaseAgent
+from sentient.core.agent.router import ModelRouter
 from sentient.core.memory import ltm
-from sentient.core.models.models import AgentInput, AgentOutput
+from sentient.core.models.models import AgentInput, AgentOutput, StreamingAgentOutput
 from sentient.core.prompts.prompts import LLM_PROMPTS
+from sentient.utils.llm_cache import LLMResponseCache
 from sentient.utils.providers import LLMProvider
 
 
 class Agent(BaseAgent):
-    def __init__(self, provider:LLMProvider, model_name: str):
+    def __init__(self, provider:LLMProvider, model_name: str, cache: Optional[LLMResponseCache] = None, router: Optional[ModelRouter] = None):
         self.name = "sentient"
         self.ltm = None
         self.ltm = self.__get_ltm()
@@ -19,9 +22,12 @@ class Agent(BaseAgent):
             system_prompt=self.system_prompt,
             input_format=AgentInput,
             output_format=AgentOutput,
+            stream_output_format=StreamingAgentOutput,
             keep_message_history=False,
             provider=provider,
             model_name=model_name,
+            cache=cache,
+            router=router,
         )
 
     @staticmethod
@@ -38,11 +44,11 @@ class Agent(BaseAgent):
         # Use safe_substitute to avoid KeyError
         system_prompt = Template(system_prompt).safe_substitute(substitutions)
 
-        # Add today's day & date to the system prompt
+        return system_prompt
+
+    def _get_run_context(self):
+        # today's day & date, sent with the page rather than in the system prompt, which then stays the same every day
         today = datetime.now()
         today_date = today.strftime("%d/%m/%Y")
         weekday = today.strftime("%A")
-        system_prompt += f"\nToday's date is: {today_date}"
-        system_prompt += f"\nCurrent weekday is: {weekday}"
-
-        return system_prompt
+        return f"Today's date is: {today_date}\nCurrent weekday is: {weekday}"
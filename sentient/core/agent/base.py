@@ -1,21 +1,35 @@
+import asyncio
+import functools
 import json
-from typing import Callable, List, Optional, Tuple, Type
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
 
 import instructor
 import instructor.patch
 import openai
 from instructor import Mode
+from instructor.dsl.partial import PartialBase
 from instructor.exceptions import InstructorRetryException
-from pydantic import BaseModel
-from groq import Groq
-from anthropic import Anthropic
-from litellm import completion
+from instructor.process_response import handle_response_model
+from jiter import from_json
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from groq import AsyncGroq
+from anthropic import AsyncAnthropic
+from litellm import acompletion
+from tenacity import AsyncRetrying, stop_after_attempt
 
+from sentient.core.agent.router import ModelRouter
+from sentient.core.models.models import Action, LLMCallUsage
 from sentient.utils.function_utils import get_function_schema
+from sentient.utils.llm_cache import LLMResponseCache, get_llm_cache
 from sentient.utils.logger import logger
+from sentient.utils.mock_llm import record_transcript
 from sentient.utils.providers import LLMProvider
+from sentient.utils.tracing import json_size, record_span, trace_span, tracing_enabled
 
 class BaseAgent:
+    _action_adapter = TypeAdapter(Action)
+
     def __init__(
         self,
         name: str,
@@ -26,6 +40,9 @@ class BaseAgent:
         keep_message_history: bool = True,
         provider: LLMProvider = None,
         model_name: str = None,
+        stream_output_format: Optional[Type[BaseModel]] = None,
+        cache: Optional[LLMResponseCache] = None,
+        router: Optional[ModelRouter] = None,
     ):
         # Metdata
         self.agent_name = name
@@ -39,6 +56,8 @@ class BaseAgent:
         # Input-output format
         self.input_format = input_format
         self.output_format = output_format
+        # the schema requested when the actions are streamed (see run), the output is still parsed as output_format
+        self.stream_output_format = stream_output_format or output_format
 
         # Llm client
         self.provider_name = provider.get_provider_name()
@@ -51,23 +70,43 @@ class BaseAgent:
         #             model_name=model_name, 
         #         )
         #     )
+        # the async clients, so that the event loop (other sessions, the page callbacks, the server) keeps running
+        # while a request is in flight
+        # the clients share the HTTP connections of their provider with the other agents of the process, litellm
+        # keeps its own
+        # the usage of the last completion, as reported by the provider (see _keep_usage)
+        self._completion_usage = None
         if self.provider_name == "groq":
-            self.client = Groq(**client_config)
+            self.client = AsyncGroq(**client_config, http_client=self.provider.get_http_client())
+            self.client.chat.completions.create = self._keep_usage(self.client.chat.completions.create)
             self.client = instructor.from_groq(self.client, mode=Mode.TOOLS)
         elif self.provider_name == "anthropic":
-            self.client = instructor.from_anthropic(Anthropic())
+            self.client = AsyncAnthropic(http_client=self.provider.get_http_client())
+            self.client.messages.create = self._keep_usage(self.client.messages.create)
+            self.client = instructor.from_anthropic(self.client)
         elif self.provider_name == "openrouter": 
             # use litellm for openrouter as instructor currently does not seem to have support for openrouter
-            self.client = instructor.from_litellm(completion=completion)
+            self.client = instructor.from_litellm(completion=self._keep_usage(acompletion))
         elif self.provider_name == "together":
-            self.client = openai.Client(**client_config)
+            self.client = openai.AsyncClient(**client_config, http_client=self.provider.get_http_client())
+            self.client.chat.completions.create = self._keep_usage(self.client.chat.completions.create)
             self.client = instructor.from_openai(self.client, mode=Mode.JSON)
         else:
-            self.client = openai.Client(**client_config)
+            self.client = openai.AsyncClient(**client_config, http_client=self.provider.get_http_client())
+            self.client.chat.completions.create = self._keep_usage(self.client.chat.completions.create)
             self.client = instructor.from_openai(self.client, mode=Mode.TOOLS)
         
         # Set model name
         self.model_name = model_name
+        # the tokens, latency and retries of the last call of run
+        self.last_usage: Optional[LLMCallUsage] = None
+
+        # the responses of identical requests are replayed from this cache, by default the one configured for the
+        # process (see sentient.utils.llm_cache), which is off unless enabled
+        self.cache = cache
+
+        # the steps go to the fast or the strong model of the router instead of model_name, see ModelRouter
+        self.router = router
 
         # Tools
         self.tools_list = []
@@ -89,10 +128,248 @@ class BaseAgent:
                 }
             )
 
+    def _get_run_context(self) -> Optional[str]:
+        """
+        Returns the context of the run that is not part of the input and changes between runs (e.g. the date), sent
+        after the input so that the system prompt and the messages after it stay byte-identical across steps and
+        sessions, which is what the prompt caching of the providers reuses. None by default.
+        """
+        return None
+
+    def _get_request_messages(self) -> List[dict]:
+        """
+        Returns the messages as sent to the provider. For Anthropic, the end of the static prefix (the system prompt
+        and its acknowledgement) is marked with a cache_control block, so that it is read from the prompt cache
+        instead of being processed again. OpenAI caches the longest prefix seen recently on its own.
+        """
+        if self.provider_name != "anthropic" or not self.system_prompt:
+            return self.messages
+        messages = list(self.messages)
+        prefix_end = messages[1]
+        messages[1] = {
+            **prefix_end,
+            "content": [
+                {
+                    "type": "text",
+                    "text": prefix_end["content"],
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        }
+        return messages
+
+    def _keep_usage(self, create: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """
+        Wraps the create function of a provider's client to keep the usage of the last completion, since instructor
+        replaces the usage of the response with its own total of the attempts, without the cached tokens.
+        """
+
+        @functools.wraps(create)
+        async def create_and_keep_usage(*args, **kwargs):
+            completion = await create(*args, **kwargs)
+            # a stream has no usage
+            self._completion_usage = getattr(completion, "usage", None)
+            return completion
+
+        return create_and_keep_usage
+
+    def _get_usage(self, response) -> Optional[Dict[str, int]]:
+        """
+        Returns the token usage of the completion a response was parsed from: the prompt tokens, in total, the
+        completion tokens, and how many of the prompt tokens were read from the prompt cache of the provider and
+        written to it. None if the provider did not report it.
+        """
+        # the total of the attempts, counted by instructor
+        usage = getattr(getattr(response, "_raw_response", None), "usage", None)
+        if usage is None:
+            return None
+        # the cached tokens are only in the usage of the last attempt
+        completion_usage = self._completion_usage or usage
+        if self.provider_name == "anthropic":
+            # the input tokens of Anthropic do not count the tokens read from and written to the cache
+            cached_tokens = getattr(completion_usage, "cache_read_input_tokens", None) or 0
+            cache_write_tokens = getattr(completion_usage, "cache_creation_input_tokens", None) or 0
+            return {
+                "prompt_tokens": (usage.input_tokens or 0) + cached_tokens + cache_write_tokens,
+                "completion_tokens": usage.output_tokens or 0,
+                "cached_tokens": cached_tokens,
+                "cache_write_tokens": cache_write_tokens,
+            }
+        details = getattr(completion_usage, "prompt_tokens_details", None)
+        return {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+            "cache_write_tokens": 0,
+        }
+
+    def _traced_retrying(self, max_retries: int) -> AsyncRetrying:
+        """
+        Returns the retry policy of instructor for `max_retries` attempts, which records every failed attempt
+        (e.g. a response that did not validate against the output format) as an llm.retry span and in last_usage.
+        """
+        attempt_start = time.monotonic()
+
+        def trace_failed_attempt(retry_state):
+            nonlocal attempt_start
+            exception = retry_state.outcome.exception()
+            validation = type(exception).__name__ in ("ValidationError", "JSONDecodeError")
+            self.last_usage.retries += 1
+            self.last_usage.validation_failures += 1 if validation else 0
+            record_span(
+                "llm.retry",
+                retry_state.outcome_timestamp - attempt_start,
+                error=f"{type(exception).__name__}: {str(exception)[:500]}",
+                attempt=retry_state.attempt_number,
+                validation=validation,
+            )
+            attempt_start = retry_state.outcome_timestamp
+
+        return AsyncRetrying(stop=stop_after_attempt(max_retries), after=trace_failed_attempt)
+
+    def _trace_response(self, span, response):
+        if response is None:
+            return
+        usage = self._get_usage(response)
+        if usage is not None:
+            for key, value in usage.items():
+                setattr(self.last_usage, key, value)
+            logger.debug(
+                f"{self.model_name}: {usage['prompt_tokens']} prompt tokens ({usage['cached_tokens']} cached), "
+                f"{usage['completion_tokens']} completion tokens"
+            )
+        if not tracing_enabled():
+            return
+        span.set(response_bytes=json_size(response.model_dump_json()))
+        if usage is not None:
+            span.set(**usage)
+
+    def _get_cache_key(self, cache: LLMResponseCache) -> str:
+        return cache.make_key(
+            self.provider_name,
+            self.model_name,
+            self.messages,
+            self.output_format.model_json_schema(),
+        )
+
+    async def _get_cached_response(self, cache: LLMResponseCache, key: str) -> Optional[BaseModel]:
+        with trace_span("llm.cache", provider=self.provider_name, model=self.model_name) as span:
+            # SQLite blocks, the other agents keep running meanwhile
+            value = await asyncio.to_thread(cache.get, key)
+            span.set(hit=value is not None)
+        if value is None:
+            return None
+        try:
+            response = self.output_format.model_validate_json(value)
+        except ValidationError as e:
+            # e.g. cached before the output format changed
+            logger.warning(f"Ignoring a cached response that is not valid: {e}")
+            return None
+        logger.debug(f"Replaying the cached response {key[:12]} of {self.model_name}")
+        return response
+
+    async def _run_streaming(
+        self, on_action: Callable[[Action], Awaitable[Any]]
+    ) -> BaseModel:
+        """
+        Streams the output, requested as stream_output_format, and calls `on_action` with every action of
+        next_task_actions as soon as it is completely written and valid, while the model is still writing the rest.
+        The whole output is validated once the stream ends.
+
+        Raises:
+            pydantic.ValidationError: If the whole output is not valid. The actions already passed to `on_action`
+                are not taken back, the caller decides what to do with them.
+        """
+        with trace_span("llm.request", provider=self.provider_name, model=self.model_name, messages=len(self.messages), stream=True) as span:
+            if tracing_enabled():
+                span.set(prompt_bytes=json_size(self.messages))
+            request = self.client.handle_kwargs(
+                {
+                    "model": self.model_name,
+                    "messages": self._get_request_messages(),
+                    "max_tokens": 1000 if self.provider_name == "anthropic" else None,
+                }
+            )
+            # the request instructor would send for the output format, e.g. with its schema as a tool
+            _, request = handle_response_model(
+                self.stream_output_format, mode=self.client.mode, **request
+            )
+            request_start = time.perf_counter()
+            stream = await self.client.create_fn(response_model=None, stream=True, **request)
+
+            start = time.monotonic()
+            text = ""
+            dispatched = 0
+            async for chunk in PartialBase.extract_json_async(stream, self.client.mode):
+                if self.last_usage.time_to_first_token is None:
+                    self.last_usage.time_to_first_token = time.perf_counter() - request_start
+                text += chunk
+                previously_dispatched = dispatched
+                dispatched = await self._dispatch_written_actions(text, dispatched, on_action, stream_ended=False)
+                if dispatched and not previously_dispatched:
+                    span.set(first_action_ms=round((time.monotonic() - start) * 1000, 1))
+            dispatched = await self._dispatch_written_actions(text, dispatched, on_action, stream_ended=True)
+            span.set(response_bytes=len(text.encode("utf-8")), streamed_actions=dispatched)
+            return self.output_format.model_validate_json(text)
+
+    async def _dispatch_written_actions(
+        self,
+        text: str,
+        dispatched: int,
+        on_action: Callable[[Action], Awaitable[Any]],
+        stream_ended: bool,
+    ) -> int:
+        """
+        Passes the actions of the output written so far that are complete and were not passed yet to `on_action`.
+        An action is complete once the next one is started, once a field after next_task_actions is started, or
+        once the stream ended.
+
+        Returns:
+            int: The number of actions passed to `on_action` so far.
+        """
+        try:
+            output = from_json(text.encode("utf-8"), partial_mode="on")
+        except ValueError:
+            return dispatched
+        if not isinstance(output, dict) or not isinstance(output.get("next_task_actions"), list):
+            return dispatched
+        actions = output["next_task_actions"]
+        written = len(actions)
+        if not stream_ended and list(output)[-1] == "next_task_actions":
+            # the last action may still be written
+            written -= 1
+        while dispatched < written:
+            try:
+                action = self._action_adapter.validate_python(actions[dispatched])
+            except ValidationError as e:
+                # the actions after an invalid one are not started, the whole output will not validate either
+                logger.warning(f"Streamed action {dispatched} is not valid: {e}")
+                return dispatched
+            await on_action(action)
+            dispatched += 1
+        return dispatched
+
     # @traceable(run_type="chain", name="agent_run")
     async def run(
-        self, input_data: BaseModel, screenshot: str = None
+        self,
+        input_data: BaseModel,
+        screenshot: str = None,
+        on_action: Optional[Callable[[Action], Awaitable[Any]]] = None,
     ) -> BaseModel:
+        """
+        Asks the model for the output of the agent given the input.
+
+        Args:
+            input_data (BaseModel): The input, of the input format of the agent.
+            screenshot (str, optional): A screenshot of the page, as a data url. Defaults to None.
+            on_action (Optional[Callable[[Action], Awaitable[Any]]], optional): If set, the output is streamed and
+                every action is passed to it as soon as it is written, before the rest of the output (see
+                _run_streaming). The output is not retried when it is invalid, since its actions may already have
+                run. The actions of a cached output are passed to it before it is returned. Defaults to None.
+
+        Returns:
+            BaseModel: The output, of the output format of the agent.
+        """
         if not isinstance(input_data, self.input_format):
             raise ValueError(f"Input data must be of type {self.input_format.__name__}")
 
@@ -132,16 +409,116 @@ class BaseAgent:
                 }
             )
         
+        # what changes from one day or session to the next is sent last, after the prefix cached by the providers
+        run_context = self._get_run_context()
         # input dom and current page url in a separate message so that the LLM can pay attention to completed tasks better. *based on personal vibe check*
         if hasattr(input_data, "current_page_dom") and hasattr(
             input_data, "current_page_url"
         ):
-            self.messages.append(
-                {
-                    "role": "user",
-                    "content": f"Current page URL:\n{input_data.current_page_url}\n\n Current page DOM:\n{input_data.current_page_dom}",
-                }
+            content = f"Current page URL:\n{input_data.current_page_url}\n\n Current page DOM:\n{input_data.current_page_dom}"
+            if run_context:
+                content = f"{run_context}\n\n{content}"
+            self.messages.append({"role": "user", "content": content})
+        elif run_context:
+            self.messages.append({"role": "user", "content": run_context})
+
+        self.last_usage = LLMCallUsage(provider=self.provider_name, model=self.model_name)
+        start = time.perf_counter()
+        try:
+            if self.router is not None:
+                response = await self._complete_routed(input_data, on_action)
+            else:
+                response = await self._complete(on_action)
+            if not self.last_usage.cached_response:
+                # replayed by the mock provider, see sentient.utils.mock_llm
+                record_transcript(self.messages, response, self.last_usage.model)
+            return response
+        except Exception as e:
+            self.last_usage.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.last_usage.latency = time.perf_counter() - start
+
+    async def _complete_routed(
+        self,
+        input_data: BaseModel,
+        on_action: Optional[Callable[[Action], Awaitable[Any]]] = None,
+    ) -> BaseModel:
+        """
+        Completes with the model the router chooses for the input, and redoes the output of its fast model with its
+        strong model when the router escalates it, unless some of its actions already ran (streamed), see
+        ModelRouter. last_usage adds up the calls of the step.
+        """
+        decision = self.router.choose(input_data)
+        dispatched = 0
+
+        async def count_dispatched_actions(action: Action):
+            nonlocal dispatched
+            dispatched += 1
+            await on_action(action)
+
+        model_name = self.model_name
+        try:
+            self.model_name = self.last_usage.model = decision.model
+            start = time.perf_counter()
+            response, error = None, None
+            try:
+                response = await self._complete(count_dispatched_actions if on_action is not None else None)
+            except Exception as e:
+                error = e
+            self.last_usage.latency = time.perf_counter() - start
+
+            reason, redo = self.router.review(decision, response, error, self.last_usage)
+            if reason is None or not redo or dispatched:
+                if reason is not None:
+                    self.router.escalate(decision, reason, redone=False)
+                self.router.record(decision, self.last_usage)
+                if error is not None:
+                    raise error
+                return response
+
+            self.router.escalate(decision, reason, redone=True)
+            first_usage = self.last_usage
+            self.last_usage = LLMCallUsage(
+                provider=self.provider_name, model=decision.model, escalated_from=first_usage.model
             )
+            self.model_name = decision.model
+            start = time.perf_counter()
+            try:
+                return await self._complete(on_action)
+            finally:
+                self.last_usage.latency = time.perf_counter() - start
+                self.router.record(decision, first_usage, self.last_usage)
+                # the usage of the step adds up the call of the fast model
+                for key in ("prompt_tokens", "completion_tokens", "retries", "validation_failures"):
+                    setattr(self.last_usage, key, getattr(self.last_usage, key) + getattr(first_usage, key))
+        finally:
+            self.model_name = model_name
+
+    async def _complete(
+        self, on_action: Optional[Callable[[Action], Awaitable[Any]]] = None
+    ) -> BaseModel:
+        """
+        Returns the output for the messages, from the LLM response cache or from the model, see run.
+        """
+        cache = self.cache or get_llm_cache()
+        cache_key = None
+        # the requests with tools are not cached, their responses depend on what the tools return
+        if cache is not None and len(self.tools_list) == 0:
+            cache_key = self._get_cache_key(cache)
+            response = await self._get_cached_response(cache, cache_key)
+            if response is not None:
+                self.last_usage.cached_response = True
+                if on_action is not None:
+                    for action in getattr(response, "next_task_actions", None) or []:
+                        await on_action(action)
+                return response
+
+        if on_action is not None:
+            response = await self._run_streaming(on_action)
+            if cache_key is not None:
+                await asyncio.to_thread(cache.put, cache_key, response.model_dump_json())
+            return response
 
         while True:
             # TODO:
@@ -152,13 +529,17 @@ class BaseAgent:
                 response = None
                 if len(self.tools_list) == 0:
                     try: 
-                        response: self.output_format = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=self.messages,
-                        response_model=self.output_format,
-                        max_retries=3,
-                        max_tokens=1000 if self.provider_name == "anthropic" else None,
-                        )
+                        with trace_span("llm.request", provider=self.provider_name, model=self.model_name, messages=len(self.messages)) as span:
+                            if tracing_enabled():
+                                span.set(prompt_bytes=json_size(self.messages))
+                            response: self.output_format = await self.client.chat.completions.create(
+                            model=self.model_name,
+                            messages=self._get_request_messages(),
+                            response_model=self.output_format,
+                            max_retries=self._traced_retrying(3),
+                            max_tokens=1000 if self.provider_name == "anthropic" else None,
+                            )
+                            self._trace_response(span, response)
                     except InstructorRetryException as e:
                         print(f"InstructorRetryException: client - {self.provider_name} model - {self.model_name}")
                         print(f"Error: {str(e)}")
@@ -166,15 +547,22 @@ class BaseAgent:
                     except Exception as e:
                         print("Error in output", e)
                 else:
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=self.messages,
-                        response_model=self.output_format,
-                        tool_choice="auto",
-                        tools=self.tools_list,
-                    )
+                    with trace_span("llm.request", provider=self.provider_name, model=self.model_name, messages=len(self.messages)) as span:
+                        if tracing_enabled():
+                            span.set(prompt_bytes=json_size(self.messages))
+                        response = await self.client.chat.completions.create(
+                            model=self.model_name,
+                            messages=self._get_request_messages(),
+                            response_model=self.output_format,
+                            tool_choice="auto",
+                            tools=self.tools_list,
+                            max_retries=self._traced_retrying(1),
+                        )
+                        self._trace_response(span, response)
                 
                 assert isinstance(response, self.output_format)
+                if cache_key is not None:
+                    await asyncio.to_thread(cache.put, cache_key, response.model_dump_json())
                 return response
 
                 # instructor directly outputs response.choices[0].message. so we will do response_message = response
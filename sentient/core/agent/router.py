@@ -0,0 +1,247 @@
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from sentient.core.models.models import LLMCallUsage, RoutingDecision
+from sentient.utils.logger import logger
+
+FAST = "fast"
+STRONG = "strong"
+
+# The estimated prices of some models, in USD per million prompt and completion tokens, to log the cost of the
+# routing decisions. Other models are priced with the prices passed to the router, or not at all
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-2024-08-06": (2.5, 10.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o-mini-2024-07-18": (0.15, 0.6),
+    "claude-3-5-sonnet-20240620": (3.0, 15.0),
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+}
+
+# the results of the skills that did not do what they were asked, e.g. "Failed to load page", "Could not scroll"
+FAILED_RESULT_PATTERN = re.compile(
+    r"\b(error|failed|could not|unable|not found)\b", re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Routes every step of an agent to a fast model, or to a strong model for the steps that need it: the pages
+    matching the configured patterns, and the steps after repeated failed tasks. The output of the fast model is
+    redone by the strong model when it failed (e.g. did not validate against the output format) or has a low
+    confidence, and the next steps then go to the strong model too. A router keeps the state of the steps of one
+    agent, so every agent needs its own.
+    """
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        min_confidence: float = 0.6,
+        max_failed_tasks: int = 2,
+        strong_page_patterns: Optional[Sequence[str]] = None,
+        escalation_steps: int = 1,
+        prices: Optional[Dict[str, Tuple[float, float]]] = None,
+    ):
+        """
+        Args:
+            fast_model (str): The model of the steps by default.
+            strong_model (str): The model of the steps escalated from the fast model.
+            min_confidence (float, optional): The output of the fast model with a lower confidence is redone by the
+                strong model. Defaults to 0.6.
+            max_failed_tasks (int, optional): The steps following this many failed tasks in a row go to the strong
+                model. Defaults to 2.
+            strong_page_patterns (Optional[Sequence[str]], optional): Regular expressions of the URLs of the pages
+                whose steps go to the strong model, e.g. checkout or login pages. Defaults to None.
+            escalation_steps (int, optional): The steps following an escalation that go to the strong model too.
+                Defaults to 1.
+            prices (Optional[Dict[str, Tuple[float, float]]], optional): The prices of the models, in USD per
+                million prompt and completion tokens, added to MODEL_PRICES. Defaults to None.
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.min_confidence = min_confidence
+        self.max_failed_tasks = max_failed_tasks
+        self.strong_page_patterns = [
+            re.compile(pattern) for pattern in strong_page_patterns or []
+        ]
+        self.escalation_steps = escalation_steps
+        self.prices = {**MODEL_PRICES, **(prices or {})}
+        # the routing decision of every step of the current objective
+        self.decisions: List[RoutingDecision] = []
+        self._strong_steps_left = 0
+        self._objective: Optional[str] = None
+
+    def choose(self, input_data: BaseModel) -> RoutingDecision:
+        """
+        Returns the decision of the model of a step, from its input. The decisions of the previous objective are
+        forgotten when the objective changes.
+        """
+        objective = getattr(input_data, "objective", None)
+        if objective != self._objective:
+            self._objective = objective
+            self.decisions = []
+            self._strong_steps_left = 0
+
+        url = getattr(input_data, "current_page_url", None) or ""
+        failed_tasks = self.__count_failed_tasks(input_data)
+        if any(pattern.search(url) for pattern in self.strong_page_patterns):
+            tier, reason = STRONG, f"page {url} matches a strong page pattern"
+        elif self.max_failed_tasks and failed_tasks >= self.max_failed_tasks:
+            tier, reason = STRONG, f"the last {failed_tasks} tasks failed"
+        elif self._strong_steps_left > 0:
+            self._strong_steps_left -= 1
+            tier, reason = STRONG, "a previous step was escalated"
+        else:
+            tier, reason = FAST, "default"
+
+        decision = RoutingDecision(
+            step=len(self.decisions) + 1,
+            model=self.fast_model if tier == FAST else self.strong_model,
+            tier=tier,
+            reason=reason,
+        )
+        self.decisions.append(decision)
+        return decision
+
+    @staticmethod
+    def __count_failed_tasks(input_data: BaseModel) -> int:
+        failed = 0
+        for task in reversed(getattr(input_data, "completed_tasks", None) or []):
+            if not task.result or not FAILED_RESULT_PATTERN.search(task.result):
+                break
+            failed += 1
+        return failed
+
+    def review(
+        self,
+        decision: RoutingDecision,
+        output: Optional[BaseModel],
+        error: Optional[Exception],
+        usage: LLMCallUsage,
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Reviews the output of the fast model of a step. The outputs of the strong model are never escalated.
+
+        Args:
+            decision (RoutingDecision): The decision of the step.
+            output (Optional[BaseModel]): The output of the fast model, None if the call failed.
+            error (Optional[Exception]): The error of the call, if it failed.
+            usage (LLMCallUsage): The usage of the call, with its validation failures.
+
+        Returns:
+            Tuple[Optional[str], bool]: Why the step should be escalated to the strong model, None to keep the
+                output, and whether its output should be redone by the strong model. An output that validated after
+                retries is kept, only the next steps go to the strong model.
+        """
+        if decision.tier != FAST:
+            return None, False
+        if error is not None:
+            return f"the fast model failed: {type(error).__name__}", True
+        confidence = getattr(output, "confidence", None)
+        if confidence is not None and confidence < self.min_confidence:
+            return f"the fast model has a low confidence of {confidence:.2f}", True
+        if usage.validation_failures:
+            return (
+                f"{usage.validation_failures} outputs of the fast model did not validate",
+                False,
+            )
+        return None, False
+
+    def escalate(self, decision: RoutingDecision, reason: str, redone: bool):
+        """
+        Records the escalation of a step, whose output is redone by the strong model, or is kept (its actions
+        already ran, or it validated after retries) and only the next steps go to the strong model.
+        """
+        decision.escalation_reason = reason
+        if redone:
+            decision.model = self.strong_model
+        self._strong_steps_left = self.escalation_steps
+        logger.info(
+            f"Step {decision.step}: escalating from {self.fast_model} to {self.strong_model} "
+            f"({'redone' if redone else 'for the next steps'}), {reason}"
+        )
+
+    def record(
+        self,
+        decision: RoutingDecision,
+        usage: LLMCallUsage,
+        escalated_usage: Optional[LLMCallUsage] = None,
+    ):
+        """
+        Completes a decision with the latency, tokens and estimated cost of the calls of its step, and logs it.
+
+        Args:
+            decision (RoutingDecision): The decision of the step.
+            usage (LLMCallUsage): The usage of the call of the model the step was first sent to.
+            escalated_usage (Optional[LLMCallUsage], optional): The usage of the call of the strong model, when the
+                output was redone. Defaults to None.
+        """
+        calls = [(decision.tier, usage)]
+        if escalated_usage is not None:
+            calls.append((STRONG, escalated_usage))
+            decision.escalation_latency = escalated_usage.latency
+        decision.latency = sum(call.latency for _, call in calls)
+        decision.prompt_tokens = sum(call.prompt_tokens for _, call in calls)
+        decision.completion_tokens = sum(call.completion_tokens for _, call in calls)
+        costs = [
+            self.estimate_cost(
+                self.fast_model if tier == FAST else self.strong_model, call
+            )
+            for tier, call in calls
+        ]
+        decision.cost = None if None in costs else sum(costs)
+        # what the step would have cost with the strong model only, for the tokens of its last call
+        decision.strong_cost = self.estimate_cost(self.strong_model, calls[-1][1])
+
+        impact = ""
+        if decision.cost is not None and decision.strong_cost is not None:
+            impact = f", ${decision.cost:.5f} (${decision.strong_cost - decision.cost:+.5f} vs {self.strong_model})"
+        logger.info(
+            f"Step {decision.step} routed to {decision.model} ({decision.tier}: {decision.reason}"
+            f"{'; escalated: ' + decision.escalation_reason if decision.escalation_reason else ''}), "
+            f"{decision.latency:.2f}s ({decision.escalation_latency:.2f}s escalation), "
+            f"{decision.prompt_tokens} prompt and {decision.completion_tokens} completion tokens{impact}"
+        )
+
+    def estimate_cost(self, model: str, usage: LLMCallUsage) -> Optional[float]:
+        """
+        Returns the estimated cost of a call in USD, None if the model has no price.
+        """
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        return (
+            usage.prompt_tokens * price[0] + usage.completion_tokens * price[1]
+        ) / 1_000_000
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Returns the steps of the current objective sent to the fast and to the strong model, the escalations by
+        reason, the latency of the escalations, and the estimated cost against the strong model only.
+        """
+        escalations: Dict[str, int] = {}
+        for decision in self.decisions:
+            if decision.escalation_reason:
+                # e.g. "the fast model has a low confidence" without its value
+                reason = decision.escalation_reason.split(" of ")[0].split(":")[0]
+                escalations[reason] = escalations.get(reason, 0) + 1
+        priced = [
+            d
+            for d in self.decisions
+            if d.cost is not None and d.strong_cost is not None
+        ]
+        return {
+            "steps": len(self.decisions),
+            "fast_steps": sum(1 for d in self.decisions if d.model == self.fast_model),
+            "strong_steps": sum(
+                1 for d in self.decisions if d.model == self.strong_model
+            ),
+            "escalations": escalations,
+            "escalation_latency": sum(d.escalation_latency for d in self.decisions),
+            "cost": sum(d.cost for d in priced),
+            "strong_cost": sum(d.strong_cost for d in priced),
+        }
@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sentient.core.models.models import Task
+from sentient.utils.dom_serializer import count_tokens
+from sentient.utils.logger import logger
+
+TRUNCATION_MARKER = " ...[truncated]"
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    Shortens a text to at most `max_tokens` tokens of the model, keeping its beginning, where the skills write the
+    outcome of an action, and marking the cut with TRUNCATION_MARKER.
+
+    Args:
+        text (str): The text to shorten.
+        max_tokens (int): The number of tokens the text may take.
+        model (Optional[str], optional): The model the text is sent to, used to count tokens. Defaults to None.
+
+    Returns:
+        str: The text, shortened if it was over the limit.
+    """
+    tokens = count_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    end = len(text) * max_tokens // tokens
+    while end > 0 and count_tokens(text[:end] + TRUNCATION_MARKER, model) > max_tokens:
+        end = end * 9 // 10
+    return text[:end].rstrip() + TRUNCATION_MARKER
+
+
+@dataclass
+class CompactedHistory:
+    """
+    The completed tasks as sent to the agent.
+
+    Attributes:
+        tasks (List[Task]): The latest tasks, with their results shortened to the per-task cap.
+        summary (Optional[str]): One line per older task, None when all the tasks are listed in `tasks`.
+        tokens (int): The tokens the tasks and the summary take.
+        omitted (int): The number of tasks left out of both to fit the budget.
+    """
+
+    tasks: List[Task]
+    summary: Optional[str]
+    tokens: int
+    omitted: int = 0
+
+
+class TaskHistoryManager:
+    """
+    Bounds the completed tasks sent to the agent at every step, which would otherwise grow with every step of a run,
+    along with the results of the skills they carry (e.g. outer HTML and DOM changes).
+
+    The last `keep_last` tasks are sent as they are, with their results shortened to `max_result_tokens`, and the
+    older ones are folded into a rolling summary of one short line per task. When the whole history is over
+    `max_history_tokens`, the oldest summary lines are left out first, then the oldest of the latest tasks, and as a
+    last resort the result of the latest task is shortened further.
+    """
+
+    def __init__(
+        self,
+        keep_last: int = 5,
+        max_result_tokens: int = 250,
+        max_summary_result_tokens: int = 30,
+        max_history_tokens: int = 2500,
+    ):
+        """
+        Args:
+            keep_last (int, optional): The number of latest tasks sent in full. Defaults to 5.
+            max_result_tokens (int, optional): The tokens the result of each of the latest tasks may take.
+                Defaults to 250.
+            max_summary_result_tokens (int, optional): The tokens the result of a task may take in the summary.
+                Defaults to 30.
+            max_history_tokens (int, optional): The tokens the whole history may take. Defaults to 2500.
+        """
+        if keep_last < 1:
+            raise ValueError("At least the last task must be kept")
+        self.keep_last = keep_last
+        self.max_result_tokens = max_result_tokens
+        self.max_summary_result_tokens = max_summary_result_tokens
+        self.max_history_tokens = max_history_tokens
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the summary lines of the previous run.
+        """
+        # the summary line of every task, by position in the completed tasks, written once when the task leaves the
+        # latest tasks. Not by task id, which the agent writes and repeats when it retries a task of its plan. The
+        # description and result the line was written from are kept with it, in case the task at a position changes
+        self._summary_lines: Dict[int, Tuple[str, Optional[str], str]] = {}
+
+    def compact(
+        self, completed_tasks: Optional[List[Task]], model: Optional[str] = None
+    ) -> CompactedHistory:
+        """
+        Returns the completed tasks to send to the agent, within the limits of the manager. The tasks themselves,
+        kept in the memory of the orchestrator, are not modified.
+
+        Args:
+            completed_tasks (Optional[List[Task]]): All the tasks completed so far, oldest first.
+            model (Optional[str], optional): The model the history is sent to, used to count tokens. Defaults to None.
+
+        Returns:
+            CompactedHistory: The latest tasks, the summary of the older ones and the tokens they take.
+        """
+        completed_tasks = completed_tasks or []
+        older_tasks = completed_tasks[: -self.keep_last]
+        latest_tasks = [
+            self._shorten_task(task, self.max_result_tokens, model)
+            for task in completed_tasks[-self.keep_last :]
+        ]
+        summary_lines = [
+            self._summarize_task(position, task, model)
+            for position, task in enumerate(older_tasks)
+        ]
+
+        # the parts are counted separately, so that leaving one out does not recount the others
+        task_tokens = [self._count_task_tokens(task, model) for task in latest_tasks]
+        line_tokens = [count_tokens(line + "\n", model) for line in summary_lines]
+        omitted = 0
+        while sum(task_tokens) + sum(line_tokens) > self.max_history_tokens:
+            if summary_lines:
+                summary_lines.pop(0)
+                line_tokens.pop(0)
+            elif len(latest_tasks) > 1:
+                latest_tasks.pop(0)
+                task_tokens.pop(0)
+            else:
+                # a single task over the budget, its result takes whatever the rest of the task leaves
+                task = latest_tasks[0]
+                budget = self.max_history_tokens - (
+                    task_tokens[0] - count_tokens(task.result or "", model)
+                )
+                latest_tasks[0] = self._shorten_task(task, max(budget, 0), model)
+                task_tokens[0] = self._count_task_tokens(latest_tasks[0], model)
+                break
+            omitted += 1
+
+        if omitted:
+            logger.debug(
+                f"{omitted} completed tasks were left out of the history to fit in {self.max_history_tokens} tokens"
+            )
+        return CompactedHistory(
+            tasks=latest_tasks,
+            summary=self._format_summary(summary_lines, omitted),
+            tokens=sum(task_tokens) + sum(line_tokens),
+            omitted=omitted,
+        )
+
+    def _shorten_task(self, task: Task, max_tokens: int, model: Optional[str]) -> Task:
+        if not task.result:
+            return task
+        result = truncate_to_tokens(task.result, max_tokens, model)
+        if result == task.result:
+            return task
+        return task.model_copy(update={"result": result})
+
+    def _summarize_task(self, position: int, task: Task, model: Optional[str]) -> str:
+        cached = self._summary_lines.get(position)
+        if cached is not None and cached[:2] == (task.description, task.result):
+            return cached[2]
+        line = f"{task.id}. {task.description}"
+        if task.result:
+            result = truncate_to_tokens(
+                " ".join(task.result.split()), self.max_summary_result_tokens, model
+            )
+            line += f" -> {result}"
+        self._summary_lines[position] = (task.description, task.result, line)
+        return line
+
+    def _format_summary(self, summary_lines: List[str], omitted: int) -> Optional[str]:
+        if not summary_lines and not omitted:
+            return None
+        lines = list(summary_lines)
+        if omitted:
+            lines.insert(0, f"({omitted} earlier tasks left out)")
+        return "\n".join(lines)
+
+    def _count_task_tokens(self, task: Task, model: Optional[str]) -> int:
+        return count_tokens(task.model_dump_json(), model)
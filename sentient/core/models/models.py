@@ -15,6 +15,7 @@ class ActionType(str, Enum):
     TYPE = "TYPE"
     GOTO_URL = "GOTO_URL"
     ENTER_TEXT_AND_CLICK = "ENTER_TEXT_AND_CLICK"
+    SCROLL = "SCROLL"
 
 
 class ClickAction(BaseModel):
@@ -70,11 +71,20 @@ class EnterTextAndClickAction(BaseModel):
         description="Optional wait time in seconds before executing the click event logic"
     )
 
+class ScrollAction(BaseModel):
+    type: Literal[ActionType.SCROLL] = Field(
+        description="""Scrolls the page up or down by most of a screen to show the elements above or below the viewport. Returns how far the page was scrolled or an appropriate message if it could not be scrolled further."""
+    )
+    direction: Literal["up", "down"] = Field(
+        description="The direction to scroll in, up or down"
+    )
+
 Action = Union[
     ClickAction,
     TypeAction,
     GotoAction,
     EnterTextAndClickAction,
+    ScrollAction,
 ]
 
 
@@ -92,6 +102,69 @@ class TaskWithActions(BaseModel):
     result: Optional[str] = Field(default=None)
 
 
+# LLM usage
+class LLMCallUsage(BaseModel):
+    provider: str
+    model: Optional[str] = Field(default=None)
+    prompt_tokens: int = Field(default=0, description="All the prompt tokens of the attempts, cached ones included")
+    completion_tokens: int = Field(default=0)
+    cached_tokens: int = Field(default=0, description="The prompt tokens of the last attempt read from the provider's prompt cache")
+    cache_write_tokens: int = Field(default=0, description="The prompt tokens of the last attempt written to the provider's prompt cache")
+    latency: float = Field(default=0.0, description="Seconds from the request to the validated output, retries included")
+    time_to_first_token: Optional[float] = Field(default=None, description="Seconds to the first chunk, only known when the output is streamed")
+    retries: int = Field(default=0, description="The attempts that failed and were retried, or gave up after")
+    validation_failures: int = Field(default=0, description="The failed attempts whose output did not validate")
+    cached_response: bool = Field(default=False, description="Whether the output was replayed from the LLM response cache")
+    escalated_from: Optional[str] = Field(default=None, description="The fast model whose output the router escalated to this model, see ModelRouter")
+    error: Optional[str] = Field(default=None)
+
+
+class LLMUsage(BaseModel):
+    calls: int = 0
+    failed_calls: int = 0
+    cached_responses: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cache_write_tokens: int = 0
+    latency: float = Field(default=0.0, description="The total latency of the calls, in seconds")
+    streamed_calls: int = 0
+    time_to_first_token: float = Field(default=0.0, description="The total time to first token of the streamed calls, in seconds")
+    retries: int = 0
+    validation_failures: int = 0
+    escalations: int = Field(default=0, description="The calls whose fast model output was redone by the strong model")
+
+    def add_call(self, call: LLMCallUsage):
+        self.calls += 1
+        self.escalations += 1 if call.escalated_from else 0
+        self.failed_calls += 1 if call.error else 0
+        self.cached_responses += 1 if call.cached_response else 0
+        self.prompt_tokens += call.prompt_tokens
+        self.completion_tokens += call.completion_tokens
+        self.cached_tokens += call.cached_tokens
+        self.cache_write_tokens += call.cache_write_tokens
+        self.latency += call.latency
+        if call.time_to_first_token is not None:
+            self.streamed_calls += 1
+            self.time_to_first_token += call.time_to_first_token
+        self.retries += call.retries
+        self.validation_failures += call.validation_failures
+
+
+class RoutingDecision(BaseModel):
+    step: int = Field(description="The step of the objective, from 1")
+    model: str = Field(description="The model that wrote the output of the step")
+    tier: str = Field(description="fast or strong")
+    reason: str = Field(description="Why the step was sent to its first model")
+    escalation_reason: Optional[str] = Field(default=None, description="Why the output of the fast model was redone by the strong model, or the next step sent to it")
+    latency: float = Field(default=0.0, description="Seconds of the LLM calls of the step, the escalated call included")
+    escalation_latency: float = Field(default=0.0, description="Seconds the escalated call added")
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    cost: Optional[float] = Field(default=None, description="The estimated cost of the calls of the step in USD, None for models without a price")
+    strong_cost: Optional[float] = Field(default=None, description="The estimated cost of the same tokens with the strong model only")
+
+
 class Memory(BaseModel):
     objective: str
     current_state: State
@@ -100,6 +173,7 @@ class Memory(BaseModel):
     completed_tasks: Optional[Union[List[Task], List[TaskWithActions]]] = Field(default=None)
     current_task: Optional[Union[Task, TaskWithActions]] = Field(default=None)
     final_response: Optional[str] = Field(default=None)
+    usage: LLMUsage = Field(default_factory=LLMUsage, description="The LLM calls of the run so far")
 
     class Config:
         use_enum_values = True
@@ -110,6 +184,7 @@ class Memory(BaseModel):
 class AgentInput(BaseModel):
     objective: str
     completed_tasks: Optional[List[Task]] = Field(default=None)
+    completed_tasks_summary: Optional[str] = Field(default=None)
     current_page_url: str
     current_page_dom: str
 
@@ -119,4 +194,16 @@ class AgentOutput(BaseModel):
     next_task: Optional[Task] = Field(default=None, description="The next task to be executed")
     next_task_actions: Optional[List[Action]] = Field(default=None, description="List of actions for the next task")
     is_complete: bool
-    final_response: Optional[str] = Field(default=None, description="Final response of the agent")
\ No newline at end of file
+    final_response: Optional[str] = Field(default=None, description="Final response of the agent")
+    confidence: Optional[float] = Field(default=None, ge=0, le=1, description="How sure the agent is of the next task and its actions, from 0 to 1")
+
+# The same output with the next task and its actions written before the plan, requested when the actions are
+# streamed, so that they can be executed while the model is still writing the plan
+class StreamingAgentOutput(BaseModel):
+    thought: str
+    next_task: Optional[Task] = Field(default=None, description="The next task to be executed")
+    next_task_actions: Optional[List[Action]] = Field(default=None, description="List of actions for the next task")
+    plan: List[Task]
+    is_complete: bool
+    final_response: Optional[str] = Field(default=None, description="Final response of the agent")
+    confidence: Optional[float] = Field(default=None, ge=0, le=1, description="How sure the agent is of the next task and its actions, from 0 to 1")
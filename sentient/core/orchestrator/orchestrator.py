@@ -1,17 +1,21 @@
 import asyncio
+import inspect
 import textwrap
-from typing import Dict, List
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from colorama import Fore, init
 from dotenv import load_dotenv
 from langsmith import traceable
 
 from sentient.core.agent.base import BaseAgent
+from sentient.core.memory.history import TaskHistoryManager
 from sentient.core.models.models import (
     Action,
     ActionType,
     AgentInput,
     AgentOutput,
+    LLMUsage,
     Memory,
     State,
     Task,
@@ -21,20 +25,69 @@ from sentient.core.skills.enter_text_using_selector import EnterTextEntry, enter
 from sentient.core.skills.get_dom_with_content_type import get_dom_with_content_type
 from sentient.core.skills.get_url import geturl
 from sentient.core.skills.open_url import openurl
+from sentient.core.skills.scroll_page import scroll
 from sentient.core.skills.enter_text_and_click import enter_text_and_click
 from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.debug_artifacts import start_debug_session
+from sentient.utils.dom_diff import DomDeltaTracker
+from sentient.utils.dom_serializer import get_dom_token_budget, serialize_dom
+from sentient.utils.logger import logger
+from sentient.utils.page_settle import get_settle_stats, wait_for_page_settle
+from sentient.utils.tracing import json_size, start_trace, trace_span, tracing_enabled
 
 init(autoreset=True)
 
 
 class Orchestrator:
     def __init__(
-        self, state_to_agent_map: Dict[State, BaseAgent], eval_mode: bool = False
+        self,
+        state_to_agent_map: Dict[State, BaseAgent],
+        eval_mode: bool = False,
+        dom_delta_mode: bool = False,
+        cdp_dom_snapshot: bool = False,
+        viewport_dom: bool = False,
+        compact_dom: bool = False,
+        dom_token_budget: Optional[int] = None,
+        task_history: Optional[TaskHistoryManager] = None,
+        event_callback: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        stream_actions: bool = False,
     ):
         load_dotenv()
         self.state_to_agent_map = state_to_agent_map
         self.playwright_manager = PlaywrightManager()
         self.eval_mode = eval_mode
+        # in delta mode, on the same page only the elements that changed since the previous step are sent in full,
+        # with an index of the mmid, role and name of the unchanged ones
+        self.dom_delta_tracker = DomDeltaTracker() if dom_delta_mode else None
+        # build the DOM from a CDP snapshot instead of injecting mmid attributes into the page
+        self.cdp_dom_snapshot = cdp_dom_snapshot
+        # only send the elements in and around the viewport, the agent scrolls to see the rest of the page
+        self.viewport_dom = viewport_dom
+        # send the DOM as compact lines fitted in a token budget (by default the budget of the agent's model)
+        # instead of the repr of the tree. The tokens of the DOM of every step are kept in dom_tokens_per_step
+        self.compact_dom = compact_dom
+        self.dom_token_budget = dom_token_budget
+        self.dom_tokens_per_step: List[int] = []
+        # the completed tasks sent to the agent are the latest ones in full and a summary of the older ones, so that
+        # the prompt does not grow with every step. The tokens of the history of every step are kept here
+        self.task_history = task_history or TaskHistoryManager()
+        self.history_tokens_per_step: List[int] = []
+        # the actions wait for the page to settle instead of fixed waits, the seconds saved by every step, and lost
+        # when the page took longer to settle than the fixed waits, are kept here
+        self.settle_time_saved_per_step: List[float] = []
+        self.settle_time_lost_per_step: List[float] = []
+        # the time spent in every phase of every step, in seconds, to see the critical path of the steps
+        self.step_timings: List[Dict[str, float]] = []
+        # the tokens, latency and retries of the LLM calls of every step, the total of the run is in memory.usage
+        self.llm_usage_per_step: List[LLMUsage] = []
+        # the observation of the page for the next step, started as soon as the actions of a step are done
+        self._prefetched_observation: Optional[asyncio.Future] = None
+        # called (and awaited if it returns an awaitable) with an event dict when a run starts, after every step and
+        # when the run ends, e.g. to stream the progress of a run to a client
+        self.event_callback = event_callback
+        # the output of the agent is streamed and its actions run as soon as they are written, while the model is
+        # still writing the rest of the output (see _run_agent_streaming)
+        self.stream_actions = stream_actions
         self.shutdown_event = asyncio.Event()
         # self.session_id = str(uuid.uuid4())
 
@@ -84,13 +137,38 @@ class Orchestrator:
                 current_task=None,
                 final_response=None,
             )
+            if self.dom_delta_tracker:
+                self.dom_delta_tracker.reset()
+            self.dom_tokens_per_step = []
+            self.task_history.reset()
+            self.history_tokens_per_step = []
+            self.settle_time_saved_per_step = []
+            self.settle_time_lost_per_step = []
+            self.step_timings = []
+            self.llm_usage_per_step = []
+            self._cancel_prefetched_observation()
+            # the debug artifacts and the trace of every command are kept in their own folder and file
+            start_trace(start_debug_session())
             print(f"Executing command {self.memory.objective}")
-            while self.memory.current_state != State.COMPLETED:
-                await self._handle_state()
+            await self._emit_event("run_started", objective=command)
+            with trace_span("run"):
+                while self.memory.current_state != State.COMPLETED:
+                    await self._handle_state()
             self._print_final_response()
+            self._log_llm_usage()
+            await self._emit_event(
+                "run_completed",
+                final_response=self.memory.final_response,
+                usage=self.memory.usage.model_dump(),
+            )
             return self.memory.final_response
         except Exception as e:
             print(f"Error executing the command {self.memory.objective}: {e}")
+            await self._emit_event(
+                "run_failed", error=str(e), usage=self.memory.usage.model_dump()
+            )
+        finally:
+            self._cancel_prefetched_observation()
 
     def run(self) -> Memory:
         while self.memory.current_state != State.COMPLETED:
@@ -111,40 +189,295 @@ class Orchestrator:
             raise ValueError(f"Unhandled state: {current_state}")
 
 
+    async def _emit_event(self, event_type: str, **data: Any):
+        if self.event_callback is None:
+            return
+        try:
+            result = self.event_callback({"type": event_type, **data})
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"The event callback failed on {event_type}: {e}")
+
+    async def _timed(
+        self, awaitable: Awaitable[Any], timings: Dict[str, float], phase: str
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[phase] = time.perf_counter() - start
+
+    async def _observe_page(
+        self, agent: BaseAgent
+    ) -> Tuple[Any, str, Dict[str, float]]:
+        """
+        Extracts the DOM of the current page and its URL concurrently, then prepares the DOM for the agent
+        (changes since the previous step marked, compact serialization).
+
+        Returns:
+            Tuple[Any, str, Dict[str, float]]: The DOM for the agent, the URL, and the time spent in every phase.
+        """
+        with trace_span("observation") as span:
+            dom, url, timings = await self._extract_observation(agent)
+            if tracing_enabled():
+                span.set(dom_bytes=json_size(dom))
+        return dom, url, timings
+
+    async def _extract_observation(
+        self, agent: BaseAgent
+    ) -> Tuple[Any, str, Dict[str, float]]:
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        # repesenting state with dom representation
+        dom, url = await asyncio.gather(
+            self._timed(
+                get_dom_with_content_type(
+                    content_type="viewport_fields"
+                    if self.viewport_dom
+                    else "all_fields",
+                    use_cdp_snapshot=self.cdp_dom_snapshot,
+                ),
+                timings,
+                "dom_extraction",
+            ),
+            self._timed(geturl(), timings, "url"),
+        )
+        if self.dom_delta_tracker:
+            page = await self.playwright_manager.get_current_page()
+            dom = await self._timed(
+                self.dom_delta_tracker.get_dom_for_agent(page, dom),
+                timings,
+                "dom_delta",
+            )
+
+        if self.compact_dom:
+            serialize_start = time.perf_counter()
+            serialized_dom = serialize_dom(
+                dom,
+                max_tokens=self.dom_token_budget
+                or get_dom_token_budget(agent.model_name),
+                model=agent.model_name,
+            )
+            timings["dom_serialization"] = time.perf_counter() - serialize_start
+            self.dom_tokens_per_step.append(serialized_dom.tokens)
+            logger.info(
+                f"DOM serialized in {serialized_dom.tokens} tokens (reduction level {serialized_dom.reduction_level})"
+            )
+            dom = serialized_dom.text
+
+        timings["observation"] = time.perf_counter() - start
+        return dom, url, timings
+
+    def _prefetch_observation(self, agent: BaseAgent):
+        """
+        Starts observing the page for the next step in the background, so that the extraction overlaps with the
+        bookkeeping of the current step.
+        """
+        self._cancel_prefetched_observation()
+        self._prefetched_observation = asyncio.ensure_future(self._observe_page(agent))
+
+    def _cancel_prefetched_observation(self):
+        if self._prefetched_observation is not None:
+            self._prefetched_observation.cancel()
+            self._prefetched_observation = None
+
     async def _handle_agent(self):
+        with trace_span("step", step=len(self.step_timings) + 1):
+            await self._run_agent_step()
+
+    async def _run_agent_step(self):
+        step_start = time.perf_counter()
         agent = self.state_to_agent_map[State.BASE_AGENT]
         self._print_memory_and_agent(agent.name)
 
-        # repesenting state with dom representation
-        dom = await get_dom_with_content_type(content_type="all_fields")
-        url = await geturl()
+        observation = self._prefetched_observation or asyncio.ensure_future(
+            self._observe_page(agent)
+        )
+        self._prefetched_observation = None
+        wait_start = time.perf_counter()
+        dom, url, timings = await observation
+        # how long the step was blocked on the observation, less than the observation itself when it was prefetched
+        timings["observation_wait"] = time.perf_counter() - wait_start
 
+        history = self.task_history.compact(
+            self.memory.completed_tasks, agent.model_name
+        )
+        self.history_tokens_per_step.append(history.tokens)
         input_data = AgentInput(
             objective=self.memory.objective,
-            completed_tasks=self.memory.completed_tasks,
+            completed_tasks=history.tasks,
+            completed_tasks_summary=history.summary,
             current_page_url=str(url),
             current_page_dom=str(dom),
         )
         
+        output: Optional[AgentOutput] = None
+        error = None
+        agent.last_usage = None
         try:
-            output: AgentOutput = await agent.run(input_data)
-            await self._update_memory_from_agent(output)
+            if self.stream_actions:
+                output, action_results = await self._run_agent_streaming(
+                    agent, input_data, timings
+                )
+                await self._update_memory_from_agent(
+                    output, timings, action_results=action_results
+                )
+            else:
+                output = await self._timed(
+                    agent.run(input_data), timings, "llm"
+                )
+                await self._update_memory_from_agent(output, timings)
             print(f"{Fore.MAGENTA}Base Agent Q has updated the memory.")
         except Exception as e:
             print(f"{Fore.RED}Unexpected Error in Agent Execution:")
             print(str(e))
+            error = str(e)
+
+        step_usage = LLMUsage()
+        if agent.last_usage is not None:
+            step_usage.add_call(agent.last_usage)
+            self.memory.usage.add_call(agent.last_usage)
+        self.llm_usage_per_step.append(step_usage)
+
+        timings["step"] = time.perf_counter() - step_start
+        self.step_timings.append(timings)
+        logger.info(
+            "Step timings: "
+            + ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in timings.items())
+        )
+        await self._emit_event(
+            "step",
+            step=len(self.step_timings),
+            url=str(url),
+            thought=output.thought if output else None,
+            task=self.memory.completed_tasks[-1].model_dump()
+            if output and output.next_task and self.memory.completed_tasks
+            else None,
+            actions=[action.model_dump(mode="json") for action in output.next_task_actions or []]
+            if output
+            else [],
+            is_complete=output.is_complete if output else False,
+            error=error,
+            timings=timings,
+            usage=step_usage.model_dump(),
+        )
+
+
+    async def _run_agent_streaming(
+        self, agent: BaseAgent, input_data: AgentInput, timings: Dict[str, float]
+    ) -> Tuple[AgentOutput, List[str]]:
+        """
+        Runs the agent with its output streamed, executing every action as soon as the agent has written it, one
+        after the other and in order, while the model is still writing the rest of the output.
+
+        The actions are committed once the whole output is valid: the actions of the output that were not streamed
+        are executed and the results of all of them are returned for the memory. If the output turns out invalid,
+        the actions that were not started are dropped, the running one is let finish, since an action on the page
+        cannot be interrupted safely, and the actions that ran are recorded as a completed task, so that the agent
+        knows at the next step that the page changed. The error is then re-raised.
 
+        Returns:
+            Tuple[AgentOutput, List[str]]: The output of the agent and the results of its actions.
+        """
+        # only the settles of this session's page are counted, other sessions may run concurrently
+        page = await self.playwright_manager.get_current_page()
+        settle_stats = get_settle_stats(page)
+        queue: "asyncio.Queue[Optional[Action]]" = asyncio.Queue()
+        executed: List[Tuple[Action, str]] = []
+        actions_start: Optional[float] = None
+
+        async def execute_streamed_actions():
+            nonlocal actions_start
+            while True:
+                action = await queue.get()
+                if action is None:
+                    return
+                if actions_start is None:
+                    actions_start = time.perf_counter()
+                executed.append((action, await self._execute_action(action)))
+
+        async def on_action(action: Action):
+            queue.put_nowait(action)
+
+        executor = asyncio.ensure_future(execute_streamed_actions())
+        try:
+            output = await self._timed(
+                agent.run(input_data, on_action=on_action), timings, "llm"
+            )
+        except asyncio.CancelledError:
+            executor.cancel()
+            raise
+        except Exception:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+            await executor
+            if executed:
+                self._record_actions_of_invalid_output(executed)
+                self._record_settle_time_saved(page, settle_stats)
+            raise
+        queue.put_nowait(None)
+        await executor
+
+        streamed = len(executed)
+        actions = output.next_task_actions or []
+        if output.is_complete:
+            if streamed:
+                logger.warning(
+                    f"{streamed} actions ran from an output that turned out to complete the objective"
+                )
+        elif output.next_task:
+            for action in actions[streamed:]:
+                if actions_start is None:
+                    actions_start = time.perf_counter()
+                executed.append((action, await self._execute_action(action)))
+        if actions_start is not None:
+            timings["actions"] = time.perf_counter() - actions_start
+            self._record_settle_time_saved(page, settle_stats)
+            logger.info(
+                f"{streamed} of {len(actions)} actions started while the output was streamed"
+            )
+        return output, [result for _, result in executed]
+
+    def _record_actions_of_invalid_output(self, executed: List[Tuple[Action, str]]):
+        actions = ", ".join(action.type.value for action, _ in executed)
+        logger.warning(
+            f"The output of the agent is invalid after its actions {actions} ran"
+        )
+        self.memory.completed_tasks.append(
+            Task(
+                id=len(self.memory.completed_tasks) + 1,
+                description=f"Actions run from an output of the agent that turned out invalid: {actions}",
+                url=None,
+                result="; ".join(result for _, result in executed),
+            )
+        )
 
-    async def _update_memory_from_agent(self, agentq_output: AgentOutput):
+    async def _update_memory_from_agent(
+        self,
+        agentq_output: AgentOutput,
+        timings: Optional[Dict[str, float]] = None,
+        action_results: Optional[List[str]] = None,
+    ):
         if agentq_output.is_complete:
             self.memory.current_state = State.COMPLETED
             self.memory.final_response = agentq_output.final_response
         elif agentq_output.next_task:
             self.memory.current_state = State.BASE_AGENT
-            if agentq_output.next_task_actions:
-                action_results = await self.handle_agent_actions(
-                    agentq_output.next_task_actions
-                )
+            # the actions already ran when the output was streamed
+            if action_results is None:
+                action_results = []
+                if agentq_output.next_task_actions:
+                    actions_start = time.perf_counter()
+                    action_results = await self.handle_agent_actions(
+                        agentq_output.next_task_actions
+                    )
+                    if timings is not None:
+                        timings["actions"] = time.perf_counter() - actions_start
+            # the page is observed for the next step while the memory is updated and printed
+            self._prefetch_observation(self.state_to_agent_map[State.BASE_AGENT])
+            if action_results:
                 print("Action results:", action_results)
                 flattened_results = "; ".join(action_results)
                 agentq_output.next_task.result = flattened_results
@@ -162,9 +495,26 @@ class Orchestrator:
         else:
             raise ValueError("Planner did not provide next task or completion status")
 
+    async def _wait_for_page_settle(self, replaced_wait: float):
+        page = await self.playwright_manager.get_current_page()
+        if page is not None:
+            await wait_for_page_settle(
+                page, replaced_wait=replaced_wait, after_action=False
+            )
+
     async def handle_agent_actions(self, actions: List[Action]):
         results = []
+        # only the settles of this session's page are counted, other sessions may run concurrently
+        page = await self.playwright_manager.get_current_page()
+        settle_stats = get_settle_stats(page)
         for action in actions:
+            results.append(await self._execute_action(action))
+
+        self._record_settle_time_saved(page, settle_stats)
+        return results
+
+    async def _execute_action(self, action: Action) -> str:
+        with trace_span(f"action.{action.type.value.lower()}"):
             if action.type == ActionType.GOTO_URL:
                 result = await openurl(url=action.website, timeout=action.timeout or 1)
                 print("Action - GOTO")
@@ -175,26 +525,39 @@ class Orchestrator:
                 result = await entertext(entry)
                 print("Action - TYPE")
             elif action.type == ActionType.CLICK:
+                # wait for the page to settle instead of 1 second, unless the agent asked for a wait
+                await self._wait_for_page_settle(replaced_wait=1)
                 result = await click(
                     selector=f"[mmid='{action.mmid}']",
-                    wait_before_execution=action.wait_before_execution or 1,
+                    wait_before_execution=action.wait_before_execution or 0,
                 )
                 print("Action - CLICK")
             elif action.type == ActionType.ENTER_TEXT_AND_CLICK:
+                # wait for the page to settle instead of 1.5 seconds, unless the agent asked for a wait
+                await self._wait_for_page_settle(replaced_wait=1.5)
                 result = await enter_text_and_click(
                     text_selector=f"[mmid='{action.text_element_mmid}']",
                     text_to_enter=action.text_to_enter,
                     click_selector=f"[mmid='{action.click_element_mmid}']",
-                    wait_before_click_execution=action.wait_before_click_execution
-                    or 1.5,
+                    wait_before_click_execution=action.wait_before_click_execution or 0,
                 )
                 print("Action - ENTER TEXT AND CLICK")
+            elif action.type == ActionType.SCROLL:
+                result = await scroll(direction=action.direction)
+                print("Action - SCROLL")
             else:
                 result = f"Unsupported action type: {action.type}"
+        return result
 
-            results.append(result)
-
-        return results
+    def _record_settle_time_saved(self, page, settle_stats: Dict[str, Any]):
+        stats = get_settle_stats(page)
+        time_saved = stats["saved"] - settle_stats["saved"]
+        time_lost = stats["lost"] - settle_stats["lost"]
+        self.settle_time_saved_per_step.append(time_saved)
+        self.settle_time_lost_per_step.append(time_lost)
+        logger.info(
+            f"Waiting for the page to settle saved {time_saved:.2f} seconds and lost {time_lost:.2f} seconds over fixed waits in this step"
+        )
 
     async def shutdown(self):
         print("Shutting down orchestrator!")
@@ -234,6 +597,16 @@ class Orchestrator:
             print(f"{Fore.WHITE}{line}")
         print(f"{Fore.CYAN}{'='*50}")
 
+    def _log_llm_usage(self):
+        usage = self.memory.usage
+        logger.info(
+            f"LLM usage of the run: {usage.calls} calls ({usage.failed_calls} failed, {usage.cached_responses} cached), "
+            f"{usage.prompt_tokens} prompt tokens ({usage.cached_tokens} cached), "
+            f"{usage.completion_tokens} completion tokens, {usage.latency:.2f}s, "
+            f"{usage.retries} retries ({usage.validation_failures} validation failures), "
+            f"{usage.escalations} escalations to the strong model"
+        )
+
     def _print_final_response(self):
         print(f"\n{Fore.GREEN}{'='*50}")
         print(f"{Fore.GREEN}Objective Completed!")
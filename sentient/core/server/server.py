@@ -0,0 +1,399 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+from sentient.core.agent.agent import Agent
+from sentient.core.models.models import State
+from sentient.core.orchestrator.orchestrator import Orchestrator
+from sentient.core.web_driver.context_pool import BrowserContextPool
+from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.http_clients import close_http_clients
+from sentient.utils.logger import logger
+from sentient.utils.providers import get_provider
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class Job:
+    """
+    A goal submitted to the server, with the events of its run so far.
+
+    Attributes:
+        id (str): The id of the job.
+        goal (str): The goal to run.
+        provider (str): The LLM provider to run it with.
+        model (str): The model to run it with.
+        custom_base_url (Optional[str]): The base url of the custom provider.
+        status (JobStatus): Where the job is.
+        result (Optional[str]): The final response of the agent, once the job completed.
+        error (Optional[str]): Why the job failed.
+        usage (Optional[Dict[str, Any]]): The tokens, latency and retries of the LLM calls of the run, see LLMUsage.
+        events (List[Dict[str, Any]]): The events of the run, see Orchestrator.event_callback.
+    """
+
+    id: str
+    goal: str
+    provider: str
+    model: str
+    custom_base_url: Optional[str] = None
+    status: JobStatus = JobStatus.QUEUED
+    result: Optional[str] = None
+    error: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _listeners: List["asyncio.Queue[Dict[str, Any]]"] = field(
+        default_factory=list, repr=False
+    )
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED)
+
+    def publish(self, event: Dict[str, Any]):
+        event = {"job_id": self.id, "time": time.time(), **event}
+        self.events.append(event)
+        for listener in self._listeners:
+            listener.put_nowait(event)
+
+    def subscribe(self) -> "asyncio.Queue[Dict[str, Any]]":
+        """
+        Returns a queue that receives the events published so far, then every new event.
+        """
+        listener: asyncio.Queue[Dict[str, Any]] = asyncio.Queue()
+        for event in self.events:
+            listener.put_nowait(event)
+        self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener: "asyncio.Queue[Dict[str, Any]]"):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def to_dict(self, include_events: bool = False) -> Dict[str, Any]:
+        job = {
+            "id": self.id,
+            "goal": self.goal,
+            "provider": self.provider,
+            "model": self.model,
+            "status": self.status.value,
+            "result": self.result,
+            "error": self.error,
+            "usage": self.usage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": sum(1 for event in self.events if event["type"] == "step"),
+        }
+        if include_events:
+            job["events"] = self.events
+        return job
+
+
+class SentientServer:
+    """
+    A long running server that keeps the browser and the Python modules warm and runs the goals it receives over a
+    local HTTP API, each in its own context of a BrowserContextPool. The goals wait in a queue until one of the
+    `pool_size` workers is free.
+
+    Routes:
+        GET  /health                  the state of the server and of its queue
+        POST /jobs                    {"goal": ..., "provider"?: ..., "model"?: ..., "custom_base_url"?: ...},
+                                      queues a goal and returns its job
+        GET  /jobs                    the jobs kept by the server, latest last
+        GET  /jobs/{id}               a job, with its events
+        GET  /jobs/{id}/events        the events of a job as they happen, over a WebSocket, or as JSON lines for
+                                      a plain HTTP request, until the job is done
+    """
+
+    def __init__(
+        self,
+        provider: str = "openai",
+        model: str = "gpt-4o-2024-08-06",
+        custom_base_url: Optional[str] = None,
+        pool_size: int = 4,
+        go_to_homepage: bool = True,
+        max_finished_jobs: int = 100,
+        eval_mode: bool = False,
+    ):
+        """
+        Args:
+            provider (str, optional): The default LLM provider of the jobs. Defaults to "openai".
+            model (str, optional): The default model of the jobs. Defaults to "gpt-4o-2024-08-06".
+            custom_base_url (Optional[str], optional): The base url of the custom provider. Defaults to None.
+            pool_size (int, optional): The number of jobs running at the same time. Defaults to 4.
+            go_to_homepage (bool, optional): Whether every job starts on the homepage, otherwise on a blank page.
+                Defaults to True.
+            max_finished_jobs (int, optional): The number of finished jobs kept, the oldest ones are forgotten
+                first. Defaults to 100.
+            eval_mode (bool, optional): Whether to launch a new Chrome instead of connecting to the one listening
+                on localhost:9222. Defaults to False.
+        """
+        self.provider = provider
+        self.model = model
+        self.custom_base_url = custom_base_url
+        self.pool_size = pool_size
+        self.go_to_homepage = go_to_homepage
+        self.max_finished_jobs = max_finished_jobs
+        self.eval_mode = eval_mode
+        # the pool and the queue are created by start, in the event loop the server runs in: aiohttp.web.run_app
+        # starts a loop of its own, and on Python 3.9 a queue or a semaphore is bound to the loop current when created
+        self.pool: Optional[BrowserContextPool] = None
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: "Optional[asyncio.Queue[Job]]" = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        """
+        Starts the browser and the workers. The provider of the defaults is checked right away.
+        """
+        get_provider(self.provider, self.custom_base_url)
+        PlaywrightManager().eval_mode = self.eval_mode
+        self.pool = BrowserContextPool(size=self.pool_size)
+        self._queue = asyncio.Queue()
+        await self.pool.start()
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"sentient-worker-{i}")
+            for i in range(self.pool_size)
+        ]
+        logger.info(f"Sentient server ready with {self.pool_size} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.pool is not None:
+            await self.pool.close()
+        await PlaywrightManager().stop_playwright()
+        await close_http_clients()
+
+    def submit(
+        self,
+        goal: str,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        custom_base_url: Optional[str] = None,
+    ) -> Job:
+        """
+        Queues a goal.
+
+        Raises:
+            ValueError: If the goal is empty or the provider is not supported.
+            RuntimeError: If the server is not started.
+        """
+        if self._queue is None:
+            raise RuntimeError("The server is not started")
+        if not goal or not goal.strip():
+            raise ValueError("The goal must not be empty")
+        provider = provider or self.provider
+        custom_base_url = custom_base_url or self.custom_base_url
+        get_provider(provider, custom_base_url)
+        job = Job(
+            id=uuid.uuid4().hex,
+            goal=goal,
+            provider=provider,
+            model=model or self.model,
+            custom_base_url=custom_base_url,
+        )
+        self.jobs[job.id] = job
+        self._forget_finished_jobs()
+        job.publish({"type": "job_queued", "position": self._queue.qsize() + 1})
+        self._queue.put_nowait(job)
+        return job
+
+    async def run_job(self, job: Job):
+        """
+        Runs a job in a context of the pool and publishes its events. Never raises, failures are recorded on the job.
+        """
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        job.publish({"type": "job_started"})
+        try:
+            async with self.pool.session(go_to_homepage=self.go_to_homepage):
+                provider = get_provider(job.provider, job.custom_base_url)
+                orchestrator = Orchestrator(
+                    state_to_agent_map={
+                        State.BASE_AGENT: Agent(provider=provider, model_name=job.model)
+                    },
+                    event_callback=job.publish,
+                )
+                job.result = await orchestrator.execute_command(job.goal)
+                job.usage = orchestrator.memory.usage.model_dump()
+                # the orchestrator reports a failed run with an event rather than an exception
+                for event in job.events:
+                    if event["type"] == "run_failed":
+                        raise RuntimeError(event["error"])
+            job.status = JobStatus.COMPLETED
+        except asyncio.CancelledError:
+            job.status = JobStatus.FAILED
+            job.error = "The server stopped"
+            raise
+        except Exception as e:
+            logger.error(f"Error running the job {job.id}: {e}")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.publish(
+                {
+                    "type": "job_finished",
+                    "status": job.status.value,
+                    "result": job.result,
+                    "error": job.error,
+                    "usage": job.usage,
+                }
+            )
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/health", self._handle_health),
+                web.post("/jobs", self._handle_submit),
+                web.get("/jobs", self._handle_list),
+                web.get("/jobs/{job_id}", self._handle_get),
+                web.get("/jobs/{job_id}/events", self._handle_events),
+            ]
+        )
+
+        async def on_startup(_app: web.Application):
+            await self.start()
+
+        async def on_cleanup(_app: web.Application):
+            await self.stop()
+
+        app.on_startup.append(on_startup)
+        app.on_cleanup.append(on_cleanup)
+        return app
+
+    def _get_job(self, request: web.Request) -> Job:
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(
+                text=json.dumps({"error": "Unknown job"}),
+                content_type="application/json",
+            )
+        return job
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "status": "ok",
+                "workers": len(self._workers),
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "running": sum(
+                    1 for job in self.jobs.values() if job.status == JobStatus.RUNNING
+                ),
+            }
+        )
+
+    async def _handle_submit(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            job = self.submit(
+                goal=body.get("goal", ""),
+                provider=body.get("provider"),
+                model=body.get("model"),
+                custom_base_url=body.get("custom_base_url"),
+            )
+        except (ValueError, AttributeError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response(job.to_dict(), status=202)
+
+    async def _handle_list(self, request: web.Request) -> web.Response:
+        return web.json_response([job.to_dict() for job in self.jobs.values()])
+
+    async def _handle_get(self, request: web.Request) -> web.Response:
+        return web.json_response(self._get_job(request).to_dict(include_events=True))
+
+    async def _handle_events(self, request: web.Request) -> web.StreamResponse:
+        job = self._get_job(request)
+        websocket = web.WebSocketResponse(heartbeat=30)
+        if websocket.can_prepare(request).ok:
+            await websocket.prepare(request)
+            sender = asyncio.create_task(self._stream_events(job, websocket.send_json))
+            # the client sends nothing, but reading is what notices that it went away
+            reader = asyncio.create_task(self._read_until_closed(websocket))
+            try:
+                await asyncio.wait(
+                    {sender, reader}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                sender.cancel()
+                reader.cancel()
+                await websocket.close()
+            return websocket
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def send_line(event: Dict[str, Any]):
+            await response.write((json.dumps(event) + "\n").encode("utf-8"))
+
+        await self._stream_events(job, send_line)
+        await response.write_eof()
+        return response
+
+    async def _stream_events(self, job: Job, send):
+        listener = job.subscribe()
+        try:
+            while True:
+                event = await listener.get()
+                await send(event)
+                if event["type"] == "job_finished":
+                    return
+        except ConnectionResetError:
+            logger.debug(f"The client of the events of the job {job.id} went away")
+        finally:
+            job.unsubscribe(listener)
+
+    async def _read_until_closed(self, websocket: web.WebSocketResponse):
+        async for message in websocket:
+            if message.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                break
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    **server_options: Any,
+):
+    """
+    Runs a SentientServer until interrupted.
+
+    Args:
+        host (str, optional): The interface to listen on. Defaults to "127.0.0.1", which only accepts local clients.
+        port (int, optional): The port to listen on. Defaults to 8765.
+        **server_options: The arguments of SentientServer.
+    """
+    server = SentientServer(**server_options)
+    web.run_app(server.create_app(), host=host, port=port)
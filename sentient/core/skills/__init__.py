@@ -1,5 +1,6 @@
 from sentient.core.skills.click_using_selector import (
     click,
+    click_and_wait_for_outcome,
     do_click,
     is_element_present,
     perform_javascript_click,
@@ -16,9 +17,11 @@ from sentient.core.skills.get_url import geturl
 from sentient.core.skills.get_user_input import get_user_input
 from sentient.core.skills.open_url import openurl
 from sentient.core.skills.press_key_combination import press_key_combination
+from sentient.core.skills.scroll_page import scroll
 
 __all__ = (
     click,
+    click_and_wait_for_outcome,
     do_click,
     is_element_present,
     perform_javascript_click,
@@ -32,4 +35,5 @@ __all__ = (
     get_user_input,
     openurl,
     press_key_combination,
+    scroll,
 )
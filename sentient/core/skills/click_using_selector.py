@@ -1,18 +1,44 @@
 import asyncio
 import inspect
 import traceback
-from typing import Dict
+from enum import Enum
+from typing import Dict, Optional, Tuple
 
-from playwright.async_api import ElementHandle, Page
-from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import ElementHandle, Frame, Page, Request
 from typing_extensions import Annotated
 
 from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.cdp_accessibility_tree import resolve_snapshot_node
 from sentient.utils.dom_mutation_observer import (
+    get_dom_generation,
     subscribe,  # type: ignore
     unsubscribe,  # type: ignore
 )
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
+from sentient.utils.page_settle import wait_for_page_settle
+
+
+class ClickOutcome(str, Enum):
+    NAVIGATION = "navigation"
+    URL_CHANGE = "url_change"
+    DOM_CHANGE = "dom_change"
+    NO_CHANGE = "no_change"
+
+
+__CLICK_OUTCOME_MESSAGES = {
+    ClickOutcome.NAVIGATION: "The page navigated to {url}.",
+    ClickOutcome.URL_CHANGE: "The URL changed to {url} without loading a new page.",
+    ClickOutcome.DOM_CHANGE: "The page changed without navigating.",
+    ClickOutcome.NO_CHANGE: "No navigation or change of the page was detected.",
+}
+
+# How long a click without any effect is waited on, in seconds
+__CLICK_QUIET_TIME = 0.5
+# How long a navigation started by a click is waited on, in seconds
+__CLICK_NAVIGATION_TIMEOUT = 10
+__CLICK_POLL_INTERVAL = 0.05
+
 
 async def click(
     selector: Annotated[
@@ -49,7 +75,8 @@ async def click(
 
     await browser_manager.take_screenshots(f"{function_name}_start", page)
 
-    await browser_manager.highlight_element(selector, True)
+    element_selector = await resolve_snapshot_node(page, selector)
+    await browser_manager.highlight_element(element_selector, True)
 
     dom_changes_detected = None
 
@@ -59,35 +86,140 @@ async def click(
 
     subscribe(detect_dom_changes)
 
+    url_before = page.url
+    generation_before = await get_dom_generation(page)
+
     # Wrap the click action and subsequent operations in a try-except block
     try:
-        # Set up navigation expectation with a shorter timeout
-        async with page.expect_navigation(wait_until="domcontentloaded", timeout=10000):
-            result = await do_click(page, selector, wait_before_execution)
-
-        # Wait for a short time to ensure the page has settled
-        await asyncio.sleep(1)
-    except PlaywrightTimeoutError:
-        # If navigation times out, it might be a single-page app or a slow-loading page
-        logger.warning("Navigation timeout occurred, but the click might have been successful.")
-        result = {
-            "summary_message": "Click executed, but no full page navigation detected",
-            "detailed_message": "Click executed successfully, but no full page navigation was detected. This might be normal for single-page applications or slow-loading pages.",
-        }
+        # Return as soon as the click navigates, changes the URL or the DOM, or nothing happens for a short while,
+        # instead of waiting for a navigation that single-page apps and menus never trigger
+        result, outcome = await click_and_wait_for_outcome(
+            page, element_selector, wait_before_execution, url_before, generation_before
+        )
     except Exception as e:
         logger.error(f"Error during click operation: {e}")
         result = {
             "summary_message": "Click executed, but encountered an error",
             "detailed_message": f"Click executed, but encountered an error: {str(e)}",
         }
+        outcome = ClickOutcome.NO_CHANGE
 
-    await asyncio.sleep(0.1)  # sleep for 100ms to allow the mutation observer to detect changes
+    # wait for the page to settle, which also lets the mutation observer detect the changes.
+    # This replaces a fixed 1 second wait after the click and 100ms for the mutation observer
+    await wait_for_page_settle(page, replaced_wait=1.1)
     unsubscribe(detect_dom_changes)
     await browser_manager.take_screenshots(f"{function_name}_end", page)
 
+    # a navigation or a URL change can follow the first change of the DOM, e.g. a spinner
+    outcome = await __confirm_click_outcome(
+        page, outcome, url_before, generation_before
+    )
+    logger.info(f'Click on "{selector}" resulted in: {outcome.value}')
+    outcome_message = __CLICK_OUTCOME_MESSAGES[outcome].format(url=page.url)
+
     if dom_changes_detected:
-        return f"Success: {result['summary_message']}.\n As a consequence of this action, new elements have appeared in view: {dom_changes_detected}. This means that the action to click {selector} is not yet executed and needs further interaction. Get all_fields DOM to complete the interaction."
-    return result["detailed_message"]
+        return f"Success: {result['summary_message']}. {outcome_message}\n As a consequence of this action, new elements have appeared in view: {dom_changes_detected}. This means that the action to click {selector} is not yet executed and needs further interaction. Get all_fields DOM to complete the interaction."
+    return f"{result['detailed_message']} {outcome_message}"
+
+
+async def click_and_wait_for_outcome(
+    page: Page,
+    selector: str,
+    wait_before_execution: float,
+    url_before: str,
+    generation_before: Optional[Tuple[float, int, int]],
+    quiet_time: float = __CLICK_QUIET_TIME,
+) -> Tuple[Dict[str, str], ClickOutcome]:
+    """
+    Clicks the element and races what the click can cause: a navigation to a new document, a change of the URL in the
+    same document (e.g. pushState), a change of the DOM, or nothing within `quiet_time` seconds. Returns as soon as one
+    of them happens. A navigation is waited on until its document is loaded, for at most 10 seconds.
+
+    Parameters:
+    - page: The Playwright page instance.
+    - selector: The query selector string to identify the element for the click action.
+    - wait_before_execution: Optional wait time in seconds before executing the click event logic.
+    - url_before: The URL of the page before the click.
+    - generation_before: The DOM generation of the page before the click (see get_dom_generation).
+    - quiet_time: How long to wait for an effect of the click, in seconds. Defaults to 0.5.
+
+    Returns:
+    - The result of do_click and the outcome of the click.
+    """
+    navigation_started = asyncio.Event()
+    document_loaded = asyncio.Event()
+    url_changed = asyncio.Event()
+
+    def on_request(request: Request):
+        if request.is_navigation_request() and request.frame == page.main_frame:
+            navigation_started.set()
+
+    def on_frame_navigated(frame: Frame):
+        if frame == page.main_frame and frame.url != url_before:
+            url_changed.set()
+
+    def on_domcontentloaded(_: Page):
+        document_loaded.set()
+
+    page.on("request", on_request)
+    page.on("framenavigated", on_frame_navigated)
+    page.on("domcontentloaded", on_domcontentloaded)
+    try:
+        result = await do_click(page, selector, wait_before_execution)
+
+        deadline = asyncio.get_event_loop().time() + quiet_time
+        while True:
+            if navigation_started.is_set() and not document_loaded.is_set():
+                try:
+                    await asyncio.wait_for(
+                        document_loaded.wait(), timeout=__CLICK_NAVIGATION_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        "The navigation started by the click did not load its document in time."
+                    )
+                return result, ClickOutcome.NAVIGATION
+            if document_loaded.is_set():
+                return result, ClickOutcome.NAVIGATION
+            if url_changed.is_set():
+                return result, ClickOutcome.URL_CHANGE
+            generation = await get_dom_generation(page)
+            if generation is not None and generation_before is not None:
+                if generation[0] != generation_before[0]:
+                    return result, ClickOutcome.NAVIGATION
+                if generation[1] != generation_before[1]:
+                    return result, ClickOutcome.DOM_CHANGE
+            if asyncio.get_event_loop().time() >= deadline:
+                return result, ClickOutcome.NO_CHANGE
+            await asyncio.sleep(__CLICK_POLL_INTERVAL)
+    finally:
+        page.remove_listener("request", on_request)
+        page.remove_listener("framenavigated", on_frame_navigated)
+        page.remove_listener("domcontentloaded", on_domcontentloaded)
+
+
+async def __confirm_click_outcome(
+    page: Page,
+    outcome: ClickOutcome,
+    url_before: str,
+    generation_before: Optional[Tuple[float, int, int]],
+) -> ClickOutcome:
+    """
+    Upgrades the outcome of a click once the page has settled, when a navigation or a URL change happened after the
+    first effect of the click was detected.
+    """
+    if outcome == ClickOutcome.NAVIGATION:
+        return outcome
+    generation = await get_dom_generation(page)
+    if (
+        generation is not None
+        and generation_before is not None
+        and generation[0] != generation_before[0]
+    ):
+        return ClickOutcome.NAVIGATION
+    if page.url != url_before:
+        return ClickOutcome.URL_CHANGE
+    return outcome
 
 async def do_click(
     page: Page, selector: str, wait_before_execution: float
@@ -220,47 +352,9 @@ async def perform_javascript_click(page: Page, selector: str):
     Returns:
     - A string describing the result of the click action.
     """
-    js_code = """(selector) => {
-        let element = document.querySelector(selector);
-
-        if (!element) {
-            console.log(`perform_javascript_click: Element with selector ${selector} not found`);
-            return `perform_javascript_click: Element with selector ${selector} not found`;
-        }
-
-        if (element.tagName.toLowerCase() === "option") {
-            let value = element.text;
-            let parent = element.parentElement;
-
-            parent.value = element.value; // Directly set the value if possible
-            // Trigger change event if necessary
-            let event = new Event('change', { bubbles: true });
-            parent.dispatchEvent(event);
-
-            console.log("Select menu option", value, "selected");
-            return "Select menu option: "+ value+ " selected";
-        }
-        else {
-            console.log("About to click selector", selector);
-            // If the element is a link, make it open in the same tab
-            if (element.tagName.toLowerCase() === "a") {
-                element.target = "_self";
-                // #TODO: Consider removing this in the future if it causes issues with intended new tab behavior
-                element.removeAttribute('target');
-                element.removeAttribute('rel');
-            }
-            let ariaExpandedBeforeClick = element.getAttribute('aria-expanded');
-            element.click();
-            let ariaExpandedAfterClick = element.getAttribute('aria-expanded');
-            if (ariaExpandedBeforeClick === 'false' && ariaExpandedAfterClick === 'true') {
-                return "Executed JavaScript Click on element with selector: "+selector +". Very important: As a consequence a menu has appeared where you may need to make further selection. Very important: Get all_fields DOM to complete the action.";
-            }
-            return "Executed JavaScript Click on element with selector: "+selector;
-        }
-    }"""
     try:
         logger.info(f"Executing JavaScript click on element with selector: {selector}")
-        result: str = await page.evaluate(js_code, selector)
+        result: str = await call_page_runtime(page, "click", selector)
         logger.debug(f"Executed JavaScript Click on element with selector: {selector}")
         return result
     except Exception as e:
@@ -1,4 +1,3 @@
-import asyncio
 import inspect
 
 from typing_extensions import Annotated
@@ -7,7 +6,9 @@ from sentient.core.web_driver.playwright import PlaywrightManager
 from sentient.core.skills.click_using_selector import do_click
 from sentient.core.skills.enter_text_using_selector import do_entertext
 from sentient.core.skills.press_key_combination import do_press_key_combination
+from sentient.utils.cdp_accessibility_tree import resolve_snapshot_node
 from sentient.utils.logger import logger
+from sentient.utils.page_settle import wait_for_page_settle
 
 
 async def enter_text_and_click(
@@ -60,13 +61,15 @@ async def enter_text_and_click(
         logger.error("No active page found")
         raise ValueError("No active page found. OpenURL command opens a new page.")
 
-    await browser_manager.highlight_element(text_selector, True)
+    text_element_selector = await resolve_snapshot_node(page, text_selector)
+    click_element_selector = await resolve_snapshot_node(page, click_selector)
+    await browser_manager.highlight_element(text_element_selector, True)
 
     function_name = inspect.currentframe().f_code.co_name  # type: ignore
     await browser_manager.take_screenshots(f"{function_name}_start", page)
 
     text_entry_result = await do_entertext(
-        page, text_selector, text_to_enter, use_keyboard_fill=True
+        page, text_element_selector, text_to_enter, use_keyboard_fill=True
     )
 
     # await browser_manager.notify_user(text_entry_result["summary_message"])
@@ -99,16 +102,16 @@ async def enter_text_and_click(
                 #     message_type=MessageType.ACTION,
                 # )
         else:
-            await browser_manager.highlight_element(click_selector, True)
+            await browser_manager.highlight_element(click_element_selector, True)
 
             do_click_result = await do_click(
-                page, click_selector, wait_before_click_execution
+                page, click_element_selector, wait_before_click_execution
             )
             result["detailed_message"] += f' {do_click_result["detailed_message"]}'
             
         await page.wait_for_load_state("domcontentloaded") # Wait for DOM content to be loaded after the action
         # await browser_manager.notify_user(do_click_result["summary_message"])
-        await asyncio.sleep(0.5)  # sleep for 1 sec to allow the mutation observer to detect changes
+        await wait_for_page_settle(page, replaced_wait=0.5)  # let the mutation observer detect the changes, replaces a fixed 500ms wait
         await browser_manager.take_screenshots(f"{function_name}_end", page)
         return result["detailed_message"]
     except Exception as e:
@@ -1,4 +1,3 @@
-import asyncio
 import inspect
 import traceback
 from dataclasses import dataclass
@@ -12,9 +11,12 @@ from typing_extensions import Annotated
 
 from sentient.core.web_driver.playwright import PlaywrightManager
 from sentient.core.skills.press_key_combination import press_key_combination
+from sentient.utils.cdp_accessibility_tree import resolve_snapshot_node
 from sentient.utils.dom_helper import get_element_outer_html
 from sentient.utils.dom_mutation_observer import subscribe, unsubscribe
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
+from sentient.utils.page_settle import wait_for_page_settle
 
 
 @dataclass
@@ -63,20 +65,7 @@ async def custom_fill_element(page: Page, selector: str, text_to_enter: str):
     """
     selector = f"{selector}"  # Ensures the selector is treated as a string
     try:
-        result = await page.evaluate(
-            """(inputParams) => {
-            const selector = inputParams.selector;
-            let text_to_enter = inputParams.text_to_enter;
-            text_to_enter = text_to_enter.trim();
-            const element = document.querySelector(selector);
-            if (!element) {
-                throw new Error(`Element not found: ${selector}`);
-            }
-            element.value = text_to_enter;
-            return `Value set for ${selector}`;
-        }""",
-            {"selector": selector, "text_to_enter": text_to_enter},
-        )
+        result = await call_page_runtime(page, "fill", selector, text_to_enter)
         logger.debug(f"custom_fill_element result: {result}")
     except Exception as e:
         logger.error(f"Error in custom_fill_element: {str(e)}")
@@ -150,7 +139,8 @@ async def entertext(
 
     await browser_manager.take_screenshots(f"{function_name}_start", page)
 
-    await browser_manager.highlight_element(query_selector, True)
+    element_selector = await resolve_snapshot_node(page, query_selector)
+    await browser_manager.highlight_element(element_selector, True)
 
     dom_changes_detected = None
 
@@ -165,27 +155,15 @@ async def entertext(
     # logger.info(
     #     f"######### About to page.evaluate: selector={query_selector}, text={text_to_enter}"
     # )
-    await page.evaluate(
-        """
-        (selector) => {
-            const element = document.querySelector(selector);
-            if (element) {
-                element.value = '';
-            } else {
-                console.error('Element not found:', selector);
-            }
-        }
-        """,
-        query_selector,
-    )
+    await call_page_runtime(page, "clearValue", element_selector)
     # logger.info(
     #     f"######### About to call do_entertext with: selector={query_selector}, text={text_to_enter}"
     # )
-    result = await do_entertext(page, query_selector, text_to_enter)
+    result = await do_entertext(page, element_selector, text_to_enter)
     # logger.info(f"#########do_entertext returned: {result}")
-    await asyncio.sleep(
-        0.1
-    )  # sleep for 100ms to allow the mutation observer to detect changes
+    # let the mutation observer detect the changes, replaces a fixed 100ms wait, capped at 1s on pages that never
+    # go quiet (animations, short polling)
+    await wait_for_page_settle(page, quiet_time=0.1, timeout=1.0, replaced_wait=0.1)
     unsubscribe(detect_dom_changes)
 
     await browser_manager.take_screenshots(f"{function_name}_end", page)
@@ -235,13 +213,10 @@ async def do_entertext(
 
         if use_keyboard_fill:
             await elem.focus()
-            await asyncio.sleep(0.1)
+            # every key press waits for the page to settle
             await press_key_combination("Control+A")
-            await asyncio.sleep(0.1)
             await press_key_combination("Backspace")
-            await asyncio.sleep(0.1)
             logger.debug(f"Focused element with selector {selector} to enter text")
-            # add a 100ms delay
             await page.keyboard.type(text_to_enter, delay=1)
         else:
             await custom_fill_element(page, selector, text_to_enter)
@@ -1,22 +1,60 @@
-import os
+import copy
 import time
 from typing import Any, Union, Dict
+from urllib.parse import urldefrag
+from weakref import WeakKeyDictionary
 
 from playwright.async_api import Page
 from typing_extensions import Annotated
 
-from sentient.config.config import SOURCE_LOG_FOLDER_PATH
 from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.cdp_accessibility_tree import do_get_cdp_accessibility_info
+from sentient.utils.debug_artifacts import dump_debug_artifact
 from sentient.utils.dom_helper import wait_for_non_loading_dom_state
-from sentient.utils.get_detailed_accessibility_tree import do_get_accessibility_info
+from sentient.utils.dom_mutation_observer import get_dom_generation
+from sentient.utils.get_detailed_accessibility_tree import (
+    INJECTED_MMIDS,
+    SNAPSHOT_NODE_IDS,
+    do_get_accessibility_info,
+    set_element_id_source,
+)
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
+
+# The last extraction of each content type for every page, keyed by the URL and the DOM generation it was extracted at
+__dom_cache: "WeakKeyDictionary[Page, Dict[Any, Any]]" = WeakKeyDictionary()
+__dom_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_dom_cache_stats() -> Dict[str, int]:
+    """
+    Returns the number of DOM extractions served from the cache (hits) and extracted from the page (misses).
+    """
+    return dict(__dom_cache_stats)
+
+
+def clear_dom_cache():
+    """
+    Forgets the cached extractions and resets the hit and miss counts.
+    """
+    __dom_cache.clear()
+    __dom_cache_stats["hits"] = 0
+    __dom_cache_stats["misses"] = 0
 
 
 async def get_dom_with_content_type(
     content_type: Annotated[
         str,
-        "The type of content to extract: 'text_only': Extracts the innerText of the highest element in the document and responds with text, or 'input_fields': Extracts the text input and button elements in the dom.",
+        "The type of content to extract: 'text_only': Extracts the innerText of the highest element in the document and responds with text, or 'input_fields': Extracts the text input and button elements in the dom, or 'viewport_fields': Extracts the fields in and around the viewport.",
     ],
+    use_cdp_snapshot: Annotated[
+        bool,
+        "Whether to build the DOM from a CDP accessibility tree and DOM snapshot instead of injecting mmid attributes into the page.",
+    ] = False,
+    viewport_margin: Annotated[
+        int,
+        "For 'viewport_fields', the number of pixels above and below the viewport in which elements are still extracted.",
+    ] = 500,
 ) -> Annotated[
     Union[Dict[str, Any], str, None],
     "The output based on the specified content type.",
@@ -31,6 +69,19 @@ async def get_dom_with_content_type(
         - 'text_only': Extracts the innerText of the highest element in the document and responds with text.
         - 'input_fields': Extracts the text input and button elements in the DOM and responds with a JSON object.
         - 'all_fields': Extracts all the fields in the DOM and responds with a JSON object.
+        - 'viewport_fields': Extracts the fields intersecting the viewport and responds with a JSON object that also
+          reports the number of elements above and below the viewport under 'viewport'.
+    use_cdp_snapshot : bool, optional
+        If True, 'input_fields' and 'all_fields' are built from Accessibility.getFullAXTree and DOMSnapshot.captureSnapshot
+        without mutating the page, and elements are identified by their backendNodeId instead of an injected mmid.
+    viewport_margin : int, optional
+        For 'viewport_fields', the number of pixels above and below the viewport in which elements are still extracted.
+        This bounds the size of the output, not the cost of the extraction, which still reads the whole page.
+
+    'input_fields', 'all_fields' and 'viewport_fields' are cached per page: when the URL and the DOM generation of the
+    page (see get_dom_generation) are the same as for the previous extraction, a copy of the previous result is returned
+    without extracting it again. 'viewport_fields' is also extracted again after the page is scrolled or resized.
+    The hit and miss counts are available through get_dom_cache_stats.
 
     Returns
     -------
@@ -38,7 +89,7 @@ async def get_dom_with_content_type(
         The processed content based on the specified content type. This could be:
         - A JSON object for 'input_fields' with just inputs.
         - Plain text for 'text_only'.
-        - A minified DOM represented as a JSON object for 'all_fields'.
+        - A minified DOM represented as a JSON object for 'all_fields' and 'viewport_fields'.
 
     Raises
     ------
@@ -55,34 +106,65 @@ async def get_dom_with_content_type(
         raise ValueError("No active page found. OpenURL command opens a new page.")
 
     extracted_data = None
+    get_accessibility_info = (
+        do_get_cdp_accessibility_info if use_cdp_snapshot else do_get_accessibility_info
+    )
     await wait_for_non_loading_dom_state(
         page, 2000
     )  # wait for the DOM to be ready, non loading means external resources do not need to be loaded
     user_success_message = ""
+    cache_key = None
+    if content_type in ("all_fields", "input_fields", "viewport_fields"):
+        generation = await get_dom_generation(page)
+        if generation is not None:
+            time_origin, dom_generation, viewport_generation = generation
+            cache_key = (urldefrag(page.url)[0], time_origin, dom_generation)
+            if content_type == "viewport_fields":
+                cache_key += (viewport_generation, viewport_margin)
+            cached = __dom_cache.get(page, {}).get((content_type, use_cdp_snapshot))
+            if cached is not None and cached[0] == cache_key:
+                __dom_cache_stats["hits"] += 1
+                # the actions act on the element ids of the cached tree, whichever extraction ran since
+                set_element_id_source(
+                    page, SNAPSHOT_NODE_IDS if use_cdp_snapshot else INJECTED_MMIDS
+                )
+                logger.info(
+                    f"DOM unchanged since the last extraction, using the cached {content_type} ({__dom_cache_stats['hits']} hits, {__dom_cache_stats['misses']} misses)"
+                )
+                return copy.deepcopy(cached[1])
+        __dom_cache_stats["misses"] += 1
+
     if content_type == "all_fields":
         user_success_message = "Fetched all the fields in the DOM"
-        extracted_data = await do_get_accessibility_info(page, only_input_fields=False)
+        extracted_data = await get_accessibility_info(page, only_input_fields=False)
     elif content_type == "input_fields":
         logger.debug("Fetching DOM for input_fields")
-        extracted_data = await do_get_accessibility_info(page, only_input_fields=True)
+        extracted_data = await get_accessibility_info(page, only_input_fields=True)
         if extracted_data is None:
             return "Could not fetch input fields. Please consider trying with content_type all_fields."
         user_success_message = "Fetched only input fields in the DOM"
+    elif content_type == "viewport_fields":
+        logger.debug("Fetching DOM for viewport_fields")
+        extracted_data = await get_accessibility_info(
+            page, only_input_fields=False, viewport_margin=viewport_margin
+        )
+        user_success_message = "Fetched the fields in the viewport"
     elif content_type == "text_only":
         # Extract text from the body or the highest-level element
         logger.debug("Fetching DOM for text_only")
         text_content = await get_filtered_text_content(page)
-        with open(
-            os.path.join(SOURCE_LOG_FOLDER_PATH, "text_only_dom.txt"),
-            "w",
-            encoding="utf-8",
-        ) as f:
-            f.write(text_content)
+        dump_debug_artifact("text_only_dom.txt", text_content)
         extracted_data = text_content
         user_success_message = "Fetched the text content of the DOM"
     else:
         raise ValueError(f"Unsupported content_type: {content_type}")
 
+    if cache_key is not None and isinstance(extracted_data, dict):
+        __dom_cache.setdefault(page, {})[(content_type, use_cdp_snapshot)] = (
+            cache_key,
+            copy.deepcopy(extracted_data),
+        )
+
     elapsed_time = time.time() - start_time
     logger.info(f"Get DOM Command executed in {elapsed_time} seconds")
     # await browser_manager.notify_user(
@@ -92,36 +174,6 @@ async def get_dom_with_content_type(
 
 
 async def get_filtered_text_content(page: Page) -> str:
-    text_content = await page.evaluate("""
-        () => {
-            // Array of query selectors to filter out
-            const selectorsToFilter = ['#agente-overlay'];
-
-            // Store the original visibility values to revert later
-            const originalStyles = [];
-
-            // Hide the elements matching the query selectors
-            selectorsToFilter.forEach(selector => {
-                const elements = document.querySelectorAll(selector);
-                elements.forEach(element => {
-                    originalStyles.push({ element: element, originalStyle: element.style.visibility });
-                    element.style.visibility = 'hidden';
-                });
-            });
-
-            // Get the text content of the page
-            let textContent = document?.body?.innerText || document?.documentElement?.innerText || "";
-
-            // Get all the alt text from images on the page
-            let altTexts = Array.from(document.querySelectorAll('img')).map(img => img.alt);
-            altTexts="Other Alt Texts in the page: " + altTexts.join(' ');
-
-            // Revert the visibility changes
-            originalStyles.forEach(entry => {
-                entry.element.style.visibility = entry.originalStyle;
-            });
-            textContent=textContent+" "+altTexts;
-            return textContent;
-        }
-    """)
+    # Elements filtered out of the text, e.g. the overlay
+    text_content = await call_page_runtime(page, "textContent", ["#agente-overlay"])
     return text_content
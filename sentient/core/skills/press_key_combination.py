@@ -1,4 +1,3 @@
-import asyncio
 import inspect
 
 from playwright.async_api import Page  # type: ignore
@@ -10,6 +9,7 @@ from sentient.utils.dom_mutation_observer import (
     unsubscribe,  # type: ignore
 )
 from sentient.utils.logger import logger
+from sentient.utils.page_settle import wait_for_page_settle
 
 
 async def press_key_combination(
@@ -60,9 +60,9 @@ async def press_key_combination(
     # Release the modifier keys
     for key in keys[:-1]:
         await page.keyboard.up(key)
-    await asyncio.sleep(
-        0.1
-    )  # sleep for 100ms to allow the mutation observer to detect changes
+    # let the mutation observer detect the changes, replaces a fixed 100ms wait, capped at 1s on pages that never
+    # go quiet (animations, short polling)
+    await wait_for_page_settle(page, quiet_time=0.1, timeout=1.0, replaced_wait=0.1)
     unsubscribe(detect_dom_changes)
 
     if dom_changes_detected:
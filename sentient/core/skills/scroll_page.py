@@ -0,0 +1,45 @@
+from typing_extensions import Annotated
+
+from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
+from sentient.utils.page_settle import wait_for_page_settle
+
+
+async def scroll(
+    direction: Annotated[str, "The direction to scroll the page in, 'up' or 'down'."],
+    fraction: Annotated[
+        float, "How much of the viewport height to scroll by, e.g. 0.8."
+    ] = 0.8,
+) -> Annotated[str, "A message describing the outcome of the scroll."]:
+    """
+    Scrolls the current page by a fraction of the viewport, so that the next 'viewport_fields' extraction returns the
+    next window of elements. A scrollable container under the middle of the viewport (e.g. a feed) is scrolled instead
+    of the page when there is one.
+
+    Parameters:
+    - direction: 'up' or 'down'.
+    - fraction: How much of the viewport height to scroll by. Defaults to 0.8, so consecutive windows overlap.
+
+    Returns:
+    - A message describing how far the page was scrolled and how much of it is left in that direction.
+    """
+    logger.info(f"Executing scroll {direction}")
+    if direction not in ("up", "down"):
+        raise ValueError(f"Unsupported scroll direction: {direction}")
+
+    browser_manager = PlaywrightManager(browser_type="chromium", headless=False)
+    page = await browser_manager.get_current_page()
+    if page is None:  # type: ignore
+        raise ValueError("No active page found. OpenURL command opens a new page.")
+
+    result = await call_page_runtime(page, "scroll", direction, fraction)
+    # let content that loads on scroll (e.g. infinite feeds) render, capped at 1s on pages that never go quiet
+    await wait_for_page_settle(page, quiet_time=0.1, timeout=1.0, replaced_wait=0.1)
+
+    if result["scrolled"] == 0:
+        return f"Could not scroll {direction}, already at the {'top' if direction == 'up' else 'bottom'} of the page."
+    remaining = (
+        result["remaining_above"] if direction == "up" else result["remaining_below"]
+    )
+    return f"Scrolled {direction} by {abs(result['scrolled'])} pixels, {remaining} pixels left in that direction."
@@ -0,0 +1,122 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Set
+
+from playwright.async_api import Browser, BrowserContext
+
+from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.core.web_driver.session import (
+    reset_session_browser_context,
+    set_session_browser_context,
+)
+from sentient.utils.logger import logger
+
+
+class BrowserContextPool:
+    """
+    A bounded pool of isolated browser contexts, to run several sessions (e.g. several goals) concurrently in one
+    browser. Every session gets a new context, with its own pages, cookies and storage, which is closed when the
+    session ends. At most `size` sessions run at the same time, the others wait for one of them to end.
+    """
+
+    def __init__(self, size: int = 4, browser: Optional[Browser] = None):
+        """
+        Args:
+            size (int, optional): The maximum number of contexts open at the same time. Defaults to 4.
+            browser (Optional[Browser], optional): The browser to create the contexts in. Defaults to the browser of
+                the PlaywrightManager.
+        """
+        if size < 1:
+            raise ValueError("The size of the pool must be at least 1")
+        self.size = size
+        self._browser = browser
+        # created in the event loop of the first session: on Python 3.9 a semaphore is bound to the loop current when
+        # it is created, which may not be the loop the sessions run in (e.g. the loop of aiohttp.web.run_app)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._contexts: Set[BrowserContext] = set()
+
+    async def start(self):
+        """
+        Launches (or connects to) the browser right away instead of on the first session, so that the first session
+        does not pay for it.
+        """
+        self._get_semaphore()
+        if self._browser is None:
+            self._browser = await PlaywrightManager().get_browser()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        return self._semaphore
+
+    async def acquire(self) -> BrowserContext:
+        """
+        Waits for a free slot in the pool and returns a new browser context, set up like the context of the
+        PlaywrightManager (page runtime, network tracking).
+        """
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            if self._browser is None:
+                self._browser = await PlaywrightManager().get_browser()
+            browser_context = await self._browser.new_context(no_viewport=True)
+            await PlaywrightManager.setup_browser_context(browser_context, session=True)
+        except Exception:
+            semaphore.release()
+            raise
+        self._contexts.add(browser_context)
+        logger.debug(
+            f"Opened a browser context, {len(self._contexts)} of {self.size} in use"
+        )
+        return browser_context
+
+    async def release(self, browser_context: BrowserContext):
+        """
+        Closes a browser context returned by acquire and frees its slot in the pool.
+        """
+        if browser_context not in self._contexts:
+            return
+        self._contexts.discard(browser_context)
+        try:
+            await browser_context.close()
+        except Exception as e:
+            logger.warning(f"Could not close the browser context: {e}")
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def session(
+        self, go_to_homepage: bool = True
+    ) -> AsyncIterator[BrowserContext]:
+        """
+        Runs the code in the block in a browser context of the pool: the skills called from the current asyncio task,
+        and from the tasks it starts, use the pages of that context instead of the context of the PlaywrightManager.
+
+        Args:
+            go_to_homepage (bool, optional): Whether the first page of the context opens the homepage, otherwise it
+                stays blank until the agent navigates. Defaults to True.
+
+        Example:
+            async with pool.session():
+                await orchestrator.execute_command(goal)
+        """
+        browser_context = await self.acquire()
+        token = set_session_browser_context(browser_context)
+        try:
+            page = await browser_context.new_page()
+            if go_to_homepage:
+                try:
+                    await page.goto(PlaywrightManager._homepage, timeout=10000)
+                except Exception as e:
+                    logger.error(f"Failed to navigate to homepage: {e}")
+            yield browser_context
+        finally:
+            reset_session_browser_context(token)
+            await self.release(browser_context)
+
+    async def close(self):
+        """
+        Closes all the browser contexts still open.
+        """
+        for browser_context in list(self._contexts):
+            await self.release(browser_context)
@@ -2,14 +2,16 @@ import tempfile
 import time
 from typing import List, Union
 
-from playwright.async_api import BrowserContext, Page, Playwright
+from playwright.async_api import Browser, BrowserContext, Page, Playwright
 from playwright.async_api import async_playwright as playwright
 
 from sentient.utils.dom_mutation_observer import (
-    dom_mutation_change_detected,
-    handle_navigation_for_mutation_observer,
+    install_mutation_observer,
 )
+from sentient.core.web_driver.session import get_session_browser_context
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import install_page_runtime
+from sentient.utils.page_settle import track_network_activity
 from sentient.utils.ui_messagetype import MessageType
 
 # TODO - Create a wrapper browser manager class that either starts a playwright manager (our solution) or a hosted browser manager like browserbase
@@ -18,6 +20,7 @@ from sentient.utils.ui_messagetype import MessageType
 class PlaywrightManager:
     _homepage = "https://google.com"
     _playwright = None
+    _browser = None
     _browser_context = None
     __async_initialize_done = False
     _instance = None
@@ -113,6 +116,10 @@ class PlaywrightManager:
             await PlaywrightManager._browser_context.close()
             PlaywrightManager._browser_context = None
 
+        if PlaywrightManager._browser is not None:
+            await PlaywrightManager._browser.close()
+            PlaywrightManager._browser = None
+
         # Stop the Playwright instance if it's initialized
         if PlaywrightManager._playwright is not None:  # type: ignore
             await PlaywrightManager._playwright.stop()
@@ -188,17 +195,12 @@ class PlaywrightManager:
                 browser = await PlaywrightManager._playwright.chromium.connect_over_cdp(
                     "http://localhost:9222"
                 )
+                PlaywrightManager._browser = browser
                 PlaywrightManager._browser_context = browser.contexts[0]
 
-            # Additional step to modify the navigator.webdriver property
-            pages = PlaywrightManager._browser_context.pages
-            for page in pages:
-                # await stealth_async(page)  # Apply stealth to each page
-                await page.add_init_script("""
-                    Object.defineProperty(navigator, 'webdriver', {
-                        get: () => undefined
-                    })
-                """)
+            await PlaywrightManager.setup_browser_context(
+                PlaywrightManager._browser_context
+            )
 
         except Exception as e:
             if "Target page, context or browser has been closed" in str(e):
@@ -220,6 +222,9 @@ class PlaywrightManager:
                     ],
                     no_viewport=True,
                 )
+                await PlaywrightManager.setup_browser_context(
+                    PlaywrightManager._browser_context
+                )
                 # # Apply stealth to the new context
                 # for page in PlaywrightManager._browser_context.pages:
                 #     await stealth_async(page)
@@ -230,10 +235,62 @@ class PlaywrightManager:
             else:
                 raise e from None
 
+    @staticmethod
+    async def setup_browser_context(
+        browser_context: BrowserContext, session: bool = False
+    ):
+        """
+        Prepares a browser context for the skills: installs the page runtime and the mutation observer, tracks the
+        network activity of its pages and hides the navigator.webdriver property.
+
+        Args:
+            browser_context (BrowserContext): The browser context.
+            session (bool, optional): Whether the context is the context of a session of a BrowserContextPool, whose
+                DOM changes go to the callbacks subscribed from that session only. Defaults to False.
+        """
+        await install_page_runtime(browser_context)
+        await install_mutation_observer(browser_context, session=session)
+        track_network_activity(browser_context)
+        # await stealth_async(page)  # Apply stealth to each page
+        await browser_context.add_init_script("""
+            Object.defineProperty(navigator, 'webdriver', {
+                get: () => undefined
+            })
+        """)
+
+    async def get_browser(self) -> Browser:
+        """
+        Returns the browser the session contexts are created in (see BrowserContextPool): the Chrome instance
+        connected over CDP, or a new Chrome instance in eval mode.
+        """
+        await self.start_playwright()
+        if PlaywrightManager._browser is None:
+            if getattr(self, "eval_mode", False):
+                PlaywrightManager._browser = await PlaywrightManager._playwright.chromium.launch(
+                    channel="chrome",
+                    headless=self.isheadless,
+                    args=[
+                        "--disable-blink-features=AutomationControlled",
+                        "--disable-session-crashed-bubble",  # disable the restore session bubble
+                        "--disable-infobars",  # disable informational popups,
+                    ],
+                )
+            else:
+                PlaywrightManager._browser = (
+                    await PlaywrightManager._playwright.chromium.connect_over_cdp(
+                        "http://localhost:9222"
+                    )
+                )
+        return PlaywrightManager._browser
+
     async def get_browser_context(self):
         """
-        Returns the existing browser context, or creates a new one if it doesn't exist.
+        Returns the browser context of the session running in the current asyncio task if there is one (see
+        BrowserContextPool.session), otherwise the existing browser context, or creates a new one if it doesn't exist.
         """
+        session_browser_context = get_session_browser_context()
+        if session_browser_context is not None:
+            return session_browser_context
         await self.ensure_browser_context()
         return self._browser_context
 
@@ -320,10 +377,7 @@ class PlaywrightManager:
     async def set_navigation_handler(self):
         page: Page = await PlaywrightManager.get_current_page(self)
         page.on("domcontentloaded", self.ui_manager.handle_navigation)  # type: ignore
-        page.on("domcontentloaded", handle_navigation_for_mutation_observer)  # type: ignore
-        await page.expose_function(
-            "dom_mutation_change_detected", dom_mutation_change_detected
-        )  # type: ignore
+        # the mutation observer and its binding are installed in the whole context by setup_browser_context
 
     async def set_overlay_state_handler(self):
         logger.debug("Setting overlay state handler")
@@ -0,0 +1,36 @@
+import contextvars
+from typing import Optional
+
+from playwright.async_api import BrowserContext
+
+# The browser context of the session running in the current asyncio task (see BrowserContextPool.session).
+# Outside of a session, PlaywrightManager uses its own process-wide browser context.
+__session_browser_context: contextvars.ContextVar[Optional[BrowserContext]] = (
+    contextvars.ContextVar("session_browser_context", default=None)
+)
+
+
+def get_session_browser_context() -> Optional[BrowserContext]:
+    """
+    Returns the browser context of the session running in the current asyncio task, or None outside of a session.
+    """
+    return __session_browser_context.get()
+
+
+def set_session_browser_context(
+    browser_context: Optional[BrowserContext],
+) -> contextvars.Token:
+    """
+    Makes the skills run in the current asyncio task (and in the tasks it starts) use the given browser context.
+
+    Args:
+        browser_context (Optional[BrowserContext]): The browser context of the session.
+
+    Returns:
+        contextvars.Token: The token to pass to reset_session_browser_context when the session ends.
+    """
+    return __session_browser_context.set(browser_context)
+
+
+def reset_session_browser_context(token: contextvars.Token):
+    __session_browser_context.reset(token)
@@ -0,0 +1,530 @@
+import re
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+from playwright.async_api import CDPSession, Page
+
+from sentient.utils.get_detailed_accessibility_tree import (
+    ELEMENT_INFO_PARAMS,
+    SNAPSHOT_NODE_IDS,
+    get_element_id_source,
+    reconcile_accessibility_tree,
+    set_element_id_source,
+)
+from sentient.utils.logger import logger
+from sentient.utils.tracing import trace_span
+
+mmid_selector = re.compile(r"^\[mmid=['\"]?(\d+)['\"]?\]$")
+# The attribute an element of a snapshot tree gets when it is acted upon, kept apart from the injected mmids so that
+# a backendNodeId can never select an element that an earlier extraction tagged with the same number
+SNAPSHOT_NODE_ATTRIBUTE = "data-sentient-bnid"
+
+# roles that only group other nodes, their children are lifted to their parent unless they are named or focusable
+UNINTERESTING_ROLES = ("generic", "none", "presentation", "InlineTextBox")
+ROLE_NAMES = {"RootWebArea": "WebArea", "StaticText": "text"}
+AX_PROPERTIES = (
+    "autocomplete",
+    "checked",
+    "disabled",
+    "expanded",
+    "focused",
+    "haspopup",
+    "invalid",
+    "level",
+    "modal",
+    "multiline",
+    "multiselectable",
+    "orientation",
+    "pressed",
+    "readonly",
+    "required",
+    "selected",
+    "valuemax",
+    "valuemin",
+)
+ELEMENT_NODE = 1
+TEXT_NODE = 3
+TAGS_WITHOUT_TEXT = ("script", "style", "noscript", "template")
+
+__cdp_sessions: "WeakKeyDictionary[Page, CDPSession]" = WeakKeyDictionary()
+
+
+class DomSnapshotIndex:
+    """
+    Index over the flattened documents returned by DOMSnapshot.captureSnapshot, to look up elements by backendNodeId.
+    """
+
+    def __init__(self, snapshot: Dict[str, Any]):
+        self.strings: List[str] = snapshot["strings"]
+        self.documents: List[Dict[str, Any]] = []
+        self.nodes_by_backend_id: Dict[int, Tuple[int, int]] = {}
+
+        for document_index, document in enumerate(snapshot["documents"]):
+            nodes = document["nodes"]
+            parent_indexes: List[int] = nodes.get("parentIndex", [])
+            children: List[List[int]] = [[] for _ in parent_indexes]
+            for node_index, parent_index in enumerate(parent_indexes):
+                if parent_index >= 0:
+                    children[parent_index].append(node_index)
+            layout = document.get("layout", {})
+            self.documents.append(
+                {
+                    "nodes": nodes,
+                    "children": children,
+                    "selected_options": set(
+                        nodes.get("optionSelected", {}).get("index", [])
+                    ),
+                    "bounds": dict(
+                        zip(layout.get("nodeIndex", []), layout.get("bounds", []))
+                    ),
+                }
+            )
+            for node_index, backend_node_id in enumerate(
+                nodes.get("backendNodeId", [])
+            ):
+                self.nodes_by_backend_id[backend_node_id] = (document_index, node_index)
+
+    def __string(self, string_index: int) -> Optional[str]:
+        return self.strings[string_index] if string_index >= 0 else None
+
+    def node_type(self, node: Tuple[int, int]) -> int:
+        document_index, node_index = node
+        return self.documents[document_index]["nodes"]["nodeType"][node_index]
+
+    def tag_name(self, node: Tuple[int, int]) -> str:
+        document_index, node_index = node
+        string_index = self.documents[document_index]["nodes"]["nodeName"][node_index]
+        return (self.__string(string_index) or "").lower()
+
+    def backend_node_id(self, node: Tuple[int, int]) -> int:
+        document_index, node_index = node
+        return self.documents[document_index]["nodes"]["backendNodeId"][node_index]
+
+    def attributes(self, node: Tuple[int, int]) -> Dict[str, str]:
+        document_index, node_index = node
+        flat_attributes = self.documents[document_index]["nodes"]["attributes"][
+            node_index
+        ]
+        return {
+            self.__string(flat_attributes[i]): self.__string(flat_attributes[i + 1])
+            or ""
+            for i in range(0, len(flat_attributes) - 1, 2)
+        }
+
+    def children(self, node: Tuple[int, int]) -> List[Tuple[int, int]]:
+        document_index, node_index = node
+        return [
+            (document_index, child_index)
+            for child_index in self.documents[document_index]["children"][node_index]
+        ]
+
+    def element_children(self, node: Tuple[int, int]) -> List[Tuple[int, int]]:
+        return [
+            child
+            for child in self.children(node)
+            if self.node_type(child) == ELEMENT_NODE
+        ]
+
+    def is_option_selected(self, node: Tuple[int, int]) -> bool:
+        document_index, node_index = node
+        return node_index in self.documents[document_index]["selected_options"]
+
+    def viewport_position(
+        self, backend_node_id: int, viewport_top: float, viewport_bottom: float
+    ) -> Optional[str]:
+        """
+        Tells whether an element is entirely above or below the given vertical range, in page coordinates.
+
+        Returns:
+            str | None: 'above' or 'below', or None if the element intersects the range or has no layout box.
+        """
+        node = self.nodes_by_backend_id.get(backend_node_id)
+        if node is None:
+            return None
+        document_index, node_index = node
+        bounds = self.documents[document_index]["bounds"].get(node_index)
+        if not bounds:
+            return None
+        _, top, _, height = bounds
+        if top + height < viewport_top:
+            return "above"
+        if top > viewport_bottom:
+            return "below"
+        return None
+
+    def text(self, node: Tuple[int, int]) -> str:
+        """
+        Approximates innerText with the text of all the descendant text nodes, since layout is not part of the snapshot.
+        """
+        texts: List[str] = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            node_type = self.node_type(current)
+            if node_type == TEXT_NODE:
+                document_index, node_index = current
+                value = self.__string(
+                    self.documents[document_index]["nodes"]["nodeValue"][node_index]
+                )
+                if value and value.strip():
+                    texts.append(" ".join(value.split()))
+            elif (
+                node_type == ELEMENT_NODE
+                and self.tag_name(current) in TAGS_WITHOUT_TEXT
+            ):
+                continue
+            stack.extend(reversed(self.children(current)))
+        return " ".join(texts)
+
+    def element_info(
+        self,
+        backend_node_id: int,
+        should_fetch_inner_text: bool,
+        input_params: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Mirrors the in-page getElementInfo of the mmid based extractor, reading the snapshot instead of the live DOM.
+        The backendNodeId of an element stands in for its mmid.
+        """
+        node = self.nodes_by_backend_id.get(backend_node_id)
+        if node is None or self.node_type(node) != ELEMENT_NODE:
+            logger.debug(f"No element found with backend node id: {backend_node_id}")
+            return None
+
+        attributes = self.attributes(node)
+        attributes["mmid"] = str(backend_node_id)
+        tag_name = self.tag_name(node)
+        if attributes.get("id") in input_params["ids_to_ignore"]:
+            return None
+        # Ignore "option" because it would have been processed with the select element
+        if tag_name in input_params["tags_to_ignore"] or tag_name == "option":
+            return None
+
+        attributes_to_values: Dict[str, Any] = {"tag": tag_name}
+
+        if tag_name == "input":
+            attributes_to_values["tag_type"] = attributes.get("type", "text").lower()
+        elif tag_name == "select":
+            attributes_to_values["mmid"] = str(backend_node_id)
+            attributes_to_values["role"] = "combobox"
+            attributes_to_values["options"] = []
+            stack = list(reversed(self.element_children(node)))
+            while stack:
+                option = stack.pop()
+                if self.tag_name(option) == "optgroup":
+                    stack.extend(reversed(self.element_children(option)))
+                    continue
+                if self.tag_name(option) != "option":
+                    continue
+                option_text = self.text(option)
+                attributes_to_values["options"].append(
+                    {
+                        "mmid": str(self.backend_node_id(option)),
+                        "text": option_text,
+                        "value": self.attributes(option).get("value", option_text),
+                        "selected": self.is_option_selected(option),
+                    }
+                )
+            return attributes_to_values
+
+        for attribute in input_params["attributes"]:
+            value = attributes.get(attribute)
+            if value:
+                attributes_to_values[attribute] = value
+
+        inner_text = (
+            self.text(node) if should_fetch_inner_text or tag_name == "button" else ""
+        )
+        if should_fetch_inner_text and inner_text:
+            attributes_to_values["description"] = inner_text
+
+        if attributes.get("role") == "listbox" or tag_name == "ul":
+            attributes_to_values["additional_info"] = []
+            for child in self.element_children(node):
+                child_attributes = self.attributes(child)
+                child_attributes["mmid"] = str(self.backend_node_id(child))
+                attributes_to_values["additional_info"].append(
+                    {
+                        name: value
+                        for name, value in child_attributes.items()
+                        if name in ("mmid", "role", "aria-label", "value")
+                    }
+                )
+
+        minimal_keys = ("tag", "mmid")
+        if len(attributes_to_values) <= len(minimal_keys) and all(
+            key in minimal_keys for key in attributes_to_values
+        ):
+            # If there were no attributes found, then try to get the backup attributes
+            for backup_attribute in input_params["backup_attributes"]:
+                value = attributes.get(backup_attribute)
+                if value:
+                    attributes_to_values[backup_attribute] = value
+
+            if len(attributes_to_values) <= len(minimal_keys):
+                if tag_name == "button":
+                    attributes_to_values["mmid"] = str(backend_node_id)
+                    attributes_to_values["role"] = "button"
+                    attributes_to_values["additional_info"] = []
+                    # Check if the button has no text and no attributes
+                    if inner_text.strip() == "":
+                        for child in self.element_children(node):
+                            attributes_to_values["additional_info"].append(
+                                {
+                                    name: value
+                                    for name, value in self.attributes(child).items()
+                                    if name
+                                    not in (
+                                        "width",
+                                        "height",
+                                        "path",
+                                        "class",
+                                        "viewBox",
+                                        "mmid",
+                                    )
+                                }
+                            )
+                        return attributes_to_values
+
+                return None  # Return None if only minimal keys are present
+        return attributes_to_values
+
+
+def build_accessibility_tree(
+    ax_nodes: List[Dict[str, Any]], dom_index: DomSnapshotIndex
+) -> Optional[Dict[str, Any]]:
+    """
+    Builds a tree shaped like Playwright's interesting-only accessibility snapshot from the flat list of nodes returned
+    by Accessibility.getFullAXTree. Ignored and purely structural nodes are dropped and their children lifted to their
+    parent. Nodes backed by an element carry its backendNodeId in 'keyshortcuts', the same way the injected mmid is
+    surfaced by the mmid based extractor.
+
+    Args:
+        ax_nodes (List[Dict[str, Any]]): The nodes returned by Accessibility.getFullAXTree.
+        dom_index (DomSnapshotIndex): The index of the DOM snapshot taken alongside.
+
+    Returns:
+        Dict[str, Any] | None: The root node of the accessibility tree or None if the tree is empty.
+    """
+    if not ax_nodes:
+        return None
+
+    ax_nodes_by_id = {ax_node["nodeId"]: ax_node for ax_node in ax_nodes}
+    root_ax_node = next(
+        (ax_node for ax_node in ax_nodes if not ax_node.get("parentId")), ax_nodes[0]
+    )
+    root: Dict[str, Any] = {"role": "WebArea", "name": ""}
+    built_nodes: List[Dict[str, Any]] = []
+
+    # pre-order traversal, so that children are appended to their (possibly lifted) parent in document order
+    stack: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]] = [
+        (root_ax_node, None)
+    ]
+    while stack:
+        ax_node, parent = stack.pop()
+        role = ROLE_NAMES.get(
+            ax_node.get("role", {}).get("value"), ax_node.get("role", {}).get("value")
+        )
+        name = ax_node.get("name", {}).get("value") or ""
+        properties = {
+            ax_property["name"]: ax_property.get("value", {}).get("value")
+            for ax_property in ax_node.get("properties", [])
+        }
+
+        target = parent
+        if parent is None:
+            target = root
+            root["role"] = role or "WebArea"
+            root["name"] = name
+        elif not ax_node.get("ignored") and (
+            role not in UNINTERESTING_ROLES or name or properties.get("focusable")
+        ):
+            node: Dict[str, Any] = {"role": role, "name": name}
+            value = ax_node.get("value", {}).get("value")
+            if value not in (None, ""):
+                node["value"] = value
+            description = ax_node.get("description", {}).get("value")
+            if description:
+                node["description"] = description
+            for property_name in AX_PROPERTIES:
+                property_value = properties.get(property_name)
+                if property_value not in (None, False, "", "false"):
+                    node[property_name] = property_value
+
+            backend_node_id = ax_node.get("backendDOMNodeId")
+            dom_node = dom_index.nodes_by_backend_id.get(backend_node_id)
+            if dom_node is not None and dom_index.node_type(dom_node) == ELEMENT_NODE:
+                node["keyshortcuts"] = str(backend_node_id)
+
+            parent.setdefault("children", []).append(node)
+            built_nodes.append(node)
+            target = node
+
+        if role == "InlineTextBox":
+            continue
+        for child_id in reversed(ax_node.get("childIds", [])):
+            child = ax_nodes_by_id.get(child_id)
+            if child is not None:
+                stack.append((child, target))
+
+    # text that only repeats the name of its parent (e.g. the label of a link or a button) adds nothing
+    for node in [root] + built_nodes:
+        if "children" not in node:
+            continue
+        if node.get("name"):
+            node["children"] = [
+                child
+                for child in node["children"]
+                if not (
+                    child.get("role") == "text"
+                    and "children" not in child
+                    and child.get("name", "") in node["name"]
+                )
+            ]
+        if not node["children"]:
+            del node["children"]
+
+    return root
+
+
+async def __get_cdp_session(page: Page) -> CDPSession:
+    cdp_session = __cdp_sessions.get(page)
+    if cdp_session is None:
+        cdp_session = await page.context.new_cdp_session(page)
+        __cdp_sessions[page] = cdp_session
+    return cdp_session
+
+
+async def do_get_cdp_accessibility_info(
+    page: Page, only_input_fields: bool = False, viewport_margin: Optional[int] = None
+):
+    """
+    Retrieves the accessibility information of a web page through the Chrome DevTools Protocol, without mutating the page.
+    The accessibility tree (Accessibility.getFullAXTree) is joined with a DOM snapshot (DOMSnapshot.captureSnapshot)
+    on backendNodeId, which is used as the mmid of each element.
+
+    Args:
+        page (Page): The page object representing the web page.
+        only_input_fields (bool, optional): If True, only retrieves accessibility information for input fields.
+            Defaults to False.
+        viewport_margin (Optional[int], optional): If set, only the elements intersecting the viewport extended by
+            this many pixels above and below are kept, and the number of elements left out is reported under
+            'viewport'. Only the output is bounded: the accessibility tree and the DOM snapshot still cover the whole
+            page. Defaults to None, which keeps the whole page.
+
+    Returns:
+        Dict[str, Any] or None: The enhanced accessibility tree as a dictionary, or None if an error occurred.
+    """
+    try:
+        cdp_session = await __get_cdp_session(page)
+        with trace_span("dom.snapshot", source="cdp") as span:
+            ax_tree = await cdp_session.send("Accessibility.getFullAXTree")
+            snapshot = await cdp_session.send(
+                "DOMSnapshot.captureSnapshot", {"computedStyles": []}
+            )
+            dom_index = DomSnapshotIndex(snapshot)
+            accessibility_tree = build_accessibility_tree(
+                ax_tree.get("nodes", []), dom_index
+            )
+            span.set(ax_nodes=len(ax_tree.get("nodes", [])))
+        if accessibility_tree is None:
+            return None
+
+        viewport_range = None
+        if viewport_margin is not None:
+            # the layout bounds of the snapshot are in page coordinates
+            layout_metrics = await cdp_session.send("Page.getLayoutMetrics")
+            viewport = layout_metrics["cssLayoutViewport"]
+            viewport_range = (
+                viewport["pageY"] - viewport_margin,
+                viewport["pageY"] + viewport["clientHeight"] + viewport_margin,
+            )
+
+        async def fetch_elements_info(requests: List[Dict[str, Any]]):
+            elements_info = []
+            for request in requests:
+                viewport_position = (
+                    dom_index.viewport_position(request["mmid"], *viewport_range)
+                    if viewport_range
+                    else None
+                )
+                elements_info.append(
+                    {"viewport_position": viewport_position}
+                    if viewport_position
+                    else dom_index.element_info(
+                        request["mmid"],
+                        request["should_fetch_inner_text"],
+                        ELEMENT_INFO_PARAMS,
+                    )
+                )
+            return elements_info
+
+        enhanced_tree = await reconcile_accessibility_tree(
+            accessibility_tree,
+            only_input_fields,
+            fetch_elements_info,
+            in_viewport_only=viewport_margin is not None,
+        )
+        set_element_id_source(page, SNAPSHOT_NODE_IDS)
+        logger.debug("Enhanced Accessibility Tree ready from the CDP snapshot")
+        return enhanced_tree
+    except Exception as e:
+        logger.error(f"Error while fetching the CDP snapshot: {e}")
+        traceback.print_exc()
+        __cdp_sessions.pop(page, None)
+        return None
+
+
+async def resolve_snapshot_node(page: Page, selector: str) -> str:
+    """
+    Makes an mmid selector usable on a page whose elements were identified by backendNodeId in a CDP snapshot.
+    The element with that backendNodeId is resolved through the Chrome DevTools Protocol and gets the
+    SNAPSHOT_NODE_ATTRIBUTE attribute, so that only the element that is acted upon is tagged, and never with an
+    attribute the mmid based extractor injects. Does nothing when the last tree extracted from the page has injected
+    mmids, even if an earlier one came from a snapshot.
+
+    Args:
+        page (Page): The Playwright page instance.
+        selector (str): The selector the action was given, e.g. [mmid='114'].
+
+    Returns:
+        str: The selector to act on, e.g. [data-sentient-bnid='114'], or the given selector if it does not refer to
+            an element of a snapshot.
+    """
+    if get_element_id_source(page) != SNAPSHOT_NODE_IDS:
+        return selector
+    match = mmid_selector.fullmatch(selector.strip())
+    if not match:
+        return selector
+
+    backend_node_id = int(match.group(1))
+    # even if the node cannot be resolved, the action must not fall back to an element with that mmid
+    snapshot_selector = f"[{SNAPSHOT_NODE_ATTRIBUTE}='{backend_node_id}']"
+    try:
+        cdp_session = await __get_cdp_session(page)
+        resolved_node = await cdp_session.send(
+            "DOM.resolveNode", {"backendNodeId": backend_node_id}
+        )
+        object_id = resolved_node["object"]["objectId"]
+        await cdp_session.send(
+            "Runtime.callFunctionOn",
+            {
+                "objectId": object_id,
+                "functionDeclaration": """function(attribute, id) {
+                    document.querySelectorAll(`[${attribute}="${id}"]`).forEach(element => {
+                        if (element !== this) element.removeAttribute(attribute);
+                    });
+                    this.setAttribute(attribute, id);
+                }""",
+                "arguments": [
+                    {"value": SNAPSHOT_NODE_ATTRIBUTE},
+                    {"value": str(backend_node_id)},
+                ],
+            },
+        )
+        await cdp_session.send("Runtime.releaseObject", {"objectId": object_id})
+        logger.debug(f"Resolved backend node {backend_node_id} for selector {selector}")
+    except Exception as e:
+        logger.warning(f"Could not resolve backend node {backend_node_id}: {e}")
+    return snapshot_selector
@@ -0,0 +1,214 @@
+import atexit
+import contextvars
+import gzip
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from sentient.config.config import (
+    SOURCE_LOG_FOLDER_PATH,
+    env_bool,
+    env_int,
+    env_str,
+    override_config,
+)
+from sentient.utils.logger import logger
+
+# Debug artifacts (e.g. the accessibility tree of every step) are off by default and configured from the environment:
+#   SENTIENT_DEBUG_ARTIFACTS=1                 write the artifacts
+#   SENTIENT_DEBUG_ARTIFACTS_DIR=<path>        where to write them, defaults to log_files/debug_artifacts
+#   SENTIENT_DEBUG_ARTIFACTS_COMPRESS=1        gzip the files
+#   SENTIENT_DEBUG_ARTIFACTS_RETENTION=<n>     number of files kept per session, defaults to 100
+#   SENTIENT_DEBUG_ARTIFACTS_MAX_SESSIONS=<n>  number of session folders kept, defaults to 20
+# or with configure_debug_artifacts.
+__config: Dict[str, Any] = {
+    "enabled": env_bool("SENTIENT_DEBUG_ARTIFACTS"),
+    "directory": env_str(
+        "SENTIENT_DEBUG_ARTIFACTS_DIR",
+        os.path.join(SOURCE_LOG_FOLDER_PATH, "debug_artifacts"),
+    ),
+    "compress": env_bool("SENTIENT_DEBUG_ARTIFACTS_COMPRESS"),
+    "retention": env_int("SENTIENT_DEBUG_ARTIFACTS_RETENTION", 100),
+    "max_sessions": env_int("SENTIENT_DEBUG_ARTIFACTS_MAX_SESSIONS", 20),
+}
+
+# Every session (e.g. every concurrent agent run) writes to its own folder, with its own sequence of files
+__default_session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+__session_id: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "debug_artifacts_session_id", default=__default_session_id
+)
+__sequences: Dict[str, "itertools.count[int]"] = {}
+__sequences_lock = threading.Lock()
+
+__queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+__writer: Optional[threading.Thread] = None
+__writer_lock = threading.Lock()
+
+
+def configure_debug_artifacts(
+    enabled: Optional[bool] = None,
+    directory: Optional[str] = None,
+    compress: Optional[bool] = None,
+    retention: Optional[int] = None,
+    max_sessions: Optional[int] = None,
+):
+    """
+    Overrides the configuration read from the environment. Arguments left to None are not changed.
+
+    Args:
+        enabled (Optional[bool]): Whether the artifacts are written.
+        directory (Optional[str]): The folder in which every session gets its own folder.
+        compress (Optional[bool]): Whether the files are gzipped.
+        retention (Optional[int]): The number of files kept per session, the oldest ones are deleted first.
+        max_sessions (Optional[int]): The number of session folders kept, the oldest ones are deleted first.
+    """
+    override_config(
+        __config,
+        enabled=enabled,
+        directory=directory,
+        compress=compress,
+        retention=retention,
+        max_sessions=max_sessions,
+    )
+
+
+def debug_artifacts_enabled() -> bool:
+    return __config["enabled"]
+
+
+def start_debug_session(session_id: Optional[str] = None) -> str:
+    """
+    Starts a new session for the artifacts written from the current context (e.g. the current asyncio task),
+    so that concurrent sessions write to different folders.
+
+    Args:
+        session_id (Optional[str]): The name of the session folder. Defaults to a new unique name.
+
+    Returns:
+        str: The id of the session.
+    """
+    session_id = (
+        session_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    )
+    __session_id.set(session_id)
+    return session_id
+
+
+def dump_debug_artifact(name: str, content: Any):
+    """
+    Writes a debug artifact in the background, if debug artifacts are enabled. Does nothing otherwise.
+
+    Dicts and lists are serialized to JSON right away, since the caller may modify them afterwards,
+    the file itself is written (and compressed) by a background thread. Every call writes a new file,
+    prefixed with its sequence number in the session, e.g. 000012_json_accessibility_dom.json.
+
+    Args:
+        name (str): The name of the file, e.g. json_accessibility_dom.json.
+        content (Any): The text, or a JSON serializable object, to write.
+    """
+    if not __config["enabled"]:
+        return
+
+    if not isinstance(content, (str, bytes)):
+        content = json.dumps(content, ensure_ascii=False, default=str)
+
+    session_id = __session_id.get()
+    with __sequences_lock:
+        sequence = __sequences.setdefault(session_id, itertools.count(1))
+        file_name = f"{next(sequence):06d}_{name}"
+
+    __ensure_writer()
+    __queue.put(
+        {
+            "session_directory": os.path.join(__config["directory"], session_id),
+            "file_name": file_name,
+            "content": content,
+            "compress": __config["compress"],
+            "retention": __config["retention"],
+            "max_sessions": __config["max_sessions"],
+        }
+    )
+
+
+def flush_debug_artifacts(timeout: float = 5.0):
+    """
+    Waits until the artifacts queued so far are written, for at most `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while __queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def __ensure_writer():
+    global __writer
+    with __writer_lock:
+        if __writer is None or not __writer.is_alive():
+            __writer = threading.Thread(
+                target=__write_artifacts, name="debug-artifacts-writer", daemon=True
+            )
+            __writer.start()
+
+
+def __write_artifacts():
+    while True:
+        artifact = __queue.get()
+        try:
+            __write_artifact(**artifact)
+        except Exception as e:
+            logger.warning(
+                f"Could not write the debug artifact {artifact['file_name']}: {e}"
+            )
+        finally:
+            __queue.task_done()
+
+
+def __write_artifact(
+    session_directory: str,
+    file_name: str,
+    content: Any,
+    compress: bool,
+    retention: int,
+    max_sessions: int,
+):
+    is_new_session = not os.path.isdir(session_directory)
+    os.makedirs(session_directory, exist_ok=True)
+    data = content.encode("utf-8") if isinstance(content, str) else content
+    path = os.path.join(session_directory, file_name)
+    if compress:
+        with gzip.open(path + ".gz", "wb", compresslevel=5) as f:
+            f.write(data)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+
+    # the file names start with their sequence number, so sorting them sorts them by age
+    files = sorted(os.listdir(session_directory))
+    for old_file in files[: max(0, len(files) - retention)]:
+        os.remove(os.path.join(session_directory, old_file))
+
+    if is_new_session:
+        # the sessions of this process are never deleted, only the ones left by previous runs
+        with __sequences_lock:
+            own_sessions = set(__sequences)
+        root = os.path.dirname(session_directory)
+        sessions = sorted(
+            (
+                os.path.join(root, session)
+                for session in os.listdir(root)
+                if os.path.isdir(os.path.join(root, session))
+                and session not in own_sessions
+            ),
+            key=os.path.getmtime,
+        )
+        max_sessions = max(0, max_sessions - len(own_sessions))
+        for old_session in sessions[: max(0, len(sessions) - max_sessions)]:
+            shutil.rmtree(old_session, ignore_errors=True)
+
+
+atexit.register(flush_debug_artifacts)
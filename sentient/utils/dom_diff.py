@@ -0,0 +1,239 @@
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urldefrag
+
+from playwright.async_api import Page
+
+from sentient.utils.logger import logger
+
+DELTA_NOTE = "Only the elements that changed since the previous step are listed in full: the ones in added appeared, the ones in changed changed, the ones in removed disappeared. Every other element is unchanged, listed in unchanged with its mmid, role and name only, and can still be interacted with using its mmid."
+
+# The names of the elements in the index of the unchanged elements are shortened to this many characters
+UNCHANGED_NAME_LENGTH = 60
+
+
+def __walk_dom_tree(tree: Dict[str, Any]):
+    """
+    Yields the stable identity of every node of a tree with the node and the mmid of its closest ancestor, in
+    document order, see flatten_dom_tree.
+    """
+    occurrences: Counter = Counter()
+    stack: List[Tuple[Dict[str, Any], Optional[int]]] = [(tree, None)]
+    while stack:
+        node, parent_mmid = stack.pop()
+        mmid = node.get("mmid")
+        if mmid is not None:
+            identity = str(mmid)
+        else:
+            identity = f"{parent_mmid}>{node.get('role')}:{node.get('name')}"
+            occurrences[identity] += 1
+            identity = f"{identity}#{occurrences[identity]}"
+        yield identity, node, parent_mmid
+
+        child_parent_mmid = mmid if mmid is not None else parent_mmid
+        # reversed so that the children are visited in document order
+        for child in reversed(node.get("children", [])):
+            stack.append((child, child_parent_mmid))
+
+
+def flatten_dom_tree(tree: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Flattens an enriched accessibility tree into a map of stable element identity to node attributes.
+
+    Nodes with an mmid are identified by it, since the mmid of an element is kept across extractions of the same document.
+    Nodes without an mmid (e.g. static text) are identified by their closest ancestor with an mmid, their role, their name
+    and their position among the nodes sharing these.
+
+    Args:
+        tree (Dict[str, Any]): The enriched accessibility tree as returned by get_dom_with_content_type.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The attributes of every node (without its children) keyed by the node identity.
+            The mmid of the closest ancestor is added as 'parent_mmid'.
+    """
+    nodes: Dict[str, Dict[str, Any]] = {}
+    for identity, node, parent_mmid in __walk_dom_tree(tree):
+        attributes = {key: value for key, value in node.items() if key != "children"}
+        attributes["parent_mmid"] = parent_mmid
+        nodes[identity] = attributes
+    return nodes
+
+
+def __index_entry(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the entry of an unchanged element in the index sent with a delta: enough to act on it, not to describe it.
+    """
+    entry = {"mmid": node["mmid"]}
+    role = node.get("role") or node.get("tag")
+    if role:
+        entry["role"] = role
+    name = " ".join(str(node.get("name") or "").split())
+    if name:
+        if len(name) > UNCHANGED_NAME_LENGTH:
+            name = name[: UNCHANGED_NAME_LENGTH - 1] + "…"
+        entry["name"] = name
+    return entry
+
+
+def diff_dom_trees(
+    previous_nodes: Dict[str, Dict[str, Any]], current_nodes: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Computes the structural difference between two flattened trees.
+
+    Args:
+        previous_nodes (Dict[str, Dict[str, Any]]): The flattened tree of the previous step.
+        current_nodes (Dict[str, Dict[str, Any]]): The flattened tree of the current step.
+
+    Returns:
+        Dict[str, Any]: The added and changed nodes, the removed nodes, the index of the unchanged elements (the mmid,
+            role and name of every unchanged node with an mmid, in document order) and a summary of the unchanged nodes.
+    """
+    added: List[Dict[str, Any]] = []
+    changed: List[Dict[str, Any]] = []
+    unchanged_index: List[Dict[str, Any]] = []
+    unchanged: Counter = Counter()
+
+    for identity, node in current_nodes.items():
+        previous_node = previous_nodes.get(identity)
+        if previous_node is None:
+            added.append(node)
+        elif previous_node != node:
+            changed_keys = sorted(
+                key
+                for key in set(previous_node) | set(node)
+                if previous_node.get(key) != node.get(key)
+            )
+            changed.append({**node, "changed_attributes": changed_keys})
+        else:
+            unchanged[node.get("role") or node.get("tag") or "element"] += 1
+            if node.get("mmid") is not None:
+                unchanged_index.append(__index_entry(node))
+
+    removed: List[Any] = []
+    for identity, node in previous_nodes.items():
+        if identity not in current_nodes:
+            removed.append(
+                node["mmid"]
+                if node.get("mmid") is not None
+                else {"role": node.get("role"), "name": node.get("name")}
+            )
+
+    unchanged_count = sum(unchanged.values())
+    unchanged_summary = f"{unchanged_count} elements unchanged"
+    if unchanged:
+        unchanged_summary += ": " + ", ".join(
+            f"{count} {role}" for role, count in unchanged.most_common(10)
+        )
+
+    return {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "unchanged": unchanged_index,
+        "unchanged_summary": unchanged_summary,
+    }
+
+
+async def get_page_identity(page: Page) -> Tuple[str, Optional[float]]:
+    """
+    Identifies the document loaded in the page. A navigation, a reload or a same-document URL change all change the identity.
+
+    Args:
+        page (Page): The Playwright page instance.
+
+    Returns:
+        Tuple[str, Optional[float]]: The URL of the page without its fragment and the time origin of the document.
+    """
+    try:
+        time_origin = await page.evaluate("() => performance.timeOrigin")
+    except Exception as e:
+        logger.debug(f"Could not read the time origin of the page: {e}")
+        time_origin = None
+    return urldefrag(page.url)[0], time_origin
+
+
+class DomDeltaTracker:
+    """
+    Keeps the enriched tree of the previous step for the current page and turns the next extraction of the same page
+    into a delta: the added, changed and removed elements in full, and an index of the unchanged elements with their
+    mmid, role and name only. The agent keeps no message history, so the index is what lets it still act on the
+    elements that did not change; what the delta saves are the attributes, texts and structure of the unchanged part
+    of the page. The page is still extracted in full every step, only the prompt gets smaller. The full tree is sent
+    on navigation, on the first extraction of a page and when most of the page changed.
+    """
+
+    def __init__(self, max_delta_ratio: float = 0.5):
+        """
+        Args:
+            max_delta_ratio (float, optional): The full tree is sent when the added, removed and changed elements
+                are more than this fraction of the elements in the tree. Defaults to 0.5.
+        """
+        self.max_delta_ratio = max_delta_ratio
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the previous tree, so that the next extraction is sent in full.
+        """
+        self._page_identity: Optional[Tuple[str, Optional[float]]] = None
+        self._previous_nodes: Optional[Dict[str, Dict[str, Any]]] = None
+
+    async def get_dom_for_agent(
+        self, page: Page, dom: Optional[Dict[str, Any]]
+    ) -> Union[Dict[str, Any], None]:
+        """
+        Returns either the full tree or the delta since the previous call for the same page.
+
+        Args:
+            page (Page): The page the tree was extracted from.
+            dom (Optional[Dict[str, Any]]): The enriched tree of the current step.
+
+        Returns:
+            Dict[str, Any] | None: The full tree, or a delta marked with 'dom_delta' (see diff_dom_trees).
+        """
+        if not isinstance(dom, dict):
+            self.reset()
+            return dom
+
+        page_identity = await get_page_identity(page)
+        current_nodes = flatten_dom_tree(dom)
+        previous_nodes = self._previous_nodes
+        is_same_page = (
+            previous_nodes is not None
+            and page_identity == self._page_identity
+            and page_identity[1] is not None
+        )
+        self._page_identity = page_identity
+        self._previous_nodes = current_nodes
+
+        if not is_same_page:
+            logger.debug("Sending the full DOM since the page is new or has navigated")
+            return dom
+
+        return self.get_delta(dom, previous_nodes, current_nodes)
+
+    def get_delta(
+        self,
+        dom: Dict[str, Any],
+        previous_nodes: Dict[str, Dict[str, Any]],
+        current_nodes: Dict[str, Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Returns the delta between two flattened trees of the same page, or the tree itself when most of it changed.
+        """
+        delta = diff_dom_trees(previous_nodes, current_nodes)
+        delta_size = len(delta["added"]) + len(delta["removed"]) + len(delta["changed"])
+        if delta_size > self.max_delta_ratio * len(current_nodes):
+            logger.debug(
+                f"Sending the full DOM since {delta_size} of {len(current_nodes)} elements changed"
+            )
+            return dom
+
+        logger.debug(
+            f"Sending a DOM delta of {delta_size} elements, {delta['unchanged_summary']}"
+        )
+        dom_delta = {"dom_delta": True, "note": DELTA_NOTE, **delta}
+        if "viewport" in dom:
+            dom_delta["viewport"] = dom["viewport"]
+        return dom_delta
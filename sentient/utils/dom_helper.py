@@ -4,6 +4,7 @@ from typing import List, Optional
 from playwright.async_api import ElementHandle, Page
 
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_element_runtime
 
 
 async def wait_for_non_loading_dom_state(page: Page, max_wait_millis: int):
@@ -32,12 +33,6 @@ async def get_element_outer_html(
     Returns:
         str: The opening tag of the HTML element, including a select set of attributes.
     """
-    tag_name: str = (
-        element_tag_name
-        if element_tag_name
-        else await page.evaluate("element => element.tagName.toLowerCase()", element)
-    )
-
     attributes_of_interest: List[str] = [
         "id",
         "name",
@@ -55,12 +50,8 @@ async def get_element_outer_html(
         "aria-describedby",
         "aria-haspopup",
     ]
-    opening_tag: str = f"<{tag_name}"
-
-    for attr in attributes_of_interest:
-        value: str = await element.get_attribute(attr)  # type: ignore
-        if value:
-            opening_tag += f' {attr}="{value}"'
-    opening_tag += ">"
-
+    # read all the attributes in one call into the page instead of one call per attribute
+    opening_tag: str = await call_element_runtime(
+        element, "outerHtml", element_tag_name, attributes_of_interest
+    )
     return opening_tag
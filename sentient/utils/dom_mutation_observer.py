@@ -1,36 +1,48 @@
 import asyncio
 import json
-from typing import Callable, List  # noqa: UP035
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple  # noqa: UP035
 
-from playwright.async_api import Page
+from playwright.async_api import BrowserContext, Page
+
+from sentient.core.web_driver.session import get_session_browser_context
+from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
 
 # Create an event loop
 loop = asyncio.get_event_loop()
 
 DOM_change_callback: List[Callable[[str], None]] = []
+# The callbacks subscribed from the sessions running in their own browser context (see BrowserContextPool)
+__session_callbacks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def __get_callbacks(
+    browser_context: Optional[BrowserContext],
+) -> List[Callable[[str], None]]:
+    if browser_context is None:
+        return DOM_change_callback
+    return __session_callbacks.setdefault(browser_context, [])
 
 
 def subscribe(callback: Callable[[str], None]) -> None:
-    DOM_change_callback.append(callback)
+    __get_callbacks(get_session_browser_context()).append(callback)
 
 
 def unsubscribe(callback: Callable[[str], None]) -> None:
-    DOM_change_callback.remove(callback)
+    __get_callbacks(get_session_browser_context()).remove(callback)
 
 
-async def add_mutation_observer(page: Page):
-    """
-    Adds a mutation observer to the page to detect changes in the DOM.
-    When changes are detected, the observer calls the dom_mutation_change_detected function in the browser context.
-    This changes can be detected by subscribing to the dom_mutation_change_detected function by individual skills.
-
-    Current implementation only detects when a new node is added to the DOM.
-    However, in many cases, the change could be a change in the style or class of an existing node (e.g. toggle visibility of a hidden node).
-    """
-
-    await page.evaluate("""
+# The mutation observer of the skills, installed in every document of a browser context once its DOM is loaded, see
+# install_mutation_observer. It reports the nodes added to the DOM through the dom_mutation_change_detected binding.
+MUTATION_OBSERVER_JS = """
+(() => {
+    // only the top document of a page is observed
+    if (window !== window.top) return;
+    const observe = () => {
+        if (window.__sentient_mutation_observer) return;
         console.log('Adding a mutation observer for DOM changes');
-        new MutationObserver((mutationsList, observer) => {
+        window.__sentient_mutation_observer = new MutationObserver((mutationsList, observer) => {
             let changes_detected = [];
             for(let mutation of mutationsList) {
                 if (mutation.type === 'childList') {
@@ -59,32 +71,145 @@ async def add_mutation_observer(page: Page):
                     }
                 }
             }
-            if(changes_detected.length > 0) {
+            if(changes_detected.length > 0 && window.dom_mutation_change_detected) {
                 window.dom_mutation_change_detected(JSON.stringify(changes_detected));
             }
-        }).observe(document, {subtree: true, childList: true, characterData: true});
-        """)
+        });
+        window.__sentient_mutation_observer.observe(document, {subtree: true, childList: true, characterData: true});
+    };
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', observe, {once: true});
+    } else {
+        observe();
+    }
+})();
+"""
+
+
+async def install_mutation_observer(
+    browser_context: BrowserContext, session: bool = False
+):
+    """
+    Installs the mutation observer in every document of a browser context, including the documents of later
+    navigations, and exposes the dom_mutation_change_detected binding it reports to.
+
+    Args:
+        browser_context (BrowserContext): The browser context.
+        session (bool, optional): Whether the context is the context of a session (see BrowserContextPool): its
+            changes go to the callbacks subscribed from that session only, otherwise to the ones subscribed outside
+            of a session. Defaults to False.
+    """
+
+    async def on_changes(source: Dict[str, Any], changes_detected: str):
+        await dom_mutation_change_detected(
+            changes_detected, source["page"].context if session else None
+        )
+
+    await browser_context.expose_binding("dom_mutation_change_detected", on_changes)
+    await browser_context.add_init_script(script=MUTATION_OBSERVER_JS)
+    # the init script only runs in the documents loaded from now on
+    for page in browser_context.pages:
+        try:
+            await add_mutation_observer(page)
+        except Exception as e:
+            logger.debug(f"Could not add the mutation observer to {page.url}: {e}")
+
+
+async def add_mutation_observer(page: Page):
+    """
+    Adds a mutation observer to the page to detect changes in the DOM, if it does not have one yet.
+    When changes are detected, the observer calls the dom_mutation_change_detected function in the browser context.
+    This changes can be detected by subscribing to the dom_mutation_change_detected function by individual skills.
+
+    Current implementation only detects when a new node is added to the DOM.
+    However, in many cases, the change could be a change in the style or class of an existing node (e.g. toggle visibility of a hidden node).
+    """
+    await page.evaluate(MUTATION_OBSERVER_JS)
 
 
 async def handle_navigation_for_mutation_observer(page: Page):
     await add_mutation_observer(page)
 
 
-async def dom_mutation_change_detected(changes_detected: str):
+async def dom_mutation_change_detected(
+    changes_detected: str, browser_context: Optional[BrowserContext] = None
+):
     """
     Detects changes in the DOM (new nodes added) and emits the event to all subscribed callbacks.
     The changes_detected is a string in JSON formatt containing the tag and content of the new nodes added to the DOM.
 
     e.g.  The following will be detected when autocomplete recommendations show up when one types Nelson Mandela on google search
     [{'tag': 'SPAN', 'content': 'nelson mandela wikipedia'}, {'tag': 'SPAN', 'content': 'nelson mandela movies'}]
+    Only the callbacks subscribed from the session of `browser_context` get them, by default the ones subscribed
+    outside of a session.
     """
     changes_detected = json.loads(changes_detected.replace("\t", "").replace("\n", ""))
     if len(changes_detected) > 0:
         # Emit the event to all subscribed callbacks
-        for callback in DOM_change_callback:
+        callbacks = (
+            DOM_change_callback
+            if browser_context is None
+            else __session_callbacks.get(browser_context, [])
+        )
+        for callback in list(callbacks):
             # If the callback is a coroutine function
             if asyncio.iscoroutinefunction(callback):
                 await callback(changes_detected)
             # If the callback is a regular function
             else:
                 callback(changes_detected)
+
+
+# Attributes written by the DOM extraction and the action skills themselves, which do not change what is extracted.
+__IGNORED_ATTRIBUTES = ["mmid", "aria-keyshortcuts", "orig-aria-keyshortcuts"]
+__HIGHLIGHT_CLASS = "agente-ui-automation-highlight"
+
+
+async def get_dom_generation(page: Page) -> Optional[Tuple[float, int, int]]:
+    """
+    Returns the generation of the DOM of the page, which increases every time the DOM changes.
+    The counter is installed in the document on the first call, is kept by the document and starts over after a navigation,
+    which is why the time origin of the document is returned along with it.
+
+    Mutations of the attributes injected by the DOM extraction (mmid, aria-keyshortcuts) and of the highlight applied by the
+    skills are not counted. Input and change events are counted, since they change values without a DOM mutation.
+    Values set by scripts without a mutation or an event (e.g. element.value = ...) are not detected.
+    Scrolling and resizing are counted separately in the viewport generation, since they only matter to extractions
+    limited to the viewport.
+
+    Args:
+        page (Page): The Playwright page instance.
+
+    Returns:
+        Tuple[float, int, int] | None: The time origin of the document, its DOM generation and its viewport generation,
+            or None if they could not be read.
+    """
+    try:
+        result = await call_page_runtime(
+            page, "domGeneration", __IGNORED_ATTRIBUTES, __HIGHLIGHT_CLASS
+        )
+    except Exception as e:
+        logger.debug(f"Could not read the DOM generation of the page: {e}")
+        return None
+    return result["time_origin"], result["generation"], result["viewport_generation"]
+
+
+async def get_page_activity(page: Page) -> Optional[Dict[str, Any]]:
+    """
+    Returns the ready state of the document of the page and how long ago its DOM last changed, ignoring the same
+    mutations as get_dom_generation.
+
+    Args:
+        page (Page): The Playwright page instance.
+
+    Returns:
+        Dict[str, Any] | None: The 'ready_state' of the document and the 'mutation_age' in milliseconds, which is None if
+            the DOM did not change since it is observed. None if they could not be read, e.g. during a navigation.
+    """
+    try:
+        return await call_page_runtime(
+            page, "pageActivity", __IGNORED_ATTRIBUTES, __HIGHLIGHT_CLASS
+        )
+    except Exception as e:
+        logger.debug(f"Could not read the activity of the page: {e}")
+        return None
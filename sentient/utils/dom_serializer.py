@@ -0,0 +1,582 @@
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sentient.utils.logger import logger
+from sentient.utils.tracing import trace_span
+
+DOM_FORMAT_LEGEND = '# One element per line: [mmid] role tag "name" key=value. Indentation is nesting, quoted lines are text. desc=description ph=placeholder label=aria-label opts=options info=additional info'
+REPEAT_FORMAT_LEGEND = '# "REPEAT xN" stands for N sibling elements shaped like the template lines under it, followed by one "= $1|$2|..." row with the values of each element'
+
+# Runs of at least this many siblings with the same structure are written as a template and a row per sibling
+TEMPLATE_MIN_RUN = 3
+
+# Attribute keys shortened in the output, see DOM_FORMAT_LEGEND
+ABBREVIATED_KEYS = {
+    "description": "desc",
+    "placeholder": "ph",
+    "aria-label": "label",
+    "options": "opts",
+    "additional_info": "info",
+    "tag_type": "type",
+    "autocomplete": "ac",
+    "data-testid": "testid",
+    "important information": "NOTE",
+    "changed_attributes": "changed",
+    "parent_mmid": "in",
+}
+# Keys rendered at the start of the line or handled separately
+__LEADING_KEYS = ("mmid", "role", "tag", "name", "children", "viewport")
+
+INTERACTIVE_TAGS = ("a", "button", "input", "select", "textarea", "option", "label")
+INTERACTIVE_ROLES = (
+    "button",
+    "link",
+    "textbox",
+    "searchbox",
+    "combobox",
+    "checkbox",
+    "radio",
+    "switch",
+    "tab",
+    "menuitem",
+    "option",
+    "slider",
+    "spinbutton",
+    "dialog",
+)
+
+# Prompt budget of the DOM for model families, matched on the longest key contained in the model name
+DOM_TOKEN_BUDGETS = {
+    "gpt-4o": 40000,
+    "gpt-4o-mini": 40000,
+    "gpt-4-turbo": 40000,
+    "o1": 40000,
+    "claude": 60000,
+    "gemini": 60000,
+    "llama": 6000,
+    "mixtral": 8000,
+    "gemma": 6000,
+}
+DEFAULT_DOM_TOKEN_BUDGET = 16000
+
+# Progressively more aggressive settings tried until the DOM fits the budget: (max text length, collapsed subtrees)
+__REDUCTION_LEVELS: List[Tuple[Optional[int], Optional[str]]] = [
+    (None, None),
+    (200, None),
+    (80, "text"),
+    (40, "non_interactive"),
+    (20, "non_interactive"),
+]
+
+__bare_value = re.compile(r"^[\w.\-/:#@]+$")
+
+
+@dataclass
+class SerializedDom:
+    text: str
+    tokens: int
+    # 0 when the whole DOM fits, higher as texts are shortened, subtrees collapsed and lines dropped
+    reduction_level: int = 0
+
+
+@lru_cache(maxsize=None)
+def __get_encoding(model: Optional[str]):
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(
+            f"Could not load a tiktoken encoding, estimating tokens from the text length: {e}"
+        )
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Counts the tokens of a text with the tiktoken encoding of the model, or cl100k_base for models tiktoken does not know.
+    When no encoding can be loaded (e.g. offline), the count is estimated as one token per four characters.
+
+    Args:
+        text (str): The text to count the tokens of.
+        model (Optional[str], optional): The name of the model the text is sent to. Defaults to None.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = __get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_dom_token_budget(model: Optional[str]) -> int:
+    """
+    Returns the number of tokens the DOM may take in the prompt of a model.
+
+    Args:
+        model (Optional[str]): The name of the model, e.g. gpt-4o-2024-08-06 or anthropic/claude-3.5-sonnet.
+
+    Returns:
+        int: The budget of the longest key of DOM_TOKEN_BUDGETS contained in the model name, or DEFAULT_DOM_TOKEN_BUDGET.
+    """
+    model = (model or "").lower()
+    matches = [key for key in DOM_TOKEN_BUDGETS if key in model]
+    if not matches:
+        return DEFAULT_DOM_TOKEN_BUDGET
+    return DOM_TOKEN_BUDGETS[max(matches, key=len)]
+
+
+def __truncate(text: str, max_length: Optional[int]) -> str:
+    text = " ".join(str(text).split())
+    if max_length is not None and len(text) > max_length:
+        return text[: max_length - 1] + "…"
+    return text
+
+
+def __quote(text: str, max_length: Optional[int]) -> str:
+    return json.dumps(__truncate(text, max_length), ensure_ascii=False)
+
+
+def __render_value(value: Any, max_length: Optional[int]) -> str:
+    if isinstance(value, str):
+        value = __truncate(value, max_length)
+        return value if __bare_value.match(value) else __quote(value, None)
+    if isinstance(value, dict):
+        items = [
+            f"{key}:{__render_value(item, max_length)}"
+            for key, item in value.items()
+            if item not in (None, "", False)
+        ]
+        return "{" + " ".join(items) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(__render_value(item, max_length) for item in value) + "]"
+    return json.dumps(value, ensure_ascii=False)
+
+
+def __render_options(options: List[Dict[str, Any]], max_length: Optional[int]) -> str:
+    rendered = []
+    for option in options:
+        text = __truncate(option.get("text", ""), max_length)
+        value = str(option.get("value", ""))
+        option_text = json.dumps(text, ensure_ascii=False)
+        if value and value != text:
+            option_text += f"={__render_value(value, max_length)}"
+        if option.get("selected"):
+            option_text += "*"
+        rendered.append(option_text)
+    return "[" + ", ".join(rendered) + "]"
+
+
+def __node_parts(
+    node: Dict[str, Any], max_length: Optional[int]
+) -> List[Tuple[str, str, str]]:
+    """
+    Splits the line of a node, without its children, into parts.
+
+    Returns:
+        List[Tuple[str, str, str]]: The key, the format and the value of every part of the line.
+    """
+    mmid = node.get("mmid")
+    role = node.get("role")
+    tag = node.get("tag")
+    name = node.get("name")
+
+    if mmid is None and role == "text" and len(node) <= 2:
+        return [("text", "{}", __quote(name or "", max_length))]
+
+    parts = []
+    if mmid is not None:
+        parts.append(("mmid", "[{}]", str(mmid)))
+    if role:
+        parts.append(("role", "{}", str(role)))
+    if tag and tag != role:
+        parts.append(("tag", "{}", str(tag)))
+    if name:
+        parts.append(("name", "{}", __quote(name, max_length)))
+
+    for key, value in node.items():
+        if key in __LEADING_KEYS or value in (None, "", False, [], {}):
+            continue
+        short_key = ABBREVIATED_KEYS.get(key, key)
+        if value is True:
+            parts.append((key, "{}", short_key))
+        elif key == "options":
+            parts.append((key, short_key + "={}", __render_options(value, max_length)))
+        elif key == "additional_info":
+            entries = [entry for entry in value if entry]
+            if entries:
+                parts.append(
+                    (key, short_key + "={}", __render_value(entries, max_length))
+                )
+        else:
+            parts.append((key, short_key + "={}", __render_value(value, max_length)))
+    return parts
+
+
+def __join_parts(parts: List[Tuple[str, str, str]]) -> str:
+    return " ".join(part_format.format(value) for _, part_format, value in parts)
+
+
+def __render_node(node: Dict[str, Any], max_length: Optional[int]) -> str:
+    """
+    Renders a node, without its children, as a single line.
+    """
+    return __join_parts(__node_parts(node, max_length))
+
+
+def __is_interactive(node: Dict[str, Any]) -> bool:
+    return node.get("mmid") is not None and (
+        node.get("tag") in INTERACTIVE_TAGS
+        or node.get("role") in INTERACTIVE_ROLES
+        or "options" in node
+    )
+
+
+def __collapsible_subtrees(tree: Dict[str, Any], mode: Optional[str]) -> set:
+    """
+    Finds the subtrees that can be rendered as a single line: the ones without any mmid for mode 'text',
+    the ones without any interactive element for mode 'non_interactive'.
+
+    Returns:
+        set: The ids of the roots of the outermost collapsible subtrees.
+    """
+    if mode is None:
+        return set()
+
+    # post-order, to know whether each subtree contains a node that has to be kept
+    keeps: Dict[int, bool] = {}
+    stack: List[Tuple[Dict[str, Any], bool]] = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        children = node.get("children", [])
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        keeps_node = (
+            node.get("mmid") is not None if mode == "text" else __is_interactive(node)
+        )
+        keeps[id(node)] = keeps_node or any(keeps[id(child)] for child in children)
+
+    collapsed = set()
+    stack_nodes = [tree]
+    while stack_nodes:
+        node = stack_nodes.pop()
+        if "children" in node and not keeps[id(node)] and node is not tree:
+            collapsed.add(id(node))
+            continue
+        stack_nodes.extend(node.get("children", []))
+    return collapsed
+
+
+def __collapsed_parts(
+    node: Dict[str, Any], max_length: Optional[int]
+) -> List[Tuple[str, str, str]]:
+    """
+    Renders a collapsed subtree as its first line followed by the text it contains.
+    """
+    texts = []
+    stack = list(reversed(node.get("children", [])))
+    while stack:
+        child = stack.pop()
+        for key in ("name", "desc", "description", "text"):
+            if child.get(key):
+                texts.append(str(child[key]))
+                break
+        stack.extend(reversed(child.get("children", [])))
+    parts = __node_parts(node, max_length)
+    if texts:
+        parts.append(("collapsed_text", "{}", __quote(" ".join(texts), max_length)))
+    return parts
+
+
+def __subtree_shapes(tree: Dict[str, Any]) -> Dict[int, int]:
+    """
+    Computes a structural hash of every subtree: the roles, tags and attribute keys of its nodes and how they are
+    nested, but not the attribute values. Subtrees with the same hash render to lines that only differ by their values.
+
+    Returns:
+        Dict[int, int]: The hash of every subtree, by id of its root.
+    """
+    shapes: Dict[int, int] = {}
+    stack: List[Tuple[Dict[str, Any], bool]] = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        children = node.get("children", [])
+        if not children_done and children:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children)
+            continue
+        keys = tuple(
+            sorted(
+                key
+                for key, value in node.items()
+                if key != "children" and value not in (None, "", False, [], {})
+            )
+        )
+        shapes[id(node)] = hash(
+            (
+                node.get("role"),
+                node.get("tag"),
+                keys,
+                tuple(shapes[id(child)] for child in children),
+            )
+        )
+    return shapes
+
+
+def __subtree_parts(
+    node: Dict[str, Any], collapsed: set, max_length: Optional[int]
+) -> List[Tuple[int, List[Tuple[str, str, str]]]]:
+    """
+    Splits the lines of a subtree into parts, with the depth of every line relative to the root of the subtree.
+    """
+    lines = []
+    stack: List[Tuple[Dict[str, Any], int]] = [(node, 0)]
+    while stack:
+        current, depth = stack.pop()
+        if id(current) in collapsed:
+            lines.append((depth, __collapsed_parts(current, max_length)))
+            continue
+        lines.append((depth, __node_parts(current, max_length)))
+        for child in reversed(current.get("children", [])):
+            stack.append((child, depth + 1))
+    return lines
+
+
+def __render_run(
+    items: List[Dict[str, Any]], depth: int, collapsed: set, max_length: Optional[int]
+) -> Optional[List[str]]:
+    """
+    Renders a run of siblings with the same structure as a template, with a $n placeholder for every value that is not
+    the same in all of them, followed by one row of values per sibling.
+
+    Returns:
+        List[str] | None: The lines of the run, or None if the siblings do not render to the same parts.
+    """
+    items_parts = [__subtree_parts(item, collapsed, max_length) for item in items]
+    template = items_parts[0]
+    for item_parts in items_parts[1:]:
+        if len(item_parts) != len(template) or any(
+            line_depth != template_depth
+            or [part[:2] for part in parts] != [part[:2] for part in template_parts]
+            for (line_depth, parts), (template_depth, template_parts) in zip(
+                item_parts, template
+            )
+        ):
+            return None
+
+    indent = " " * depth
+    columns: List[List[str]] = []
+    template_lines = []
+    for line_index, (line_depth, parts) in enumerate(template):
+        rendered_parts = []
+        for part_index, (_, part_format, value) in enumerate(parts):
+            values = [
+                item_parts[line_index][1][part_index][2] for item_parts in items_parts
+            ]
+            if all(item_value == value for item_value in values):
+                rendered_parts.append(part_format.format(value))
+            else:
+                columns.append(values)
+                rendered_parts.append(part_format.format(f"${len(columns)}"))
+        template_lines.append(
+            indent + " " * (line_depth + 1) + " ".join(rendered_parts)
+        )
+
+    lines = [indent + f"REPEAT x{len(items)}"] + template_lines
+    if columns:
+        lines.extend(
+            indent + " = " + "|".join(column[item_index] for column in columns)
+            for item_index in range(len(items))
+        )
+    return lines
+
+
+def __render_tree(
+    tree: Dict[str, Any],
+    max_length: Optional[int],
+    collapse_mode: Optional[str],
+    compress_repeats: bool = True,
+) -> List[str]:
+    collapsed = __collapsible_subtrees(tree, collapse_mode)
+    shapes = __subtree_shapes(tree) if compress_repeats else {}
+    lines = []
+    viewport = tree.get("viewport")
+    if viewport:
+        lines.append(
+            f"# {viewport.get('elements_above', 0)} elements above the viewport and {viewport.get('elements_below', 0)} below. {viewport.get('note', '')}".rstrip()
+        )
+
+    # a node, or a run of siblings with the same structure, with its depth
+    stack: List[Tuple[List[Dict[str, Any]], int]] = [([tree], 0)]
+    while stack:
+        nodes, depth = stack.pop()
+        if len(nodes) > 1:
+            run_lines = __render_run(nodes, depth, collapsed, max_length)
+            if run_lines is not None:
+                lines.extend(run_lines)
+                continue
+            stack.extend(([node], depth) for node in reversed(nodes))
+            continue
+
+        node = nodes[0]
+        indent = " " * depth
+        if id(node) in collapsed:
+            lines.append(indent + __join_parts(__collapsed_parts(node, max_length)))
+            continue
+        lines.append(indent + __render_node(node, max_length))
+
+        runs: List[List[Dict[str, Any]]] = []
+        for child in node.get("children", []):
+            if (
+                compress_repeats
+                and runs
+                and shapes[id(child)] == shapes[id(runs[-1][0])]
+            ):
+                runs[-1].append(child)
+            else:
+                runs.append([child])
+        for run in reversed(runs):
+            if len(run) >= TEMPLATE_MIN_RUN:
+                stack.append((run, depth + 1))
+            else:
+                stack.extend(([child], depth + 1) for child in reversed(run))
+    return lines
+
+
+def __render_delta(delta: Dict[str, Any], max_length: Optional[int]) -> List[str]:
+    """
+    Renders a delta of DomDeltaTracker: the added and changed elements in full, the removed ones and a short line per
+    role and name of the unchanged elements, with their mmids.
+    """
+    lines = [f"# {delta.get('note', '')}".rstrip()]
+    viewport = delta.get("viewport")
+    if viewport:
+        lines.append(
+            f"# {viewport.get('elements_above', 0)} elements above the viewport and {viewport.get('elements_below', 0)} below. {viewport.get('note', '')}".rstrip()
+        )
+    for section in ("added", "changed"):
+        if delta.get(section):
+            lines.append(f"{section.upper()}:")
+            lines.extend(
+                __render_node(node, max_length) for node in delta.get(section, [])
+            )
+    if delta.get("removed"):
+        lines.append(
+            "REMOVED: "
+            + ", ".join(__render_value(node, max_length) for node in delta["removed"])
+        )
+    if delta.get("unchanged"):
+        lines.append(f"UNCHANGED: {delta.get('unchanged_summary', '')}".rstrip())
+        # the elements with the same role and name share a line, e.g. [4,6,8] button "Add to cart"
+        groups: Dict[Tuple[Any, Any], List[str]] = {}
+        for entry in delta["unchanged"]:
+            groups.setdefault((entry.get("role"), entry.get("name")), []).append(
+                str(entry["mmid"])
+            )
+        for (role, name), mmids in groups.items():
+            lines.append(
+                __render_node(
+                    {"mmid": ",".join(mmids), "role": role, "name": name}, max_length
+                )
+            )
+    return lines
+
+
+def __fit_lines(
+    lines: List[str], max_tokens: int, model: Optional[str]
+) -> Tuple[str, int]:
+    """
+    Keeps as many leading lines as fit in the budget, with a last line telling how many were left out.
+    """
+
+    def render(line_count: int) -> str:
+        kept = lines[:line_count]
+        if line_count < len(lines):
+            kept = kept + [f"# {len(lines) - line_count} more lines left out"]
+        return "\n".join(kept)
+
+    low, high = 0, len(lines)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(render(middle), model) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    text = render(low)
+    return text, count_tokens(text, model)
+
+
+def serialize_dom(
+    dom: Any,
+    max_tokens: Optional[int] = None,
+    model: Optional[str] = None,
+    compress_repeats: bool = True,
+) -> SerializedDom:
+    """
+    Serializes an enriched accessibility tree, or a delta of DomDeltaTracker, as compact lines, one element per line
+    with its mmid first, and fits it in a token budget.
+
+    With `compress_repeats`, runs of sibling subtrees with the same structure (e.g. the items of a result list or of a
+    product grid) are written once as a template, followed by a row with the mmids and values of every item.
+
+    Until the output fits, texts are shortened, then subtrees without mmid and then subtrees without any interactive
+    element are collapsed into a single line with their text, and as a last resort the trailing lines are left out.
+
+    Args:
+        dom (Any): The tree returned by get_dom_with_content_type, or a delta of DomDeltaTracker.
+        max_tokens (Optional[int], optional): The budget, in tokens of the model. Defaults to None (no limit).
+        model (Optional[str], optional): The model the DOM is sent to, used to count tokens. Defaults to None.
+        compress_repeats (bool, optional): Whether to write runs of siblings with the same structure as a template.
+            Defaults to True.
+
+    Returns:
+        SerializedDom: The text, the number of tokens it takes and how much it had to be reduced.
+    """
+    with trace_span("dom.serialize", max_tokens=max_tokens, model=model) as span:
+        serialized_dom = __serialize_dom(dom, max_tokens, model, compress_repeats)
+        span.set(
+            tokens=serialized_dom.tokens,
+            bytes=len(serialized_dom.text.encode("utf-8")),
+            reduction_level=serialized_dom.reduction_level,
+        )
+    return serialized_dom
+
+
+def __serialize_dom(
+    dom: Any, max_tokens: Optional[int], model: Optional[str], compress_repeats: bool
+) -> SerializedDom:
+    if not isinstance(dom, dict):
+        text = str(dom)
+        return SerializedDom(text=text, tokens=count_tokens(text, model))
+
+    lines: List[str] = []
+    for level, (max_length, collapse_mode) in enumerate(__REDUCTION_LEVELS):
+        if dom.get("dom_delta"):
+            lines = __render_delta(dom, max_length)
+        else:
+            lines = __render_tree(dom, max_length, collapse_mode, compress_repeats)
+        legend = [DOM_FORMAT_LEGEND]
+        if any(line.lstrip().startswith("REPEAT x") for line in lines):
+            legend.append(REPEAT_FORMAT_LEGEND)
+        lines = legend + lines
+        text = "\n".join(lines)
+        tokens = count_tokens(text, model)
+        if max_tokens is None or tokens <= max_tokens:
+            return SerializedDom(text=text, tokens=tokens, reduction_level=level)
+
+    text, tokens = __fit_lines(lines, max_tokens, model)
+    logger.warning(
+        f"DOM does not fit in {max_tokens} tokens even when collapsed, trailing lines were left out"
+    )
+    return SerializedDom(
+        text=text, tokens=tokens, reduction_level=len(__REDUCTION_LEVELS)
+    )
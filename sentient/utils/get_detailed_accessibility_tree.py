@@ -1,15 +1,16 @@
-import json
-import os
 import re
 import traceback
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
 
 from playwright.async_api import Page
 from typing_extensions import Annotated, Any
 
-from sentient.config.config import SOURCE_LOG_FOLDER_PATH
 from sentient.core.web_driver.playwright import PlaywrightManager
+from sentient.utils.debug_artifacts import dump_debug_artifact
 from sentient.utils.logger import logger
+from sentient.utils.page_runtime import call_page_runtime
+from sentient.utils.tracing import json_size, trace_span, tracing_enabled
 
 space_delimited_mmid = re.compile(r"^[\d ]+$")
 
@@ -34,28 +35,320 @@ async def __inject_attributes(page: Page):
     it renames it to 'orig-aria-keyshortcuts' before injecting the new 'aria-keyshortcuts'
     This will be captured in the accessibility tree and thus make it easier to reconcile the tree with the DOM.
     'aria-keyshortcuts' is choosen because it is not widely used aria attribute.
+    An element keeps the 'mmid' it got in a previous extraction of the same document, so that it can be tracked
+    across steps. Only new elements (and copies of tagged elements) get a new 'mmid'.
     """
 
-    last_mmid = await page.evaluate("""() => {
-        const allElements = document.querySelectorAll('*');
-        let id = 0;
-        allElements.forEach(element => {
-            const origAriaAttribute = element.getAttribute('aria-keyshortcuts');
-            const mmid = `${++id}`;
-            element.setAttribute('mmid', mmid);
-            element.setAttribute('aria-keyshortcuts', mmid);
-            //console.log(`Injected 'mmid'into element with tag: ${element.tagName} and mmid: ${mmid}`);
-            if (origAriaAttribute) {
-                element.setAttribute('orig-aria-keyshortcuts', origAriaAttribute);
-            }
-        });
-        return id;
-    }""")
-    logger.debug(f"Added MMID into {last_mmid} elements")
+    last_mmid = await call_page_runtime(page, "injectMmids")
+    logger.debug(f"Added MMID into elements, last MMID is {last_mmid}")
+
+
+# Attributes to fetch for each element
+__ATTRIBUTES_TO_FETCH = [
+    "name",
+    "aria-label",
+    "placeholder",
+    "mmid",
+    "id",
+    "for",
+    "data-testid",
+]
+__BACKUP_ATTRIBUTES = []  # if the attributes are not found, then try to get these attributes
+__TAGS_TO_IGNORE = [
+    "head",
+    "style",
+    "script",
+    "link",
+    "meta",
+    "noscript",
+    "template",
+    "iframe",
+    "g",
+    "main",
+    "c-wiz",
+    "svg",
+    "path",
+]
+# The flag of the nodes pruned away while the tree is pruned, until their parent drops them
+__PRUNED = "pruned_by_mm"
+__ATTRIBUTES_TO_DELETE = ["level", "multiline", "haspopup", "id", "for"]
+__IDS_TO_IGNORE = ["agentDriveAutoOverlay"]
+
+ELEMENT_INFO_PARAMS = {
+    "attributes": __ATTRIBUTES_TO_FETCH,
+    "backup_attributes": __BACKUP_ATTRIBUTES,
+    "tags_to_ignore": __TAGS_TO_IGNORE,
+    "ids_to_ignore": __IDS_TO_IGNORE,
+}
+
+VIEWPORT_NOTE = "Only the elements in the viewport are listed. Use the SCROLL action to see the elements above or below it."
+
+# How the element ids of the last tree extracted from a page were produced: mmid attributes injected into the page,
+# or backendNodeIds of a CDP snapshot that the actions resolve to elements (see resolve_snapshot_node)
+INJECTED_MMIDS = "injected_mmids"
+SNAPSHOT_NODE_IDS = "snapshot_node_ids"
+__element_id_sources: "WeakKeyDictionary[Page, str]" = WeakKeyDictionary()
+
+
+def set_element_id_source(page: Page, source: str):
+    """
+    Records how the element ids of the tree last extracted from a page, the one the agent acts on, were produced.
+
+    Args:
+        page (Page): The page the tree was extracted from.
+        source (str): INJECTED_MMIDS or SNAPSHOT_NODE_IDS.
+    """
+    __element_id_sources[page] = source
+
+
+def get_element_id_source(page: Page) -> Optional[str]:
+    """
+    Returns how the element ids of the tree last extracted from a page were produced, None if none was extracted.
+    """
+    return __element_id_sources.get(page)
+
+
+def __get_node_mmid(node: Dict[str, Any]) -> Optional[int]:
+    """
+    Returns the numeric mmid that was captured in the accessibility node through 'aria-keyshortcuts', if any.
+
+    Args:
+        node (Dict[str, Any]): A node of the accessibility tree.
+
+    Returns:
+        Optional[int]: The mmid of the node or None if the node could not be reconciled with a DOM element.
+    """
+    # Use 'name' attribute from the accessibility node as 'mmid'
+    mmid_temp: str = node.get("keyshortcuts")  # type: ignore
+
+    # If the name has multiple mmids, take the last one
+    if mmid_temp and is_space_delimited_mmid(mmid_temp):
+        # TODO: consider if we should grab each of the mmids and process them separately as seperate nodes copying this node's attributes
+        mmid_temp = mmid_temp.split(" ")[-1]
+
+    # focusing on nodes with mmid, which is the attribute we inject
+    try:
+        return int(mmid_temp)
+    except (ValueError, TypeError):
+        # logger.error(f"'name attribute contains \"{node.get('name')}\", which is not a valid numeric mmid. Adding node as is: {node}")
+        return None
+
+
+def __should_enrich_node(node: Dict[str, Any]) -> Optional[int]:
+    """
+    Decides whether a node of the accessibility tree needs to be enriched with information from the DOM.
+    Also flags modal dialogs since they need to be interacted with before the rest of the page.
+
+    Args:
+        node (Dict[str, Any]): A node of the accessibility tree.
+
+    Returns:
+        Optional[int]: The mmid to enrich the node with, or None if the node should be kept as is.
+    """
+    mmid = __get_node_mmid(node)
+    if mmid is None:
+        return None
+
+    if node["role"] == "menuitem":
+        return None
+
+    if node.get("role") == "dialog" and node.get("modal") == True:  # noqa: E712
+        node["important information"] = (
+            "This is a modal dialog. Please interact with this dialog and close it to be able to interact with the full page (e.g. by pressing the close button or selecting an option)."
+        )
+
+    return mmid
+
+
+def __merge_element_attributes(
+    node: Dict[str, Any], mmid: int, element_attributes: Optional[Dict[str, Any]]
+):
+    """
+    Merges the information fetched from the DOM for `mmid` into the accessibility node and removes duplicated
+    or unnecessary attributes from it.
+
+    Args:
+        node (Dict[str, Any]): The accessibility node to update in place.
+        mmid (int): The mmid of the DOM element the node was reconciled with.
+        element_attributes (Optional[Dict[str, Any]]): The information fetched from the DOM element, None if the element was skipped.
+    """
+    if not mmid:
+        logger.debug(f"No element found with mmid: {mmid}, deleting node: {node}")
+        node["marked_for_deletion_by_mm"] = True
+        return
+
+    if element_attributes and "viewport_position" in element_attributes:
+        # the element and everything in it are out of the viewport
+        node["marked_for_deletion_by_mm"] = True
+        node["viewport_position"] = element_attributes["viewport_position"]
+        return
+
+    if "keyshortcuts" in node:
+        del node["keyshortcuts"]  # remove keyshortcuts since it is not needed
+
+    node["mmid"] = mmid
+
+    # Update the node with fetched information
+    if element_attributes:
+        node.update(element_attributes)
+
+        # check if 'name' and 'mmid' are the same
+        if node.get("name") == node.get("mmid") and node.get("role") != "textbox":
+            del node["name"]  # Remove 'name' from the node
+
+        if (
+            "name" in node
+            and "description" in node
+            and (
+                node["name"] == node["description"]
+                or node["name"] == node["description"].replace("\n", " ")
+                or node["description"].replace("\n", "") in node["name"]
+            )
+        ):
+            del node[
+                "description"
+            ]  # if the name is same as description, then remove the description to avoid duplication
+
+        if (
+            "name" in node
+            and "aria-label" in node
+            and node["aria-label"] in node["name"]
+        ):
+            del node[
+                "aria-label"
+            ]  # if the name is same as the aria-label, then remove the aria-label to avoid duplication
+
+        if "name" in node and "text" in node and node["name"] == node["text"]:
+            del node[
+                "text"
+            ]  # if the name is same as the text, then remove the text to avoid duplication
+
+        if (
+            node.get("tag") == "select"
+        ):  # children are not needed for select menus since "options" attriburte is already added
+            node.pop("children", None)
+            node.pop("role", None)
+            node.pop("description", None)
+
+        # role and tag can have the same info. Get rid of role if it is the same as tag
+        if node.get("role") == node.get("tag"):
+            del node["role"]
+
+        # avoid duplicate aria-label
+        if (
+            node.get("aria-label")
+            and node.get("placeholder")
+            and node.get("aria-label") == node.get("placeholder")
+        ):
+            del node["aria-label"]
+
+        if node.get("role") == "link":
+            del node["role"]
+            if node.get("description"):
+                node["text"] = node["description"]
+                del node["description"]
+
+        # textbox just means a text input and that is expressed well enough with the rest of the attributes returned
+        # if node.get('role') == "textbox":
+        #    del node['role']
+
+    # remove attributes that are not needed once processing of a node is complete
+    for attribute_to_delete in __ATTRIBUTES_TO_DELETE:
+        if attribute_to_delete in node:
+            node.pop(attribute_to_delete, None)
+
+
+def __summarize_viewport(accessibility_tree: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Counts the elements left out of a tree limited to the viewport. Only the outermost element of a left out
+    subtree is counted, e.g. a search result counts as one element regardless of the links it contains.
+
+    Args:
+        accessibility_tree (Dict[str, Any]): The enriched accessibility tree, before pruning.
+
+    Returns:
+        Dict[str, Any]: The number of elements above and below the viewport, with a note for the agent.
+    """
+    counts = {"above": 0, "below": 0}
+    stack = [accessibility_tree]
+    while stack:
+        node = stack.pop()
+        if "viewport_position" in node:
+            counts[node["viewport_position"]] += 1
+            continue
+        stack.extend(node.get("children", []))
+    return {
+        "elements_above": counts["above"],
+        "elements_below": counts["below"],
+        "note": VIEWPORT_NOTE,
+    }
+
+
+async def reconcile_accessibility_tree(
+    accessibility_tree: Dict[str, Any],
+    only_input_fields: bool,
+    fetch_elements_info: Callable[
+        [List[Dict[str, Any]]], Awaitable[List[Optional[Dict[str, Any]]]]
+    ],
+    in_viewport_only: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Enriches every node of the accessibility tree that could be reconciled with a DOM element and prunes the tree.
+    All the nodes are collected first and their DOM information is fetched with a single call to `fetch_elements_info`.
+
+    Args:
+        accessibility_tree (Dict[str, Any]): The accessibility tree, with the mmid of each node in 'keyshortcuts'.
+        only_input_fields (bool): Flag indicating whether to include only input fields in the pruned tree.
+        fetch_elements_info (Callable): Receives a list of {'mmid', 'should_fetch_inner_text'} requests and returns
+            the information of the matching DOM elements in the same order (None for elements to skip,
+            {'viewport_position': 'above' | 'below'} for elements out of the viewport).
+        in_viewport_only (bool, optional): If True, the number of elements left out above and below the viewport
+            is added to the tree under 'viewport'. Defaults to False.
+
+    Returns:
+        Dict[str, Any] | None: The pruned tree with detailed information from the DOM.
+    """
+    nodes_to_enrich: List[Tuple[Dict[str, Any], int]] = []
+    requests: List[Dict[str, Any]] = []
+    stack = [accessibility_tree]
+    while stack:
+        node = stack.pop()
+        if "children" in node:
+            stack.extend(node["children"])
+        mmid = __should_enrich_node(node)
+        if mmid is None:
+            continue
+        nodes_to_enrich.append((node, mmid))
+        # Determine if we need to fetch 'innerText' based on the absence of 'children' in the accessibility node
+        requests.append(
+            {"mmid": mmid, "should_fetch_inner_text": "children" not in node}
+        )
+
+    with trace_span("dom.enrich", nodes=len(requests)):
+        elements_info = await fetch_elements_info(requests)
+        logger.debug(f"Fetched DOM information for {len(requests)} nodes in one call")
+
+        for (node, mmid), element_info in zip(nodes_to_enrich, elements_info):
+            __merge_element_attributes(node, mmid, element_info)
+
+    with trace_span("dom.prune") as span:
+        viewport_summary = (
+            __summarize_viewport(accessibility_tree) if in_viewport_only else None
+        )
+        pruned_tree = __prune_tree(accessibility_tree, only_input_fields)
+        if pruned_tree is not None and viewport_summary is not None:
+            pruned_tree["viewport"] = viewport_summary
+        if tracing_enabled():
+            span.set(bytes=json_size(pruned_tree))
+    return pruned_tree
 
 
 async def __fetch_dom_info(
-    page: Page, accessibility_tree: Dict[str, Any], only_input_fields: bool
+    page: Page,
+    accessibility_tree: Dict[str, Any],
+    only_input_fields: bool,
+    batch_enrichment: bool = True,
+    viewport_margin: Optional[int] = None,
 ):
     """
     Iterates over the accessibility tree, fetching additional information from the DOM based on 'mmid',
@@ -65,325 +358,66 @@ async def __fetch_dom_info(
         page (Page): The page object representing the web page.
         accessibility_tree (Dict[str, Any]): The accessibility tree JSON structure.
         only_input_fields (bool): Flag indicating whether to include only input fields in the new JSON structure.
+        batch_enrichment (bool, optional): If True, all the nodes are enriched with a single call into the page.
+            Otherwise every node is enriched with its own call. Both produce the same tree. Defaults to True.
+        viewport_margin (Optional[int], optional): If set, only the elements within this many pixels of the viewport
+            are enriched and kept. The tree passed in still covers the whole page. Defaults to None.
 
     Returns:
         Dict[str, Any]: The pruned tree with detailed information from the DOM.
     """
 
     logger.debug("Reconciling the Accessibility Tree with the DOM")
-    # Define the attributes to fetch for each element
-    attributes = [
-        "name",
-        "aria-label",
-        "placeholder",
-        "mmid",
-        "id",
-        "for",
-        "data-testid",
-    ]
-    backup_attributes = []  # if the attributes are not found, then try to get these attributes
-    tags_to_ignore = [
-        "head",
-        "style",
-        "script",
-        "link",
-        "meta",
-        "noscript",
-        "template",
-        "iframe",
-        "g",
-        "main",
-        "c-wiz",
-        "svg",
-        "path",
-    ]
-    attributes_to_delete = ["level", "multiline", "haspopup", "id", "for"]
-    ids_to_ignore = ["agentDriveAutoOverlay"]
-
-    # Recursive function to process each node in the accessibility tree
-    async def process_node(node: Dict[str, Any]):
-        if "children" in node:
-            for child in node["children"]:
-                await process_node(child)
-
-        # Use 'name' attribute from the accessibility node as 'mmid'
-        mmid_temp: str = node.get("keyshortcuts")  # type: ignore
-
-        # If the name has multiple mmids, take the last one
-        if mmid_temp and is_space_delimited_mmid(mmid_temp):
-            # TODO: consider if we should grab each of the mmids and process them separately as seperate nodes copying this node's attributes
-            mmid_temp = mmid_temp.split(" ")[-1]
-
-        # focusing on nodes with mmid, which is the attribute we inject
-        try:
-            mmid = int(mmid_temp)
-        except (ValueError, TypeError):
-            # logger.error(f"'name attribute contains \"{node.get('name')}\", which is not a valid numeric mmid. Adding node as is: {node}")
-            return node.get("name")
-
-        if node["role"] == "menuitem":
-            return node.get("name")
-
-        if node.get("role") == "dialog" and node.get("modal") == True:  # noqa: E712
-            node["important information"] = (
-                "This is a modal dialog. Please interact with this dialog and close it to be able to interact with the full page (e.g. by pressing the close button or selecting an option)."
+    input_params = {**ELEMENT_INFO_PARAMS, "viewport_margin": viewport_margin}
+    in_viewport_only = viewport_margin is not None
+
+    if batch_enrichment:
+        # Resolve all the nodes in one round trip to the page
+        async def fetch_elements_info(requests: List[Dict[str, Any]]):
+            return await call_page_runtime(
+                page, "enrichElements", {**input_params, "requests": requests}
             )
 
-        if mmid:
-            # Determine if we need to fetch 'innerText' based on the absence of 'children' in the accessibility node
-            should_fetch_inner_text = "children" not in node
-
-            js_code = """
-            (input_params) => {
-                const should_fetch_inner_text = input_params.should_fetch_inner_text;
-                const mmid = input_params.mmid;
-                const attributes = input_params.attributes;
-                const tags_to_ignore = input_params.tags_to_ignore;
-                const ids_to_ignore = input_params.ids_to_ignore;
-
-                const element = document.querySelector(`[mmid="${mmid}"]`);
-
-                if (!element) {
-                    console.log(`No element found with mmid: ${mmid}`);
-                    return null;
-                }
-
-                if (ids_to_ignore.includes(element.id)) {
-                    console.log(`Ignoring element with id: ${element.id}`, element);
-                    return null;
-                }
-                //Ignore "option" because it would have been processed with the select element
-                if (tags_to_ignore.includes(element.tagName.toLowerCase()) || element.tagName.toLowerCase() === "option") return null;
-
-                let attributes_to_values = {
-                    'tag': element.tagName.toLowerCase() // Always include the tag name
-                };
-
-                // If the element is an input, include its type as well
-                if (element.tagName.toLowerCase() === 'input') {
-                    attributes_to_values['tag_type'] = element.type; // This will capture 'checkbox', 'radio', etc.
-                }
-                else if (element.tagName.toLowerCase() === 'select') {
-                    attributes_to_values["mmid"] = element.getAttribute('mmid');
-                    attributes_to_values["role"] = "combobox";
-                    attributes_to_values["options"] = [];
-
-                    for (const option of element.options) {
-                        let option_attributes_to_values = {
-                            "mmid": option.getAttribute('mmid'),
-                            "text": option.text,
-                            "value": option.value,
-                            "selected": option.selected
-                        };
-                        attributes_to_values["options"].push(option_attributes_to_values);
-                    }
-                    return attributes_to_values;
-                }
-
-                for (const attribute of attributes) {
-                    let value = element.getAttribute(attribute);
-
-                    if(value){
-                        /*
-                        if(attribute === 'href'){
-                            value = value.split('?')[0]
-                        }
-                        */
-                        attributes_to_values[attribute] = value;
-                    }
-                }
-
-                if (should_fetch_inner_text && element.innerText) {
-                    attributes_to_values['description'] = element.innerText;
-                }
-
-                let role = element.getAttribute('role');
-                if(role==='listbox' || element.tagName.toLowerCase()=== 'ul'){
-                    let children=element.children;
-                    let filtered_children = Array.from(children).filter(child => child.getAttribute('role') === 'option');
-                    console.log("Listbox or ul found: ", filtered_children);
-                    let attributes_to_include = ['mmid', 'role', 'aria-label','value'];
-                    attributes_to_values["additional_info"]=[]
-                    for (const child of children) {
-                        let children_attributes_to_values = {};
-
-                        for (let attr of child.attributes) {
-                            // If the attribute is not in the predefined list, add it to children_attributes_to_values
-                            if (attributes_to_include.includes(attr.name)) {
-                                children_attributes_to_values[attr.name] = attr.value;
-                            }
-                        }
-
-                        attributes_to_values["additional_info"].push(children_attributes_to_values);
-                    }
-                }
-                // Check if attributes_to_values contains more than just 'name', 'role', and 'mmid'
-                const keys = Object.keys(attributes_to_values);
-                const minimalKeys = ['tag', 'mmid'];
-                const hasMoreThanMinimalKeys = keys.length > minimalKeys.length || keys.some(key => !minimalKeys.includes(key));
-
-                if (!hasMoreThanMinimalKeys) {
-                    //If there were no attributes found, then try to get the backup attributes
-                    for (const backupAttribute of input_params.backup_attributes) {
-                        let value = element.getAttribute(backupAttribute);
-                        if(value){
-                            attributes_to_values[backupAttribute] = value;
-                        }
-                    }
-
-                    //if even the backup attributes are not found, then return null, which will cause this element to be skipped
-                    if(Object.keys(attributes_to_values).length <= minimalKeys.length) {
-                        if (element.tagName.toLowerCase() === 'button') {
-                                attributes_to_values["mmid"] = element.getAttribute('mmid');
-                                attributes_to_values["role"] = "button";
-                                attributes_to_values["additional_info"] = [];
-                                let children=element.children;
-                                let attributes_to_exclude = ['width', 'height', 'path', 'class', 'viewBox', 'mmid']
-
-                                // Check if the button has no text and no attributes
-                                if (element.innerText.trim() === '') {
-
-                                    for (const child of children) {
-                                        let children_attributes_to_values = {};
-
-                                        for (let attr of child.attributes) {
-                                            // If the attribute is not in the predefined list, add it to children_attributes_to_values
-                                            if (!attributes_to_exclude.includes(attr.name)) {
-                                                children_attributes_to_values[attr.name] = attr.value;
-                                            }
-                                        }
-
-                                        attributes_to_values["additional_info"].push(children_attributes_to_values);
-                                    }
-                                    console.log("Button with no text and no attributes: ", attributes_to_values);
-                                    return attributes_to_values;
-                                }
-                        }
-
-                        return null; // Return null if only minimal keys are present
-                    }
-                }
-                return attributes_to_values;
-            }
-            """
+        pruned_tree = await reconcile_accessibility_tree(
+            accessibility_tree, only_input_fields, fetch_elements_info, in_viewport_only
+        )
+    else:
+        # Recursive function to process each node in the accessibility tree
+        async def process_node(node: Dict[str, Any]):
+            if "children" in node:
+                for child in node["children"]:
+                    await process_node(child)
+
+            mmid = __should_enrich_node(node)
+            if mmid is None:
+                return
 
             # Fetch attributes and possibly 'innerText' from the DOM element by 'mmid'
-            element_attributes = await page.evaluate(
-                js_code,
+            element_attributes = await call_page_runtime(
+                page,
+                "enrichElement",
                 {
+                    **input_params,
                     "mmid": mmid,
-                    "attributes": attributes,
-                    "backup_attributes": backup_attributes,
-                    "should_fetch_inner_text": should_fetch_inner_text,
-                    "tags_to_ignore": tags_to_ignore,
-                    "ids_to_ignore": ids_to_ignore,
+                    # Determine if we need to fetch 'innerText' based on the absence of 'children' in the accessibility node
+                    "should_fetch_inner_text": "children" not in node,
                 },
             )
+            __merge_element_attributes(node, mmid, element_attributes)
 
-            if "keyshortcuts" in node:
-                del node["keyshortcuts"]  # remove keyshortcuts since it is not needed
-
-            node["mmid"] = mmid
-
-            # Update the node with fetched information
-            if element_attributes:
-                node.update(element_attributes)
-
-                # check if 'name' and 'mmid' are the same
-                if (
-                    node.get("name") == node.get("mmid")
-                    and node.get("role") != "textbox"
-                ):
-                    del node["name"]  # Remove 'name' from the node
-
-                if (
-                    "name" in node
-                    and "description" in node
-                    and (
-                        node["name"] == node["description"]
-                        or node["name"] == node["description"].replace("\n", " ")
-                        or node["description"].replace("\n", "") in node["name"]
-                    )
-                ):
-                    del node[
-                        "description"
-                    ]  # if the name is same as description, then remove the description to avoid duplication
-
-                if (
-                    "name" in node
-                    and "aria-label" in node
-                    and node["aria-label"] in node["name"]
-                ):
-                    del node[
-                        "aria-label"
-                    ]  # if the name is same as the aria-label, then remove the aria-label to avoid duplication
-
-                if "name" in node and "text" in node and node["name"] == node["text"]:
-                    del node[
-                        "text"
-                    ]  # if the name is same as the text, then remove the text to avoid duplication
-
-                if (
-                    node.get("tag") == "select"
-                ):  # children are not needed for select menus since "options" attriburte is already added
-                    node.pop("children", None)
-                    node.pop("role", None)
-                    node.pop("description", None)
-
-                # role and tag can have the same info. Get rid of role if it is the same as tag
-                if node.get("role") == node.get("tag"):
-                    del node["role"]
-
-                # avoid duplicate aria-label
-                if (
-                    node.get("aria-label")
-                    and node.get("placeholder")
-                    and node.get("aria-label") == node.get("placeholder")
-                ):
-                    del node["aria-label"]
-
-                if node.get("role") == "link":
-                    del node["role"]
-                    if node.get("description"):
-                        node["text"] = node["description"]
-                        del node["description"]
-
-                # textbox just means a text input and that is expressed well enough with the rest of the attributes returned
-                # if node.get('role') == "textbox":
-                #    del node['role']
-
-                if node.get("role") == "textbox":
-                    # get the id attribute of this field from the DOM
-                    if "id" in element_attributes and element_attributes["id"]:
-                        # find if there is an element in the DOM that has this id in aria-labelledby.
-                        js_code = """
-                        (inputParams) => {
-                            let referencingElements = [];
-                            const referencedElement = document.querySelector(`[aria-labelledby="${inputParams.aria_labelled_by_query_value}"]`);
-                            if(referencedElement) {
-                                const mmid = referencedElement.getAttribute('mmid');
-                                if (mmid) {
-                                    return {"mmid": mmid, "tag": referencedElement.tagName.toLowerCase()};
-                                }
-                            }
-                            return null;
-                        }
-                        """
-                    # textbox just means a text input and that is expressed well enough with the rest of the attributes returned
-                    # del node['role']
-
-            # remove attributes that are not needed once processing of a node is complete
-            for attribute_to_delete in attributes_to_delete:
-                if attribute_to_delete in node:
-                    node.pop(attribute_to_delete, None)
-        else:
-            logger.debug(f"No element found with mmid: {mmid}, deleting node: {node}")
-            node["marked_for_deletion_by_mm"] = True
-
-    # Process each node in the tree starting from the root
-    await process_node(accessibility_tree)
+        # Process each node in the tree starting from the root
+        with trace_span("dom.enrich", batch=False):
+            await process_node(accessibility_tree)
 
-    pruned_tree = __prune_tree(accessibility_tree, only_input_fields)
+        with trace_span("dom.prune") as span:
+            viewport_summary = (
+                __summarize_viewport(accessibility_tree) if in_viewport_only else None
+            )
+            pruned_tree = __prune_tree(accessibility_tree, only_input_fields)
+            if pruned_tree is not None and viewport_summary is not None:
+                pruned_tree["viewport"] = viewport_summary
+            if tracing_enabled():
+                span.set(bytes=json_size(pruned_tree))
 
     logger.debug("Reconciliation complete")
     return pruned_tree
@@ -395,17 +429,7 @@ async def __cleanup_dom(page: Page):
     from 'orig-aria-keyshortcuts'.
     """
     logger.debug("Cleaning up the DOM's previous injections")
-    await page.evaluate("""() => {
-        const allElements = document.querySelectorAll('*[mmid]');
-        allElements.forEach(element => {
-            element.removeAttribute('aria-keyshortcuts');
-            const origAriaLabel = element.getAttribute('orig-aria-keyshortcuts');
-            if (origAriaLabel) {
-                element.setAttribute('aria-keyshortcuts', origAriaLabel);
-                element.removeAttribute('orig-aria-keyshortcuts');
-            }
-        });
-    }""")
+    await call_page_runtime(page, "cleanupMmids")
     logger.debug("DOM cleanup complete")
 
 
@@ -413,7 +437,7 @@ def __prune_tree(
     node: Dict[str, Any], only_input_fields: bool
 ) -> Optional[Dict[str, Any]]:
     """
-    Recursively prunes a tree starting from `node`, based on pruning conditions and handling of 'unraveling'.
+    Prunes a tree starting from `node`, based on pruning conditions and handling of 'unraveling'.
 
     The function has two main jobs:
     1. Pruning: Remove nodes that don't meet certain conditions, like being marked for deletion.
@@ -423,63 +447,75 @@ def __prune_tree(
     This happens in place, meaning we modify the tree as we go, which is efficient but means you should
     be cautious about modifying the tree outside this function during a prune operation.
 
+    The tree is walked with an explicit stack, so deep trees do not hit the recursion limit, and the children of
+    every node are rebuilt in a single pass, so wide containers with many unraveled children take linear time.
+    The leaves, most of the tree, are decided as their parent is rebuilt, without going through the stack.
+
     Args:
-    - node (Dict[str, Any]): The node we're currently looking at. We'll check this node, its children,
-      and so on, recursively down the tree.
+    - node (Dict[str, Any]): The root of the tree to prune.
     - only_input_fields (bool): If True, we're only interested in pruning input-related nodes (like form fields).
       This lets you narrow the focus if, for example, you're only interested in cleaning up form-related parts
       of a larger tree.
 
     Returns:
-    - Dict[str, Any] | None: The pruned version of `node`, or None if `node` was pruned away. When we 'unravel'
-      a node, we directly replace it with its children in the parent's list of children, so the return value
-      will be the parent, updated in place.
+    - Dict[str, Any] | None: The pruned version of `node`, or None if `node` was pruned away.
 
     Notes:
     - 'marked_for_deletion_by_mm' is our flag for nodes that should definitely be removed.
     - Unraveling is neat for flattening the tree when a node is just a wrapper without semantic meaning.
-    - We use a while loop with manual index management to safely modify the list of children as we iterate over it.
+    - The children lifted up from an unraveled node are kept as they are, without being pruned themselves.
     """
     if "marked_for_deletion_by_mm" in node:
         return None
-
-    if "children" in node:
-        i = 0
-        while i < len(node["children"]):
-            child = node["children"][i]
+    if "children" not in node:
+        return None if __should_prune_node(node, only_input_fields) else node
+
+    # The nodes with children are rebuilt in a first pass, parents before children. A node whose children are all
+    # leaves is finished right away, the others are finished in the reverse order, once their children are done.
+    # The nodes pruned away in the first pass are flagged, so that their parent drops them when it is finished.
+    pending: List[Dict[str, Any]] = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        children = []
+        has_pending_children = False
+        for child in current["children"]:
             if "marked_for_unravel_children" in child:
-                # Replace the current child with its children
-                if "children" in child:
-                    node["children"] = (
-                        node["children"][:i]
-                        + child["children"]
-                        + node["children"][i + 1 :]
-                    )
-                    i += (
-                        len(child["children"]) - 1
-                    )  # Adjust the index for the new children
-                else:
-                    # If the node marked for unraveling has no children, remove it
-                    node["children"].pop(i)
-                    i -= 1  # Adjust the index since we removed an element
+                # Replace the child with its children, which are kept as they are, or remove it if it has none
+                children.extend(child.get("children", []))
+            elif "marked_for_deletion_by_mm" in child:
+                continue
+            elif "children" not in child:
+                # Leaves are decided right away instead of going through the stack
+                if not __should_prune_node(child, only_input_fields):
+                    children.append(child)
             else:
-                # Recursively prune the child if it's not marked for unraveling
-                pruned_child = __prune_tree(child, only_input_fields)
-                if pruned_child is None:
-                    # If the child is pruned, remove it from the children list
-                    node["children"].pop(i)
-                    i -= 1  # Adjust the index since we removed an element
-                else:
-                    # Update the child with the pruned version
-                    node["children"][i] = pruned_child
-            i += 1  # Move to the next child
-
+                stack.append(child)
+                children.append(child)
+                has_pending_children = True
+        if has_pending_children:
+            current["children"] = children
+            pending.append(current)
+            continue
         # After processing all children, if the children array is empty, remove it
-        if not node["children"]:
-            del node["children"]
+        if children:
+            current["children"] = children
+        else:
+            del current["children"]
+        # Apply existing conditions to decide if the current node should be pruned
+        if __should_prune_node(current, only_input_fields):
+            current[__PRUNED] = True
+
+    for current in reversed(pending):
+        children = [child for child in current["children"] if __PRUNED not in child]
+        if children:
+            current["children"] = children
+        else:
+            del current["children"]
+        if __should_prune_node(current, only_input_fields):
+            current[__PRUNED] = True
 
-    # Apply existing conditions to decide if the current node should be pruned
-    return None if __should_prune_node(node, only_input_fields) else node
+    return None if node.pop(__PRUNED, False) else node
 
 
 def __should_prune_node(node: Dict[str, Any], only_input_fields: bool):
@@ -588,7 +624,12 @@ async def get_dom_with_accessibility_info() -> (
     return await do_get_accessibility_info(page)
 
 
-async def do_get_accessibility_info(page: Page, only_input_fields: bool = False):
+async def do_get_accessibility_info(
+    page: Page,
+    only_input_fields: bool = False,
+    batch_enrichment: bool = True,
+    viewport_margin: Optional[int] = None,
+):
     """
     Retrieves the accessibility information of a web page and saves it as JSON files.
 
@@ -596,40 +637,42 @@ async def do_get_accessibility_info(page: Page, only_input_fields: bool = False)
         page (Page): The page object representing the web page.
         only_input_fields (bool, optional): If True, only retrieves accessibility information for input fields.
             Defaults to False.
+        batch_enrichment (bool, optional): If True, enriches the whole tree with a single call into the page
+            instead of one call per node. Defaults to True.
+        viewport_margin (Optional[int], optional): If set, only the elements intersecting the viewport extended by
+            this many pixels above and below are enriched and kept, and the number of elements left out is reported
+            under 'viewport'. Only the output is bounded: the mmids are still injected into every element and the
+            accessibility snapshot still covers the whole page. Defaults to None, which keeps the whole page.
 
     Returns:
         Dict[str, Any] or None: The enhanced accessibility tree as a dictionary, or None if an error occurred.
     """
-    await __inject_attributes(page)
-    accessibility_tree: Dict[str, Any] = await page.accessibility.snapshot(
-        interesting_only=True
-    )  # type: ignore
-
-    with open(
-        os.path.join(SOURCE_LOG_FOLDER_PATH, "json_accessibility_dom.json"),
-        "w",
-        encoding="utf-8",
-    ) as f:
-        f.write(json.dumps(accessibility_tree, indent=2))
-        logger.debug("json_accessibility_dom.json saved")
-
-    await __cleanup_dom(page)
+    with trace_span("dom.inject"):
+        await __inject_attributes(page)
+    set_element_id_source(page, INJECTED_MMIDS)
+    with trace_span("dom.snapshot") as span:
+        accessibility_tree: Dict[str, Any] = await page.accessibility.snapshot(
+            interesting_only=True
+        )  # type: ignore
+        if tracing_enabled():
+            span.set(bytes=json_size(accessibility_tree))
+
+    dump_debug_artifact("json_accessibility_dom.json", accessibility_tree)
+
+    with trace_span("dom.cleanup"):
+        await __cleanup_dom(page)
     try:
         enhanced_tree = await __fetch_dom_info(
-            page, accessibility_tree, only_input_fields
+            page,
+            accessibility_tree,
+            only_input_fields,
+            batch_enrichment,
+            viewport_margin,
         )
 
         logger.debug("Enhanced Accessibility Tree ready")
 
-        with open(
-            os.path.join(
-                SOURCE_LOG_FOLDER_PATH, "json_accessibility_dom_enriched.json"
-            ),
-            "w",
-            encoding="utf-8",
-        ) as f:
-            f.write(json.dumps(enhanced_tree, indent=2))
-            logger.debug("json_accessibility_dom_enriched.json saved")
+        dump_debug_artifact("json_accessibility_dom_enriched.json", enhanced_tree)
 
         return enhanced_tree
     except Exception as e:
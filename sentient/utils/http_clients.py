@@ -0,0 +1,170 @@
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from sentient.config.config import env_bool, env_float, env_int, override_config
+from sentient.utils.logger import logger
+
+# The HTTP clients of the LLM providers are shared by all the agents of the process, one per provider and base url,
+# so that the connections (and their TLS sessions) are reused across agents and sessions instead of being opened
+# again by every agent. The pool is configured from the environment:
+#   SENTIENT_HTTP_MAX_CONNECTIONS=<n>        the connections open at the same time per client, defaults to 100
+#   SENTIENT_HTTP_MAX_KEEPALIVE=<n>          the idle connections kept open per client, defaults to 20
+#   SENTIENT_HTTP_KEEPALIVE_EXPIRY=<seconds> how long an idle connection is kept open, defaults to 60, longer than
+#                                            the browser actions between two requests of a session
+#   SENTIENT_HTTP_TIMEOUT=<seconds>          the timeout of a request, defaults to 120
+#   SENTIENT_HTTP_CONNECT_TIMEOUT=<seconds>  the timeout of opening a connection, defaults to 10
+#   SENTIENT_HTTP2=0                         disable HTTP/2, used by default when the h2 package is installed
+# or with configure_http_clients.
+__config: Dict[str, Any] = {
+    "max_connections": env_int("SENTIENT_HTTP_MAX_CONNECTIONS", 100),
+    "max_keepalive_connections": env_int("SENTIENT_HTTP_MAX_KEEPALIVE", 20),
+    "keepalive_expiry": env_float("SENTIENT_HTTP_KEEPALIVE_EXPIRY", 60.0),
+    "timeout": env_float("SENTIENT_HTTP_TIMEOUT", 120.0),
+    "connect_timeout": env_float("SENTIENT_HTTP_CONNECT_TIMEOUT", 10.0),
+    "http2": env_bool("SENTIENT_HTTP2", True),
+}
+
+# The connections of an async client belong to the event loop they were opened in, so the clients are kept per loop
+__clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+__clients_lock = threading.Lock()
+__stats: Dict[str, Dict[str, int]] = {}
+
+
+def configure_http_clients(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+    timeout: Optional[float] = None,
+    connect_timeout: Optional[float] = None,
+    http2: Optional[bool] = None,
+):
+    """
+    Overrides the configuration read from the environment. Arguments left to None are not changed. Only the clients
+    created afterwards use the new configuration, see close_http_clients.
+
+    Args:
+        max_connections (Optional[int]): The connections open at the same time per client.
+        max_keepalive_connections (Optional[int]): The idle connections kept open per client.
+        keepalive_expiry (Optional[float]): How long an idle connection is kept open, in seconds.
+        timeout (Optional[float]): The timeout of a request, in seconds.
+        connect_timeout (Optional[float]): The timeout of opening a connection, in seconds.
+        http2 (Optional[bool]): Whether to use HTTP/2 when the h2 package is installed.
+    """
+    override_config(
+        __config,
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+        timeout=timeout,
+        connect_timeout=connect_timeout,
+        http2=http2,
+    )
+
+
+def __http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def __new_client(key: str) -> httpx.AsyncClient:
+    stats = __stats.setdefault(
+        key,
+        {
+            "clients": 0,
+            "requests": 0,
+            "connections": 0,
+            "tls_handshakes": 0,
+            "http2_requests": 0,
+        },
+    )
+    stats["clients"] += 1
+
+    async def count_connection_events(event: str, info: Dict[str, Any]):
+        if event == "connection.connect_tcp.complete":
+            stats["connections"] += 1
+        elif event == "connection.start_tls.complete":
+            stats["tls_handshakes"] += 1
+        elif event in (
+            "http11.send_request_headers.started",
+            "http2.send_request_headers.started",
+        ):
+            stats["requests"] += 1
+            if event.startswith("http2"):
+                stats["http2_requests"] += 1
+
+    async def trace_request(request: httpx.Request):
+        request.extensions["trace"] = count_connection_events
+
+    http2 = __config["http2"] and __http2_available()
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=__config["max_connections"],
+            max_keepalive_connections=__config["max_keepalive_connections"],
+            keepalive_expiry=__config["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(__config["timeout"], connect=__config["connect_timeout"]),
+        http2=http2,
+        follow_redirects=True,
+        event_hooks={"request": [trace_request]},
+    )
+
+
+def get_http_client(
+    provider_name: str, base_url: Optional[str] = None
+) -> httpx.AsyncClient:
+    """
+    Returns the HTTP client shared by the agents of a provider in the running event loop, created on first use.
+
+    Args:
+        provider_name (str): The name of the provider.
+        base_url (Optional[str], optional): The base url of the provider, for the providers that can have several
+            (e.g. custom). Defaults to None.
+
+    Returns:
+        httpx.AsyncClient: The client, to pass as the http_client of the provider's SDK client.
+    """
+    key = f"{provider_name}:{base_url}" if base_url else provider_name
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # an agent created outside of an event loop, there is no loop to share its client in yet
+        return __new_client(key)
+    with __clients_lock:
+        clients = __clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = clients[key] = __new_client(key)
+            logger.debug(f"Created the shared HTTP client of {key}")
+        return client
+
+
+def get_http_client_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns, for every provider key, the clients created, the requests sent, the connections opened (and TLS
+    handshakes done) to send them, the requests sent over HTTP/2, and the share of the requests that reused an open
+    connection.
+    """
+    stats = {}
+    for key, counts in __stats.items():
+        stats[key] = dict(counts)
+        reused = max(0, counts["requests"] - counts["connections"])
+        stats[key]["reused_connections"] = reused
+        stats[key]["reuse_rate"] = (
+            reused / counts["requests"] if counts["requests"] else 0.0
+        )
+    return stats
+
+
+async def close_http_clients():
+    """
+    Closes the shared clients of the running event loop, e.g. when the server stops. New clients are created on the
+    next request.
+    """
+    with __clients_lock:
+        clients = __clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
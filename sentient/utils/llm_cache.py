@@ -0,0 +1,344 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sentient.config.config import (
+    FALSE_VALUES,
+    SOURCE_LOG_FOLDER_PATH,
+    TRUE_VALUES,
+    env_choice,
+    env_float,
+    env_int,
+    env_str,
+    override_config,
+)
+from sentient.utils.logger import logger
+
+# The LLM response cache replays the response of a request that was already answered, when the provider, the model,
+# the messages (system prompt, input, DOM) and the response schema are byte-identical, e.g. when the same goal is run
+# again during development or in regression runs. It is off by default and configured from the environment:
+#   SENTIENT_LLM_CACHE=on|read_only|off    use the cache, read_only never writes to it (e.g. for benchmarks)
+#   SENTIENT_LLM_CACHE_PATH=<path>         the SQLite file, defaults to log_files/llm_cache.sqlite
+#   SENTIENT_LLM_CACHE_MAX_BYTES=<n>       the size of the responses kept, the least recently used are evicted
+#                                          first, defaults to 100 MB
+#   SENTIENT_LLM_CACHE_TTL=<seconds>       how long a response is kept, 0 keeps it forever, defaults to 7 days
+# or with configure_llm_cache.
+__MODES = ("on", "read_only", "off")
+
+__config: Dict[str, Any] = {
+    "mode": env_choice(
+        "SENTIENT_LLM_CACHE",
+        __MODES,
+        "off",
+        aliases={
+            **{value: "on" for value in TRUE_VALUES},
+            **{value: "off" for value in FALSE_VALUES},
+        },
+    ),
+    "path": env_str(
+        "SENTIENT_LLM_CACHE_PATH",
+        os.path.join(SOURCE_LOG_FOLDER_PATH, "llm_cache.sqlite"),
+    ),
+    "max_bytes": env_int("SENTIENT_LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024),
+    "ttl": env_float("SENTIENT_LLM_CACHE_TTL", 7 * 24 * 3600),
+}
+
+__cache: Optional["LLMResponseCache"] = None
+__cache_lock = threading.Lock()
+
+
+class LLMResponseCache:
+    """
+    A content addressed cache of LLM responses in a SQLite file, bounded in size with least recently used eviction
+    and in age with a time to live. It can be shared by the agents of a process, and by processes.
+
+    Its methods block on SQLite, async code calls them in a worker thread (see BaseAgent._complete). A hit only
+    reads: the last accesses are kept in memory and written with the next put, or when ACCESS_BATCH_SIZE of them
+    are pending, or on close. The size of the responses is kept in memory too, and only summed from the file again
+    when it exceeds max_bytes, since other processes may have changed it.
+    """
+
+    # the number of last accesses kept in memory before they are written
+    ACCESS_BATCH_SIZE = 64
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path (str): The SQLite file.
+            max_bytes (int, optional): The size of the responses kept. Defaults to 100 MB.
+            ttl (Optional[float], optional): How long a response is kept, in seconds, None or 0 keeps it forever.
+                Defaults to 7 days.
+            read_only (bool, optional): Whether the cache is only read: responses are not written, nothing is
+                evicted and the last access of the responses is not updated, so that runs (e.g. benchmarks) replay
+                the same responses. Defaults to False.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.read_only = read_only
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+        # the connection is shared by worker threads
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        # the last access of the responses read since the last write, by key
+        self._pending_accesses: Dict[str, float] = {}
+        self._size = 0
+        if read_only:
+            if os.path.exists(path):
+                self._connection = sqlite3.connect(
+                    f"file:{path}?mode=ro", uri=True, check_same_thread=False
+                )
+            else:
+                logger.warning(
+                    f"The LLM response cache {path} does not exist, every request will miss"
+                )
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+            self._connection.commit()
+            self._size = self._sum_sizes()
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        response_schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Returns the key of a request: the SHA-256 of its provider, model, messages and response schema, serialized
+        to canonical JSON.
+        """
+        request = json.dumps(
+            {
+                "provider": provider,
+                "model": model,
+                "messages": messages,
+                "response_schema": response_schema,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the response of a request, or None if it is not cached or it expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = None
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT value, size, created_at FROM responses WHERE key = ?",
+                    (key,),
+                ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            value, size, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                if not self.read_only:
+                    self._connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,)
+                    )
+                    self._connection.commit()
+                    self._size -= size
+                    self._pending_accesses.pop(key, None)
+                return None
+            self._stats["hits"] += 1
+            if not self.read_only:
+                self._pending_accesses[key] = now
+                if len(self._pending_accesses) >= self.ACCESS_BATCH_SIZE:
+                    self._write_accesses()
+                    self._connection.commit()
+            return value
+
+    def put(self, key: str, value: str):
+        """
+        Caches the response of a request. When the cache no longer fits in max_bytes, the expired responses are evicted,
+        then the least recently used ones until it fits. Does nothing in read only mode.
+        """
+        if self.read_only or self._connection is None:
+            return
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._pending_accesses.pop(key, None)
+            self._size += size - (row[0] if row else 0)
+            self._stats["writes"] += 1
+            self._write_accesses()
+            self._evict(now)
+            self._connection.commit()
+
+    def _write_accesses(self):
+        if self._pending_accesses:
+            self._connection.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [
+                    (accessed_at, key)
+                    for key, accessed_at in self._pending_accesses.items()
+                ],
+            )
+            self._pending_accesses.clear()
+
+    def _sum_sizes(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _evict(self, now: float):
+        if self._size <= self.max_bytes:
+            return
+        # the expired responses are deleted when they are read, and the others only once the cache is full
+        evicted = 0
+        if self.ttl is not None:
+            evicted += self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        self._size = self._sum_sizes()
+        if self._size > self.max_bytes:
+            for key, size in self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"
+            ).fetchall():
+                if self._size <= self.max_bytes:
+                    break
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                evicted += 1
+        self._stats["evictions"] += evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Returns the hits, misses (of which expired), writes and evictions since the cache was opened, the hit rate,
+        and the number and size of the responses cached.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            entries, size = 0, 0
+            if self._connection is not None:
+                entries, size = self._connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = entries
+        stats["bytes"] = size
+        return stats
+
+    def clear(self):
+        """
+        Removes every response. Does nothing in read only mode.
+        """
+        if self.read_only or self._connection is None:
+            return
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+            self._pending_accesses.clear()
+            self._size = 0
+
+    def close(self):
+        """
+        Writes the last accesses still in memory and closes the file.
+        """
+        with self._lock:
+            if self._connection is not None:
+                if not self.read_only:
+                    self._write_accesses()
+                    self._connection.commit()
+                self._connection.close()
+                self._connection = None
+
+
+def configure_llm_cache(
+    mode: Optional[str] = None,
+    path: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    ttl: Optional[float] = None,
+):
+    """
+    Overrides the configuration read from the environment. Arguments left to None are not changed. The cache is
+    reopened with the new configuration.
+
+    Args:
+        mode (Optional[str]): "on", "read_only" or "off".
+        path (Optional[str]): The SQLite file.
+        max_bytes (Optional[int]): The size of the responses kept.
+        ttl (Optional[float]): How long a response is kept, in seconds, 0 keeps it forever.
+    """
+    global __cache
+    if mode is not None and mode not in __MODES:
+        raise ValueError(
+            f"The mode of the LLM cache must be one of {__MODES}, not {mode}"
+        )
+    override_config(__config, mode=mode, path=path, max_bytes=max_bytes, ttl=ttl)
+    with __cache_lock:
+        if __cache is not None:
+            __cache.close()
+            __cache = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Returns the cache shared by the agents of the process, or None if it is off.
+    """
+    global __cache
+    if __config["mode"] not in ("on", "read_only"):
+        return None
+    with __cache_lock:
+        if __cache is None:
+            __cache = LLMResponseCache(
+                __config["path"],
+                max_bytes=__config["max_bytes"],
+                ttl=__config["ttl"],
+                read_only=__config["mode"] == "read_only",
+            )
+        return __cache
+
+
+def __close_llm_cache():
+    # writes the last accesses of the shared cache still in memory
+    with __cache_lock:
+        if __cache is not None:
+            __cache.close()
+
+
+atexit.register(__close_llm_cache)
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Union
+
+import httpx
+
+from sentient.config.config import env_str
+from sentient.utils.logger import logger
+
+# The mock LLM answers the requests of the agents without any network, from a script of outputs or from recorded
+# transcripts, so that the orchestrator can be benchmarked and load tested deterministically. It speaks the chat
+# completions API of OpenAI through an httpx transport, so the whole client stack (instructor, retries, streaming,
+# usage accounting) runs as it does with a real provider.
+#
+# Transcripts of real runs are recorded from the environment:
+#   SENTIENT_LLM_TRANSCRIPT=<path>   append every validated output of the agents, with the hash of its prompt, to
+#                                    this JSONL file, which the mock provider can replay
+# or with configure_transcript_recording. The mock provider itself is configured from the environment when created
+# by get_provider("mock"):
+#   SENTIENT_MOCK_SCRIPT=<path>      the JSON list of outputs, or the JSONL transcript, to answer with
+#   SENTIENT_MOCK_MATCH=step|prompt  answer with the output of the same step, or of the same prompt hash
+#   SENTIENT_MOCK_LATENCY=<seconds>  the latency of every answer, defaults to 0
+#   SENTIENT_MOCK_JITTER=<seconds>   a random extra latency of up to this, defaults to 0
+MATCH_MODES = ("step", "prompt")
+
+__transcript_config: Dict[str, Any] = {
+    "path": env_str("SENTIENT_LLM_TRANSCRIPT"),
+}
+__transcript_lock = threading.Lock()
+
+
+def configure_transcript_recording(path: Optional[str] = None):
+    """
+    Sets the JSONL file the outputs of the agents are appended to, None stops the recording.
+    """
+    __transcript_config["path"] = path
+
+
+def hash_messages(messages: List[Dict[str, Any]]) -> str:
+    """
+    Returns the hash of the messages of a request, serialized to canonical JSON, as matched by the prompt mode of
+    the mock LLM.
+    """
+    request = json.dumps(
+        messages,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+def record_transcript(
+    messages: List[Dict[str, Any]], output: Any, model: Optional[str] = None
+):
+    """
+    Appends an output and the hash of its prompt to the transcript file, when recording is on.
+
+    Args:
+        messages (List[Dict[str, Any]]): The messages the output answers.
+        output (Any): The output, a pydantic model.
+        model (Optional[str], optional): The model that wrote it. Defaults to None.
+    """
+    path = __transcript_config["path"]
+    if not path:
+        return
+    record = {
+        "prompt_hash": hash_messages(messages),
+        "model": model,
+        "output": output.model_dump(mode="json"),
+    }
+    try:
+        line = json.dumps(record, ensure_ascii=False)
+        with __transcript_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except Exception as e:
+        logger.warning(f"Could not record the transcript: {e}")
+
+
+def load_script(path: str) -> List[Dict[str, Any]]:
+    """
+    Loads the outputs of a mock LLM from a file: a JSON list of outputs, or a JSONL transcript, each line being
+    either an output or a record {"output": ..., "prompt_hash"?: ..., "latency"?: ...}.
+
+    Returns:
+        List[Dict[str, Any]]: The records, with the output under "output".
+    """
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        entries = json.loads(content)
+    else:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [entry if "output" in entry else {"output": entry} for entry in entries]
+
+
+class MockLLM:
+    """
+    Answers chat completion requests with scripted outputs, by step (the n-th request gets the n-th output) or by
+    prompt hash (the output recorded for the same messages), after an artificial latency.
+    """
+
+    def __init__(
+        self,
+        script: Union[str, List[Any]],
+        match: str = "step",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: Optional[int] = 0,
+    ):
+        """
+        Args:
+            script (Union[str, List[Any]]): The path of the script (see load_script), or the outputs themselves,
+                as pydantic models, dicts or records.
+            match (str, optional): "step" or "prompt". Defaults to "step".
+            latency (float, optional): The latency of every answer, in seconds, unless its record sets its own.
+                Defaults to 0.0.
+            jitter (float, optional): A random extra latency of up to this, in seconds. Defaults to 0.0.
+            seed (Optional[int], optional): The seed of the jitter, so that runs are repeatable. Defaults to 0.
+        """
+        if match not in MATCH_MODES:
+            raise ValueError(
+                f"The match mode must be one of {MATCH_MODES}, not {match}"
+            )
+        if isinstance(script, str):
+            self.records = load_script(script)
+        else:
+            self.records = [self.__to_record(entry) for entry in script]
+        self.match = match
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._by_prompt_hash = {
+            record["prompt_hash"]: record
+            for record in self.records
+            if "prompt_hash" in record
+        }
+        if match == "prompt" and not self._by_prompt_hash:
+            raise ValueError(
+                "Matching by prompt needs records with a prompt_hash, e.g. a recorded transcript"
+            )
+        self.requests = 0
+        self.reset()
+
+    @staticmethod
+    def __to_record(entry: Any) -> Dict[str, Any]:
+        if hasattr(entry, "model_dump"):
+            return {"output": entry.model_dump(mode="json")}
+        return entry if "output" in entry else {"output": entry}
+
+    def reset(self):
+        """
+        Starts the script over, e.g. before the next run of a benchmark.
+        """
+        self.step = 0
+
+    def _find_record(self, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if self.match == "prompt":
+            return self._by_prompt_hash.get(hash_messages(messages))
+        if self.step >= len(self.records):
+            return None
+        record = self.records[self.step]
+        self.step += 1
+        return record
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """
+        Answers a chat completion request of an OpenAI client, as the tool call of its response model, or as a
+        stream of chunks when it asks for one.
+        """
+        body = json.loads(request.content)
+        self.requests += 1
+        record = self._find_record(body.get("messages", []))
+        if record is None:
+            error = f"The mock LLM has no output for {'step ' + str(self.step + 1) if self.match == 'step' else 'this prompt'}"
+            # a client error, which the clients do not retry
+            return httpx.Response(
+                400, json={"error": {"message": error, "type": "invalid_request_error"}}
+            )
+
+        latency = record.get("latency", self.latency) + self._random.uniform(
+            0, self.jitter
+        )
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        arguments = json.dumps(record["output"], ensure_ascii=False)
+        tools = body.get("tools") or [{"function": {"name": "AgentOutput"}}]
+        name = tools[0]["function"]["name"]
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(arguments) // 4
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self.__stream(body["model"], name, arguments),
+            )
+        return httpx.Response(
+            200,
+            json={
+                "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls",
+                        "message": {
+                            "role": "assistant",
+                            "content": None,
+                            "tool_calls": [
+                                {
+                                    "id": "call_mock",
+                                    "type": "function",
+                                    "function": {"name": name, "arguments": arguments},
+                                }
+                            ],
+                        },
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def __stream(self, model: str, name: str, arguments: str, chunk_size: int = 32):
+        async def chunks():
+            for start in range(0, len(arguments), chunk_size):
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {
+                                "tool_calls": [
+                                    {
+                                        "index": 0,
+                                        "id": "call_mock" if start == 0 else None,
+                                        "type": "function",
+                                        "function": {
+                                            "name": name if start == 0 else None,
+                                            "arguments": arguments[
+                                                start : start + chunk_size
+                                            ],
+                                        },
+                                    }
+                                ]
+                            },
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+                # lets the client parse the chunk before the next one, as over a network
+                await asyncio.sleep(0)
+            yield b"data: [DONE]\n\n"
+
+        return chunks()
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """
+        Returns an HTTP client whose requests are answered by the mock, without any network.
+        """
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
@@ -0,0 +1,509 @@
+import hashlib
+from typing import Any, Union
+
+from playwright.async_api import BrowserContext, ElementHandle, Page
+
+from sentient.utils.logger import logger
+
+# The functions the skills and the DOM extraction run in the page, installed once per document as
+# window.__sentient_runtime instead of shipping their source with every page.evaluate call.
+__PAGE_RUNTIME_SOURCE = """
+    const elementsByMmid = () => {
+        // Index the tagged elements once instead of running a document-wide querySelector per mmid
+        const elements_by_mmid = new Map();
+        for (const element of document.querySelectorAll('[mmid]')) {
+            const element_mmid = element.getAttribute('mmid');
+            if (!elements_by_mmid.has(element_mmid)) {
+                elements_by_mmid.set(element_mmid, element);
+            }
+        }
+        return elements_by_mmid;
+    };
+
+    function getElementInfo(element, mmid, should_fetch_inner_text, input_params) {
+        const attributes = input_params.attributes;
+        const tags_to_ignore = input_params.tags_to_ignore;
+        const ids_to_ignore = input_params.ids_to_ignore;
+
+        if (!element) {
+            console.log(`No element found with mmid: ${mmid}`);
+            return null;
+        }
+
+        // Elements that are not rendered have no box, they are kept since their position is unknown
+        if (input_params.viewport_margin !== null && input_params.viewport_margin !== undefined && element.getClientRects().length) {
+            const rect = element.getBoundingClientRect();
+            if (rect.bottom < -input_params.viewport_margin) return {'viewport_position': 'above'};
+            if (rect.top > window.innerHeight + input_params.viewport_margin) return {'viewport_position': 'below'};
+        }
+
+        if (ids_to_ignore.includes(element.id)) {
+            console.log(`Ignoring element with id: ${element.id}`, element);
+            return null;
+        }
+        //Ignore "option" because it would have been processed with the select element
+        if (tags_to_ignore.includes(element.tagName.toLowerCase()) || element.tagName.toLowerCase() === "option") return null;
+
+        let attributes_to_values = {
+            'tag': element.tagName.toLowerCase() // Always include the tag name
+        };
+
+        // If the element is an input, include its type as well
+        if (element.tagName.toLowerCase() === 'input') {
+            attributes_to_values['tag_type'] = element.type; // This will capture 'checkbox', 'radio', etc.
+        }
+        else if (element.tagName.toLowerCase() === 'select') {
+            attributes_to_values["mmid"] = element.getAttribute('mmid');
+            attributes_to_values["role"] = "combobox";
+            attributes_to_values["options"] = [];
+
+            for (const option of element.options) {
+                let option_attributes_to_values = {
+                    "mmid": option.getAttribute('mmid'),
+                    "text": option.text,
+                    "value": option.value,
+                    "selected": option.selected
+                };
+                attributes_to_values["options"].push(option_attributes_to_values);
+            }
+            return attributes_to_values;
+        }
+
+        for (const attribute of attributes) {
+            let value = element.getAttribute(attribute);
+
+            if(value){
+                /*
+                if(attribute === 'href'){
+                    value = value.split('?')[0]
+                }
+                */
+                attributes_to_values[attribute] = value;
+            }
+        }
+
+        if (should_fetch_inner_text && element.innerText) {
+            attributes_to_values['description'] = element.innerText;
+        }
+
+        let role = element.getAttribute('role');
+        if(role==='listbox' || element.tagName.toLowerCase()=== 'ul'){
+            let children=element.children;
+            let filtered_children = Array.from(children).filter(child => child.getAttribute('role') === 'option');
+            console.log("Listbox or ul found: ", filtered_children);
+            let attributes_to_include = ['mmid', 'role', 'aria-label','value'];
+            attributes_to_values["additional_info"]=[]
+            for (const child of children) {
+                let children_attributes_to_values = {};
+
+                for (let attr of child.attributes) {
+                    // If the attribute is not in the predefined list, add it to children_attributes_to_values
+                    if (attributes_to_include.includes(attr.name)) {
+                        children_attributes_to_values[attr.name] = attr.value;
+                    }
+                }
+
+                attributes_to_values["additional_info"].push(children_attributes_to_values);
+            }
+        }
+        // Check if attributes_to_values contains more than just 'name', 'role', and 'mmid'
+        const keys = Object.keys(attributes_to_values);
+        const minimalKeys = ['tag', 'mmid'];
+        const hasMoreThanMinimalKeys = keys.length > minimalKeys.length || keys.some(key => !minimalKeys.includes(key));
+
+        if (!hasMoreThanMinimalKeys) {
+            //If there were no attributes found, then try to get the backup attributes
+            for (const backupAttribute of input_params.backup_attributes) {
+                let value = element.getAttribute(backupAttribute);
+                if(value){
+                    attributes_to_values[backupAttribute] = value;
+                }
+            }
+
+            //if even the backup attributes are not found, then return null, which will cause this element to be skipped
+            if(Object.keys(attributes_to_values).length <= minimalKeys.length) {
+                if (element.tagName.toLowerCase() === 'button') {
+                        attributes_to_values["mmid"] = element.getAttribute('mmid');
+                        attributes_to_values["role"] = "button";
+                        attributes_to_values["additional_info"] = [];
+                        let children=element.children;
+                        let attributes_to_exclude = ['width', 'height', 'path', 'class', 'viewBox', 'mmid']
+
+                        // Check if the button has no text and no attributes
+                        if (element.innerText.trim() === '') {
+
+                            for (const child of children) {
+                                let children_attributes_to_values = {};
+
+                                for (let attr of child.attributes) {
+                                    // If the attribute is not in the predefined list, add it to children_attributes_to_values
+                                    if (!attributes_to_exclude.includes(attr.name)) {
+                                        children_attributes_to_values[attr.name] = attr.value;
+                                    }
+                                }
+
+                                attributes_to_values["additional_info"].push(children_attributes_to_values);
+                            }
+                            console.log("Button with no text and no attributes: ", attributes_to_values);
+                            return attributes_to_values;
+                        }
+                }
+
+                return null; // Return null if only minimal keys are present
+            }
+        }
+        return attributes_to_values;
+    }
+
+    // Injects 'mmid' and 'aria-keyshortcuts' into all the elements, see get_detailed_accessibility_tree.__inject_attributes
+    const injectMmids = () => {
+        const allElements = document.querySelectorAll('*');
+        let id = window.__sentient_last_mmid;
+        if (id === undefined) {
+            id = 0;
+            document.querySelectorAll('[mmid]').forEach(element => {
+                const mmid = parseInt(element.getAttribute('mmid'));
+                if (!isNaN(mmid)) {
+                    id = Math.max(id, mmid);
+                }
+            });
+        }
+        const seenMmids = new Set();
+        allElements.forEach(element => {
+            const origAriaAttribute = element.getAttribute('aria-keyshortcuts');
+            let mmid = element.getAttribute('mmid');
+            // cloned elements carry the mmid of their original, so give them a new one
+            if (!mmid || !/^\\d+$/.test(mmid) || seenMmids.has(mmid)) {
+                mmid = `${++id}`;
+                element.setAttribute('mmid', mmid);
+            }
+            seenMmids.add(mmid);
+            element.setAttribute('aria-keyshortcuts', mmid);
+            if (origAriaAttribute) {
+                element.setAttribute('orig-aria-keyshortcuts', origAriaAttribute);
+            }
+        });
+        window.__sentient_last_mmid = id;
+        return id;
+    };
+
+    const cleanupMmids = () => {
+        const allElements = document.querySelectorAll('*[mmid]');
+        allElements.forEach(element => {
+            element.removeAttribute('aria-keyshortcuts');
+            const origAriaLabel = element.getAttribute('orig-aria-keyshortcuts');
+            if (origAriaLabel) {
+                element.setAttribute('aria-keyshortcuts', origAriaLabel);
+                element.removeAttribute('orig-aria-keyshortcuts');
+            }
+        });
+    };
+
+    const enrichElement = (input_params) => {
+        const element = document.querySelector(`[mmid="${input_params.mmid}"]`);
+        return getElementInfo(element, input_params.mmid, input_params.should_fetch_inner_text, input_params);
+    };
+
+    const enrichElements = (input_params) => {
+        const elements_by_mmid = elementsByMmid();
+        return input_params.requests.map(request => {
+            const element = elements_by_mmid.get(`${request.mmid}`) || null;
+            return getElementInfo(element, request.mmid, request.should_fetch_inner_text, input_params);
+        });
+    };
+
+    const click = (selector) => {
+        let element = document.querySelector(selector);
+
+        if (!element) {
+            console.log(`perform_javascript_click: Element with selector ${selector} not found`);
+            return `perform_javascript_click: Element with selector ${selector} not found`;
+        }
+
+        if (element.tagName.toLowerCase() === "option") {
+            let value = element.text;
+            let parent = element.parentElement;
+
+            parent.value = element.value; // Directly set the value if possible
+            // Trigger change event if necessary
+            let event = new Event('change', { bubbles: true });
+            parent.dispatchEvent(event);
+
+            console.log("Select menu option", value, "selected");
+            return "Select menu option: "+ value+ " selected";
+        }
+        else {
+            console.log("About to click selector", selector);
+            // If the element is a link, make it open in the same tab
+            if (element.tagName.toLowerCase() === "a") {
+                element.target = "_self";
+                // #TODO: Consider removing this in the future if it causes issues with intended new tab behavior
+                element.removeAttribute('target');
+                element.removeAttribute('rel');
+            }
+            let ariaExpandedBeforeClick = element.getAttribute('aria-expanded');
+            element.click();
+            let ariaExpandedAfterClick = element.getAttribute('aria-expanded');
+            if (ariaExpandedBeforeClick === 'false' && ariaExpandedAfterClick === 'true') {
+                return "Executed JavaScript Click on element with selector: "+selector +". Very important: As a consequence a menu has appeared where you may need to make further selection. Very important: Get all_fields DOM to complete the action.";
+            }
+            return "Executed JavaScript Click on element with selector: "+selector;
+        }
+    };
+
+    const fill = (selector, text_to_enter) => {
+        text_to_enter = text_to_enter.trim();
+        const element = document.querySelector(selector);
+        if (!element) {
+            throw new Error(`Element not found: ${selector}`);
+        }
+        element.value = text_to_enter;
+        return `Value set for ${selector}`;
+    };
+
+    const clearValue = (selector) => {
+        const element = document.querySelector(selector);
+        if (element) {
+            element.value = '';
+        } else {
+            console.error('Element not found:', selector);
+        }
+    };
+
+    const textContent = (selectorsToFilter) => {
+        // Store the original visibility values to revert later
+        const originalStyles = [];
+
+        // Hide the elements matching the query selectors
+        selectorsToFilter.forEach(selector => {
+            const elements = document.querySelectorAll(selector);
+            elements.forEach(element => {
+                originalStyles.push({ element: element, originalStyle: element.style.visibility });
+                element.style.visibility = 'hidden';
+            });
+        });
+
+        // Get the text content of the page
+        let text = document?.body?.innerText || document?.documentElement?.innerText || "";
+
+        // Get all the alt text from images on the page
+        let altTexts = Array.from(document.querySelectorAll('img')).map(img => img.alt);
+        altTexts="Other Alt Texts in the page: " + altTexts.join(' ');
+
+        // Revert the visibility changes
+        originalStyles.forEach(entry => {
+            entry.element.style.visibility = entry.originalStyle;
+        });
+        return text+" "+altTexts;
+    };
+
+    // The opening tag of an element with the given attributes, see dom_helper.get_element_outer_html
+    const outerHtml = (element, tagName, attributes) => {
+        let openingTag = `<${tagName || element.tagName.toLowerCase()}`;
+        for (const attribute of attributes) {
+            const value = element.getAttribute(attribute);
+            if (value) {
+                openingTag += ` ${attribute}="${value}"`;
+            }
+        }
+        return openingTag + '>';
+    };
+
+    // See dom_mutation_observer.get_dom_generation
+    const domGeneration = (ignored_attributes, highlight_class) => {
+        if (window.__sentient_dom_generation === undefined) {
+            const ignoredAttributes = new Set(ignored_attributes);
+            const withoutHighlight = (value) => (value || '').split(/\\s+/).filter(c => c && c !== highlight_class).join(' ');
+            const isRelevant = (mutation) => {
+                if (mutation.type !== 'attributes') return true;
+                if (ignoredAttributes.has(mutation.attributeName)) return false;
+                if (mutation.attributeName === 'class') {
+                    return withoutHighlight(mutation.oldValue) !== withoutHighlight(mutation.target.getAttribute('class'));
+                }
+                return true;
+            };
+            const bump = () => {
+                window.__sentient_dom_generation += 1;
+                window.__sentient_last_mutation_time = performance.now();
+            };
+            window.__sentient_dom_generation = 0;
+            window.__sentient_dom_generation_observer = new MutationObserver((mutationsList) => {
+                if (mutationsList.some(isRelevant)) bump();
+            });
+            window.__sentient_dom_generation_observer.observe(document, {
+                subtree: true, childList: true, characterData: true, attributes: true, attributeOldValue: true
+            });
+            // Typing and toggling change the value and checked state without a DOM mutation
+            document.addEventListener('input', bump, true);
+            document.addEventListener('change', bump, true);
+            window.__sentient_dom_generation_is_relevant = isRelevant;
+            // Scrolling and resizing change which elements are in the viewport without changing the DOM
+            window.__sentient_viewport_generation = 0;
+            const bumpViewport = () => { window.__sentient_viewport_generation += 1; };
+            document.addEventListener('scroll', bumpViewport, {capture: true, passive: true});
+            window.addEventListener('resize', bumpViewport, {passive: true});
+        }
+        // Count the mutations that happened in this task but have not been delivered to the observer yet
+        if (window.__sentient_dom_generation_observer.takeRecords().some(window.__sentient_dom_generation_is_relevant)) {
+            window.__sentient_dom_generation += 1;
+            window.__sentient_last_mutation_time = performance.now();
+        }
+        return {
+            generation: window.__sentient_dom_generation,
+            viewport_generation: window.__sentient_viewport_generation,
+            time_origin: performance.timeOrigin
+        };
+    };
+
+    // See dom_mutation_observer.get_page_activity
+    const pageActivity = (ignored_attributes, highlight_class) => {
+        const installed = window.__sentient_dom_generation !== undefined;
+        domGeneration(ignored_attributes, highlight_class);
+        const lastMutationTime = window.__sentient_last_mutation_time;
+        return {
+            ready_state: document.readyState,
+            // mutations before the observer was installed are unknown
+            mutation_age: installed && lastMutationTime !== undefined ? performance.now() - lastMutationTime : null
+        };
+    };
+
+    // Scrolls the element under the middle of the viewport (e.g. a feed in a scrollable container) or the page itself
+    const scroll = (direction, fraction) => {
+        const isScrollable = (element) => {
+            const overflowY = window.getComputedStyle(element).overflowY;
+            return (overflowY === 'auto' || overflowY === 'scroll') && element.scrollHeight > element.clientHeight;
+        };
+        const pageElement = document.scrollingElement || document.documentElement;
+        let target = document.elementFromPoint(window.innerWidth / 2, window.innerHeight / 2);
+        while (target && target !== document.body && target !== pageElement && !isScrollable(target)) {
+            target = target.parentElement;
+        }
+        if (!target || target === document.body) {
+            target = pageElement;
+        }
+
+        const viewportHeight = target === pageElement ? window.innerHeight : target.clientHeight;
+        const distance = Math.round(viewportHeight * fraction) * (direction === 'up' ? -1 : 1);
+        const before = target.scrollTop;
+        target.scrollBy({top: distance, behavior: 'instant'});
+        return {
+            scrolled: Math.round(target.scrollTop - before),
+            remaining_above: Math.round(target.scrollTop),
+            remaining_below: Math.round(target.scrollHeight - target.clientHeight - target.scrollTop)
+        };
+    };
+"""
+
+__RUNTIME_FUNCTIONS = [
+    "injectMmids",
+    "cleanupMmids",
+    "enrichElement",
+    "enrichElements",
+    "click",
+    "fill",
+    "clearValue",
+    "textContent",
+    "outerHtml",
+    "domGeneration",
+    "pageActivity",
+    "scroll",
+]
+
+# Changes to the runtime change its version, so that documents holding an older runtime get the new one
+PAGE_RUNTIME_VERSION = hashlib.sha1(__PAGE_RUNTIME_SOURCE.encode("utf-8")).hexdigest()[
+    :12
+]
+
+PAGE_RUNTIME_JS = f"""
+(() => {{
+    const version = '{PAGE_RUNTIME_VERSION}';
+    if (window.__sentient_runtime && window.__sentient_runtime.version === version) return;
+{__PAGE_RUNTIME_SOURCE}
+    Object.defineProperty(window, '__sentient_runtime', {{
+        value: Object.freeze({{version, {", ".join(__RUNTIME_FUNCTIONS)}}}),
+        configurable: true,
+        enumerable: false,
+        writable: false
+    }});
+}})();
+"""
+
+__INSTALL_JS = f"() => {{ {PAGE_RUNTIME_JS} }}"
+
+# Calls a runtime function by name, or reports that the document has no runtime or an older one
+__CALL_JS = """
+async ([version, name, args]) => {
+    const runtime = window.__sentient_runtime;
+    if (!runtime || runtime.version !== version) return {missing: true};
+    return {value: await runtime[name](...args)};
+}
+"""
+
+__CALL_ON_ELEMENT_JS = """
+async (element, [version, name, args]) => {
+    const runtime = window.__sentient_runtime;
+    if (!runtime || runtime.version !== version) return {missing: true};
+    return {value: await runtime[name](element, ...args)};
+}
+"""
+
+
+async def install_page_runtime(target: Union[BrowserContext, Page]):
+    """
+    Registers the page runtime as an init script, so that it is installed in every document of the browser context
+    (or of the page) before its own scripts run, including the documents loaded by later navigations.
+    The documents that are already loaded get it on the first call to call_page_runtime.
+
+    Args:
+        target (BrowserContext | Page): The browser context, or the page, to install the runtime in.
+    """
+    await target.add_init_script(script=PAGE_RUNTIME_JS)
+    logger.debug(f"Registered the page runtime version {PAGE_RUNTIME_VERSION}")
+
+
+async def call_page_runtime(page: Page, name: str, *args: Any) -> Any:
+    """
+    Calls a function of the page runtime with the given arguments, e.g. call_page_runtime(page, "click", selector).
+    Installs the runtime first if the document does not have it, or has an older version of it.
+
+    Args:
+        page (Page): The Playwright page instance.
+        name (str): The name of the runtime function.
+        *args (Any): The JSON serializable arguments of the function.
+
+    Returns:
+        Any: The value returned by the function.
+    """
+    call = [PAGE_RUNTIME_VERSION, name, list(args)]
+    result = await page.evaluate(__CALL_JS, call)
+    if result.get("missing"):
+        logger.debug(f"Installing the page runtime version {PAGE_RUNTIME_VERSION}")
+        await page.evaluate(__INSTALL_JS)
+        result = await page.evaluate(__CALL_JS, call)
+        if result.get("missing"):
+            raise RuntimeError("Could not install the page runtime")
+    return result["value"]
+
+
+async def call_element_runtime(element: ElementHandle, name: str, *args: Any) -> Any:
+    """
+    Calls a function of the page runtime that takes an element as its first argument, e.g.
+    call_element_runtime(element, "outerHtml", None, ["id", "name"]). Installs the runtime first if needed.
+
+    Args:
+        element (ElementHandle): The element passed to the function.
+        name (str): The name of the runtime function.
+        *args (Any): The other JSON serializable arguments of the function.
+
+    Returns:
+        Any: The value returned by the function.
+    """
+    call = [PAGE_RUNTIME_VERSION, name, list(args)]
+    result = await element.evaluate(__CALL_ON_ELEMENT_JS, call)
+    if result.get("missing"):
+        logger.debug(f"Installing the page runtime version {PAGE_RUNTIME_VERSION}")
+        await element.evaluate(__INSTALL_JS)
+        result = await element.evaluate(__CALL_ON_ELEMENT_JS, call)
+        if result.get("missing"):
+            raise RuntimeError("Could not install the page runtime")
+    return result["value"]
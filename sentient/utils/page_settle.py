@@ -0,0 +1,209 @@
+import asyncio
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Union
+
+from playwright.async_api import BrowserContext, Page, Request
+
+from sentient.utils.dom_mutation_observer import get_page_activity
+from sentient.utils.logger import logger
+from sentient.utils.tracing import record_span
+
+# Requests that can stay open for as long as the page lives, they never block a settle
+__IGNORED_RESOURCE_TYPES = {"websocket", "eventsource", "media", "manifest", "ping"}
+# Requests in flight for longer than this are assumed to be long polling and do not block a settle either
+__MAX_REQUEST_AGE = 2.0
+__POLL_INTERVAL = 0.05
+
+# The requests in flight of every page, by page
+__network_activity: "weakref.WeakKeyDictionary[Page, Dict[str, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+__tracked_targets: "weakref.WeakSet[Union[BrowserContext, Page]]" = weakref.WeakSet()
+
+__settle_stats = {
+    "settles": 0,
+    "timeouts": 0,
+    "waited": 0.0,
+    "saved": 0.0,
+    "lost": 0.0,
+}
+# the same stats for every page, so that concurrent sessions can tell their own settles apart
+__settle_stats_by_page: "weakref.WeakKeyDictionary[Page, Dict[str, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@dataclass
+class SettleResult:
+    """
+    The outcome of a wait for the page to settle.
+
+    Attributes:
+        waited (float): How long the wait took, in seconds.
+        saved (float): How much shorter it was than the fixed wait it replaces, in seconds, 0 if it was longer.
+        lost (float): How much longer it was than the fixed wait it replaces, in seconds, 0 if it was shorter.
+        settled (bool): Whether the page settled, False if the wait hit its timeout.
+    """
+
+    waited: float
+    saved: float
+    lost: float
+    settled: bool
+
+
+def __page_activity(page: Page) -> Dict[str, Any]:
+    return __network_activity.setdefault(page, {"requests": {}, "last_activity": 0.0})
+
+
+def __on_request(request: Request):
+    if request.resource_type in __IGNORED_RESOURCE_TYPES:
+        return
+    try:
+        page = request.frame.page
+    except Exception:
+        # requests of service workers have no frame
+        return
+    activity = __page_activity(page)
+    activity["requests"][request] = time.monotonic()
+    activity["last_activity"] = time.monotonic()
+
+
+def __on_request_done(request: Request):
+    try:
+        page = request.frame.page
+    except Exception:
+        return
+    activity = __page_activity(page)
+    if activity["requests"].pop(request, None) is not None:
+        activity["last_activity"] = time.monotonic()
+
+
+def track_network_activity(target: Union[BrowserContext, Page]):
+    """
+    Starts counting the requests in flight of the pages of a browser context (or of a single page), which
+    wait_for_page_settle waits for. Tracking a context as soon as it is created also counts the requests of the
+    pages it opens later. Tracking the same target twice does nothing.
+
+    Args:
+        target (BrowserContext | Page): The browser context, or the page, to track.
+    """
+    if target in __tracked_targets:
+        return
+    __tracked_targets.add(target)
+    target.on("request", __on_request)
+    target.on("requestfinished", __on_request_done)
+    target.on("requestfailed", __on_request_done)
+
+
+def __requests_in_flight(page: Page, now: float) -> int:
+    requests = __page_activity(page)["requests"]
+    return sum(1 for started in requests.values() if now - started < __MAX_REQUEST_AGE)
+
+
+async def wait_for_page_settle(
+    page: Page,
+    quiet_time: float = 0.25,
+    timeout: float = 5.0,
+    replaced_wait: float = 0.0,
+    after_action: bool = True,
+) -> SettleResult:
+    """
+    Waits until the page is quiet after an action: the document is not loading, no request is in flight and the DOM
+    did not change for `quiet_time` seconds, or until `timeout` seconds have passed. After an action, the wait lasts
+    at least `quiet_time`, so that the effects of the action that have not started yet (e.g. a request sent from a
+    timer) get a chance to show up.
+
+    Args:
+        page (Page): The Playwright page instance.
+        quiet_time (float, optional): How long the page must stay quiet, in seconds. Defaults to 0.25.
+        timeout (float, optional): The maximum time to wait, in seconds. Defaults to 5.0.
+        replaced_wait (float, optional): The fixed wait, in seconds, that this replaces, to report the time saved, or
+            lost when the page takes longer to settle. Defaults to 0.0.
+        after_action (bool, optional): Whether an action was just performed on the page. Otherwise a page that has
+            been quiet for `quiet_time` already is settled right away. Defaults to True.
+
+    Returns:
+        SettleResult: How long the wait took, how much time it saved or lost and whether the page settled.
+    """
+    if page.context not in __tracked_targets:
+        # the requests sent before this call are not known
+        track_network_activity(page)
+
+    start = time.monotonic()
+    deadline = start + timeout
+    settled = False
+    while True:
+        now = time.monotonic()
+        if page.is_closed():
+            break
+        if not after_action or now - start >= quiet_time:
+            activity = __page_activity(page)
+            network_quiet = (
+                __requests_in_flight(page, now) == 0
+                and now - activity["last_activity"] >= quiet_time
+            )
+            if network_quiet:
+                # the page is only read once the network is quiet, since reading it can fail during a navigation
+                page_activity = await get_page_activity(page)
+                if (
+                    page_activity is not None
+                    and page_activity["ready_state"] != "loading"
+                    and (
+                        page_activity["mutation_age"] is None
+                        or page_activity["mutation_age"] >= quiet_time * 1000
+                    )
+                ):
+                    settled = True
+                    break
+        if now >= deadline:
+            break
+        await asyncio.sleep(min(__POLL_INTERVAL, max(0.0, deadline - now)))
+
+    waited = time.monotonic() - start
+    result = SettleResult(
+        waited=waited,
+        saved=max(0.0, replaced_wait - waited),
+        lost=max(0.0, waited - replaced_wait),
+        settled=settled,
+    )
+    page_stats = __settle_stats_by_page.setdefault(
+        page, {"settles": 0, "timeouts": 0, "waited": 0.0, "saved": 0.0, "lost": 0.0}
+    )
+    for stats in (__settle_stats, page_stats):
+        stats["settles"] += 1
+        stats["timeouts"] += 0 if settled else 1
+        stats["waited"] += result.waited
+        stats["saved"] += result.saved
+        stats["lost"] += result.lost
+    if not settled:
+        logger.debug(f"The page did not settle within {timeout} seconds")
+    record_span(
+        "settle",
+        waited,
+        replaced_wait=replaced_wait,
+        saved=result.saved,
+        lost=result.lost,
+        settled=settled,
+        after_action=after_action,
+    )
+    return result
+
+
+def get_settle_stats(page: Optional[Page] = None) -> Dict[str, Any]:
+    """
+    Returns the number of settles since the process started, how many of them hit their timeout, the total time they
+    waited, and the total time they saved and lost compared with the fixed waits they replace, in seconds.
+
+    Args:
+        page (Optional[Page], optional): Only count the settles of this page. Defaults to None, which counts them all.
+    """
+    if page is not None:
+        return dict(
+            __settle_stats_by_page.get(
+                page,
+                {"settles": 0, "timeouts": 0, "waited": 0.0, "saved": 0.0, "lost": 0.0},
+            )
+        )
+    return dict(__settle_stats)
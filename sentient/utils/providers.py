@@ -1,7 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 import os
 
+import httpx
+
+from sentient.config.config import env_choice, env_float, env_str
+from sentient.utils.http_clients import get_http_client
+from sentient.utils.mock_llm import MATCH_MODES, MockLLM
+
 
 class LLMProvider(ABC):
     @abstractmethod
@@ -12,6 +18,13 @@ class LLMProvider(ABC):
     def get_provider_name(self) -> str:
         pass
 
+    def get_http_client(self) -> httpx.AsyncClient:
+        """
+        Returns the HTTP client shared by all the agents of the provider, see sentient.utils.http_clients.
+        """
+        base_url = (self.get_client_config() or {}).get("base_url")
+        return get_http_client(self.get_provider_name(), base_url)
+
 class OpenAIProvider(LLMProvider):
     def get_client_config(self) -> Dict[str, str]:
         return {
@@ -68,6 +81,51 @@ class CustomProvider(LLMProvider):
     def get_provider_name(self) -> str:
             return "custom"
     
+class MockProvider(LLMProvider):
+    """
+    A provider whose model answers with scripted outputs or recorded transcripts, without any network, to benchmark
+    and test the orchestrator end to end. See sentient.utils.mock_llm.
+    """
+
+    def __init__(
+        self,
+        script: Optional[Union[str, List[Any]]] = None,
+        match: Optional[str] = None,
+        latency: Optional[float] = None,
+        jitter: Optional[float] = None,
+    ):
+        """
+        Args:
+            script (Optional[Union[str, List[Any]]], optional): The outputs, or the path of the file of outputs or
+                of the transcript to answer with. Defaults to SENTIENT_MOCK_SCRIPT.
+            match (Optional[str], optional): "step" or "prompt". Defaults to SENTIENT_MOCK_MATCH, or "step".
+            latency (Optional[float], optional): The latency of every answer, in seconds. Defaults to
+                SENTIENT_MOCK_LATENCY, or 0.
+            jitter (Optional[float], optional): A random extra latency of up to this, in seconds. Defaults to
+                SENTIENT_MOCK_JITTER, or 0.
+        """
+        script = script if script is not None else env_str("SENTIENT_MOCK_SCRIPT")
+        if script is None:
+            raise ValueError("Mock provider requires a script, e.g. from SENTIENT_MOCK_SCRIPT")
+        self.llm = MockLLM(
+            script,
+            match=match or env_choice("SENTIENT_MOCK_MATCH", MATCH_MODES, "step"),
+            latency=latency if latency is not None else env_float("SENTIENT_MOCK_LATENCY", 0.0),
+            jitter=jitter if jitter is not None else env_float("SENTIENT_MOCK_JITTER", 0.0),
+        )
+
+    def get_client_config(self) -> Dict[str, str]:
+        return {
+            "api_key": "mock",
+            "base_url": "http://mock.sentient/v1",
+        }
+
+    def get_provider_name(self) -> str:
+        return "mock"
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        return self.llm.get_http_client()
+
 class OpenRouterProvider(LLMProvider): 
     def get_client_config(self) -> Dict[str, str]:
         pass
@@ -100,6 +158,8 @@ def get_provider(provider_name: str, custom_base_url: str = None) -> LLMProvider
         if not custom_base_url:
             raise ValueError("Custom provider requires a base_url")
         return CustomProvider(custom_base_url)
+    elif provider_name.lower() == "mock":
+        return MockProvider()
     else:
         provider = PROVIDER_MAP.get(provider_name.lower())
         if not provider:
@@ -0,0 +1,327 @@
+import atexit
+import contextvars
+import glob
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sentient.config.config import (
+    SOURCE_LOG_FOLDER_PATH,
+    env_bool,
+    env_str,
+    override_config,
+)
+from sentient.utils.logger import logger
+
+# Tracing records where the time of a run goes, as spans (DOM extraction, serialization, LLM requests, actions,
+# settle waits...) written one JSON object per line to a file per run. It is off by default and configured from the
+# environment:
+#   SENTIENT_TRACE=1              write the spans
+#   SENTIENT_TRACE_DIR=<path>     where to write them, defaults to log_files/traces
+# or with configure_tracing. The spans of all the runs in a folder are summarized with
+#   python benchmarks/trace_report.py [<path>]
+__config: Dict[str, Any] = {
+    "enabled": env_bool("SENTIENT_TRACE"),
+    "directory": env_str(
+        "SENTIENT_TRACE_DIR", os.path.join(SOURCE_LOG_FOLDER_PATH, "traces")
+    ),
+}
+
+# Every run (e.g. every concurrent agent run) writes to its own file
+__default_run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+__run_id: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "trace_run_id", default=__default_run_id
+)
+# The span the spans started from the current context are nested in
+__current_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "trace_current_span_id", default=None
+)
+# Spans are queued from the event loop and from worker threads, and appended to their files by a background thread
+__queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+__writer: Optional[threading.Thread] = None
+__writer_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed phase of a run. Attributes (e.g. byte sizes, token counts) can be added while the span is open with set.
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any], recording: bool = True):
+        self.name = name
+        self.attributes = attributes
+        self.recording = recording
+        self.span_id = uuid.uuid4().hex[:16] if recording else None
+        self.parent_id: Optional[str] = None
+        self.start = 0.0
+
+    def set(self, **attributes: Any):
+        """
+        Adds attributes to the span. Does nothing when tracing is disabled.
+        """
+        if self.recording:
+            self.attributes.update(attributes)
+
+
+__NOOP_SPAN = Span("noop", {}, recording=False)
+
+
+def configure_tracing(enabled: Optional[bool] = None, directory: Optional[str] = None):
+    """
+    Overrides the configuration read from the environment. Arguments left to None are not changed.
+
+    Args:
+        enabled (Optional[bool]): Whether the spans are written.
+        directory (Optional[str]): The folder of the trace files, one per run.
+    """
+    override_config(__config, enabled=enabled, directory=directory)
+
+
+def tracing_enabled() -> bool:
+    return __config["enabled"]
+
+
+def start_trace(run_id: Optional[str] = None) -> str:
+    """
+    Starts a new run for the spans recorded from the current context (e.g. the current asyncio task), so that
+    concurrent runs write to different files.
+
+    Args:
+        run_id (Optional[str]): The name of the trace file, without extension. Defaults to a new unique name.
+
+    Returns:
+        str: The id of the run.
+    """
+    run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    __run_id.set(run_id)
+    __current_span_id.set(None)
+    if __config["enabled"]:
+        logger.info(f"Tracing the run to {get_trace_path(run_id)}")
+    return run_id
+
+
+def get_trace_path(run_id: Optional[str] = None) -> str:
+    """
+    Returns the path of the trace file of a run, by default of the run of the current context.
+    """
+    return os.path.join(__config["directory"], f"{run_id or __run_id.get()}.jsonl")
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Records the duration of the code in the block as a span, nested in the span open in the current context.
+    Exceptions raised in the block are recorded on the span and re-raised. Does nothing when tracing is disabled.
+
+    Works in synchronous and asynchronous code alike, since the current span is kept in a context variable.
+
+    Example:
+        with trace_span("dom.serialize", model=model) as span:
+            text = serialize(dom)
+            span.set(bytes=len(text))
+
+    Args:
+        name (str): The name of the phase, spans with the same name are summarized together.
+        **attributes: Attributes of the span, e.g. sizes or counts, which must be JSON serializable.
+
+    Yields:
+        Span: The span, to add attributes that are known once the phase is done.
+    """
+    if not __config["enabled"]:
+        yield __NOOP_SPAN
+        return
+
+    span = Span(name, attributes)
+    span.parent_id = __current_span_id.get()
+    token = __current_span_id.set(span.span_id)
+    span.start = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        __current_span_id.reset(token)
+        __write_span(span, (time.perf_counter() - start) * 1000, error)
+
+
+def record_span(name: str, duration: float, error: Optional[str] = None, **attributes):
+    """
+    Records a phase that was timed elsewhere (e.g. an attempt inside a library) as a span nested in the span open in
+    the current context. Does nothing when tracing is disabled.
+
+    Args:
+        name (str): The name of the phase.
+        duration (float): Its duration, in seconds.
+        error (Optional[str], optional): The error the phase ended with. Defaults to None.
+        **attributes: Attributes of the span.
+    """
+    if not __config["enabled"]:
+        return
+    span = Span(name, attributes)
+    span.parent_id = __current_span_id.get()
+    span.start = time.time() - duration
+    __write_span(span, duration * 1000, error)
+
+
+def json_size(value: Any) -> int:
+    """
+    Returns the size in bytes of a value serialized to JSON (or of a string encoded in UTF-8).
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return len(value.encode("utf-8"))
+
+
+def __write_span(span: Span, duration_ms: float, error: Optional[str]):
+    record = {
+        "run_id": __run_id.get(),
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "name": span.name,
+        "start": round(span.start, 6),
+        "duration_ms": round(duration_ms, 3),
+        "attributes": span.attributes,
+    }
+    if error is not None:
+        record["error"] = error
+    try:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+    except Exception as e:
+        logger.warning(f"Could not write the span {span.name}: {e}")
+        return
+    __ensure_writer()
+    __queue.put((get_trace_path(record["run_id"]), line))
+
+
+def flush_traces(timeout: float = 5.0):
+    """
+    Waits until the spans recorded so far are written, for at most `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while __queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def __ensure_writer():
+    global __writer
+    with __writer_lock:
+        if __writer is None or not __writer.is_alive():
+            __writer = threading.Thread(
+                target=__write_spans, name="trace-writer", daemon=True
+            )
+            __writer.start()
+
+
+def __write_spans():
+    while True:
+        # the spans queued while the previous ones were written are appended with one open per file
+        lines_by_path: Dict[str, List[str]] = {}
+        path, line = __queue.get()
+        lines_by_path.setdefault(path, []).append(line)
+        count = 1
+        while True:
+            try:
+                path, line = __queue.get_nowait()
+            except queue.Empty:
+                break
+            lines_by_path.setdefault(path, []).append(line)
+            count += 1
+        for path, lines in lines_by_path.items():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            except Exception as e:
+                logger.warning(f"Could not write {len(lines)} spans to {path}: {e}")
+        for _ in range(count):
+            __queue.task_done()
+
+
+def __percentile(sorted_values: List[float], percentile: float) -> float:
+    # nearest rank, so that the result is always one of the values
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_traces(directory: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Summarizes the spans of all the trace files in a folder, by span name: how many there are, in how many runs,
+    how many ended with an error, the p50, p95 and mean of their durations in milliseconds, and the mean of their
+    numeric attributes (e.g. bytes, tokens). The spans of this process still queued are written first.
+
+    Args:
+        directory (Optional[str], optional): The folder of the trace files. Defaults to the configured folder.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The summary of every span name, sorted by name.
+    """
+    flush_traces()
+    durations: Dict[str, List[float]] = {}
+    runs: Dict[str, set] = {}
+    errors: Dict[str, int] = {}
+    attribute_totals: Dict[str, Dict[str, List[float]]] = {}
+    for path in sorted(
+        glob.glob(os.path.join(directory or __config["directory"], "*.jsonl"))
+    ):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a run that was killed while writing it
+                    continue
+                name = span["name"]
+                durations.setdefault(name, []).append(span["duration_ms"])
+                runs.setdefault(name, set()).add(span.get("run_id"))
+                errors[name] = errors.get(name, 0) + (1 if "error" in span else 0)
+                totals = attribute_totals.setdefault(name, {})
+                for key, value in span.get("attributes", {}).items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        totals.setdefault(key, []).append(value)
+
+    summary = {}
+    for name in sorted(durations):
+        values = sorted(durations[name])
+        summary[name] = {
+            "count": len(values),
+            "runs": len(runs[name]),
+            "errors": errors[name],
+            "p50_ms": __percentile(values, 50),
+            "p95_ms": __percentile(values, 95),
+            "mean_ms": sum(values) / len(values),
+            "attributes": {
+                key: sum(numbers) / len(numbers)
+                for key, numbers in sorted(attribute_totals[name].items())
+            },
+        }
+    return summary
+
+
+def format_trace_summary(summary: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Formats the result of summarize_traces as a table, one line per span name.
+    """
+    lines = [
+        f"{'span':<28} {'count':>7} {'runs':>5} {'errors':>6} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10}  mean attributes"
+    ]
+    for name, stats in summary.items():
+        attributes = " ".join(
+            f"{key}={value:.0f}" for key, value in stats["attributes"].items()
+        )
+        lines.append(
+            f"{name:<28} {stats['count']:>7} {stats['runs']:>5} {stats['errors']:>6} "
+            f"{stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} {stats['mean_ms']:>10.1f}  {attributes}"
+        )
+    return "\n".join(lines)
+
+
+atexit.register(flush_traces)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the tests reuse the stubs of the benchmarks, which put the root of the repository on the import path themselves
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"
+    ),
+)
@@ -0,0 +1,38 @@
+import asyncio
+
+from concurrent_agents import make_input, measure, start_stub_server
+
+from sentient.core.agent.agent import Agent
+from sentient.utils.providers import CustomProvider
+
+AGENTS = 8
+DELAY = 0.5
+# the longest the event loop may be blocked, e.g. by the validation of an output, well under one request
+MAX_BLOCKED = 0.25
+
+
+def test_concurrent_agents_overlap_their_requests(monkeypatch):
+    monkeypatch.setenv("CUSTOM_API_KEY", "stub")
+    provider = CustomProvider(start_stub_server(DELAY))
+
+    async def run():
+        agents = [Agent(provider=provider, model_name="stub") for _ in range(AGENTS)]
+        results = []
+
+        async def run_agents():
+            results.extend(
+                await asyncio.gather(
+                    *(agent.run(make_input(i)) for i, agent in enumerate(agents))
+                )
+            )
+
+        wall_time, max_gap = await measure(run_agents)
+        return results, wall_time, max_gap
+
+    results, wall_time, max_gap = asyncio.run(run())
+
+    assert len(results) == AGENTS
+    assert all(result.is_complete for result in results)
+    # the requests overlap: about one delay in total, where one after the other would take AGENTS delays
+    assert wall_time < 2 * DELAY, f"{AGENTS} agents took {wall_time:.2f}s"
+    assert max_gap < MAX_BLOCKED, f"the event loop was blocked for {max_gap:.2f}s"
@@ -0,0 +1,53 @@
+import random
+
+from dom_delta import product_page, step_change
+
+from sentient.utils.dom_diff import DomDeltaTracker, flatten_dom_tree
+from sentient.utils.dom_serializer import serialize_dom
+
+
+def get_delta(before, after):
+    return DomDeltaTracker().get_delta(
+        after, flatten_dom_tree(before), flatten_dom_tree(after)
+    )
+
+
+def test_delta_indexes_the_unchanged_elements():
+    before = product_page(3, random.Random(0))
+    delta = get_delta(before, step_change(before))
+
+    assert delta["dom_delta"]
+    assert [node["mmid"] for node in delta["added"] if "mmid" in node] == ["toast"]
+    assert [node["mmid"] for node in delta["changed"]] == ["2"]
+    # every element with an mmid is still reachable: changed, added or in the index
+    assert [entry["mmid"] for entry in delta["unchanged"]] == [
+        str(mmid) for mmid in range(3, 10)
+    ]
+    assert delta["unchanged"][1] == {
+        "mmid": "4",
+        "role": "link",
+        "name": "Wireless noise cancelling headphones, model 0",
+    }
+
+    text = serialize_dom(delta).text
+    assert '[5,7,9] button "Add to cart"' in text
+    assert "Over-ear" not in text
+
+
+def test_delta_takes_fewer_tokens_than_the_tree():
+    before = product_page(50, random.Random(0))
+    after = step_change(before)
+    delta = get_delta(before, after)
+
+    assert serialize_dom(delta).tokens < serialize_dom(after).tokens * 0.75
+    assert len(str(delta)) < len(str(after)) / 2
+
+
+def test_large_change_sends_the_full_tree():
+    before = product_page(3, random.Random(0))
+    after = product_page(3, random.Random(1))
+    for card in after["children"][2]["children"]:
+        card["children"][0]["name"] += " (sold out)"
+        card["children"][3]["name"] = "Notify me"
+
+    assert get_delta(before, after) is after
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+from sentient.core.web_driver.session import (
+    reset_session_browser_context,
+    set_session_browser_context,
+)
+from sentient.utils import dom_mutation_observer
+from sentient.utils.dom_mutation_observer import (
+    MUTATION_OBSERVER_JS,
+    install_mutation_observer,
+    subscribe,
+    unsubscribe,
+)
+
+
+class FakePage:
+    def __init__(self, context: "FakeBrowserContext"):
+        self.context = context
+        self.url = "about:blank"
+        self.scripts = []
+
+    async def evaluate(self, script: str):
+        self.scripts.append(script)
+
+
+class FakeBrowserContext:
+    """The part of a Playwright BrowserContext the mutation observer uses, recording what is installed."""
+
+    def __init__(self):
+        self.bindings = {}
+        self.init_scripts = []
+        self.pages = [FakePage(self)]
+
+    async def expose_binding(self, name, callback):
+        self.bindings[name] = callback
+
+    async def add_init_script(self, script: str):
+        self.init_scripts.append(script)
+
+    async def report(self, changes):
+        # what the observer of the page does, through the binding of its context
+        source = {"context": self, "page": self.pages[0], "frame": None}
+        await self.bindings["dom_mutation_change_detected"](source, json.dumps(changes))
+
+
+def test_every_session_gets_the_changes_of_its_own_pages():
+    async def run():
+        contexts = [FakeBrowserContext(), FakeBrowserContext()]
+        for context in contexts:
+            await install_mutation_observer(context, session=True)
+            assert MUTATION_OBSERVER_JS in context.init_scripts
+            # the page already open gets the observer right away
+            assert context.pages[0].scripts == [MUTATION_OBSERVER_JS]
+
+        received = [[], []]
+        outside_session = []
+        subscribe(outside_session.append)
+
+        async def session(index: int):
+            token = set_session_browser_context(contexts[index])
+            try:
+                subscribe(received[index].append)
+                await asyncio.sleep(0)
+                await contexts[index].report(
+                    [{"tag": "LI", "content": f"result {index}"}]
+                )
+                await asyncio.sleep(0)
+                unsubscribe(received[index].append)
+            finally:
+                reset_session_browser_context(token)
+
+        try:
+            await asyncio.gather(session(0), session(1))
+        finally:
+            unsubscribe(outside_session.append)
+        return received, outside_session
+
+    received, outside_session = asyncio.run(run())
+
+    assert received == [
+        [[{"tag": "LI", "content": "result 0"}]],
+        [[{"tag": "LI", "content": "result 1"}]],
+    ]
+    assert outside_session == []
+
+
+def test_the_main_context_reports_to_the_callbacks_outside_of_a_session():
+    async def run():
+        context = FakeBrowserContext()
+        await install_mutation_observer(context)
+        received = []
+        subscribe(received.append)
+        try:
+            await context.report([{"tag": "DIV", "content": "suggestions"}])
+        finally:
+            unsubscribe(received.append)
+        return received
+
+    assert asyncio.run(run()) == [[{"tag": "DIV", "content": "suggestions"}]]
+    assert dom_mutation_observer.DOM_change_callback == []
@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+from sentient.utils.llm_cache import LLMResponseCache
+
+
+def read_accesses(path):
+    with sqlite3.connect(path) as connection:
+        return dict(connection.execute("SELECT key, accessed_at FROM responses"))
+
+
+def test_hits_only_read_until_the_next_write(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMResponseCache(path)
+    cache.put("a", "response a")
+    written = read_accesses(path)
+
+    time.sleep(0.01)
+    assert cache.get("a") == "response a"
+    assert read_accesses(path) == written
+
+    cache.put("b", "response b")
+    assert read_accesses(path)["a"] > written["a"]
+    cache.close()
+
+
+def test_pending_accesses_are_written_in_batches_and_on_close(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMResponseCache(path)
+    for key in range(LLMResponseCache.ACCESS_BATCH_SIZE):
+        cache.put(str(key), "response")
+    written = read_accesses(path)
+
+    time.sleep(0.01)
+    for key in range(LLMResponseCache.ACCESS_BATCH_SIZE - 1):
+        cache.get(str(key))
+    assert read_accesses(path) == written
+    cache.get(str(LLMResponseCache.ACCESS_BATCH_SIZE - 1))
+    assert all(read_accesses(path)[key] > written[key] for key in written)
+
+    cache.get("0")
+    cache.close()
+    assert read_accesses(path)["0"] > written["0"]
+
+
+def test_eviction_uses_the_running_size_and_the_last_accesses(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=30)
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 10)
+    cache.put("b", "y" * 10)
+    cache.put("c", "x" * 10)
+    assert cache.get_stats()["evictions"] == 0
+
+    # "a" is read after "b" was written, so "b" is the least recently used
+    time.sleep(0.01)
+    cache.get("a")
+    cache.put("d", "x" * 10)
+
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 30
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    cache.close()
+
+
+def test_expired_responses_are_deleted_when_read(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), ttl=0.01)
+    cache.put("a", "response a")
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    stats = cache.get_stats()
+    assert stats["expired"] == 1
+    assert stats["entries"] == 0
+    cache.close()
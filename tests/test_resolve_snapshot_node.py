@@ -0,0 +1,71 @@
+import asyncio
+
+from sentient.utils.cdp_accessibility_tree import resolve_snapshot_node
+from sentient.utils.get_detailed_accessibility_tree import (
+    INJECTED_MMIDS,
+    SNAPSHOT_NODE_IDS,
+    set_element_id_source,
+)
+
+
+class FakeCDPSession:
+    """Records the commands sent, resolving every backendNodeId to a remote object."""
+
+    def __init__(self):
+        self.commands = []
+
+    async def send(self, method, params=None):
+        self.commands.append((method, params))
+        if method == "DOM.resolveNode":
+            return {"object": {"objectId": f"object-{params['backendNodeId']}"}}
+        return {}
+
+
+class FakeBrowserContext:
+    def __init__(self):
+        self.cdp_session = FakeCDPSession()
+
+    async def new_cdp_session(self, page):
+        return self.cdp_session
+
+
+class FakePage:
+    def __init__(self):
+        self.context = FakeBrowserContext()
+
+
+def test_snapshot_ids_do_not_use_the_mmid_attribute():
+    page = FakePage()
+    set_element_id_source(page, SNAPSHOT_NODE_IDS)
+
+    selector = asyncio.run(resolve_snapshot_node(page, "[mmid='114']"))
+
+    assert selector == "[data-sentient-bnid='114']"
+    commands = dict(page.context.cdp_session.commands)
+    assert commands["DOM.resolveNode"] == {"backendNodeId": 114}
+    call = commands["Runtime.callFunctionOn"]
+    assert call["objectId"] == "object-114"
+    assert call["arguments"] == [{"value": "data-sentient-bnid"}, {"value": "114"}]
+    assert "mmid" not in call["functionDeclaration"]
+
+
+def test_injected_mmids_are_left_alone():
+    page = FakePage()
+    set_element_id_source(page, INJECTED_MMIDS)
+
+    assert asyncio.run(resolve_snapshot_node(page, "[mmid='114']")) == "[mmid='114']"
+    assert page.context.cdp_session.commands == []
+
+
+def test_unresolvable_node_does_not_fall_back_to_the_mmid():
+    page = FakePage()
+    set_element_id_source(page, SNAPSHOT_NODE_IDS)
+
+    async def fail(method, params=None):
+        raise RuntimeError("No node with given id found")
+
+    page.context.cdp_session.send = fail
+
+    selector = asyncio.run(resolve_snapshot_node(page, "[mmid='114']"))
+
+    assert selector == "[data-sentient-bnid='114']"
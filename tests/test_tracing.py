@@ -0,0 +1,60 @@
+import json
+import threading
+
+from sentient.utils import tracing
+from sentient.utils.tracing import (
+    configure_tracing,
+    flush_traces,
+    get_trace_path,
+    record_span,
+    start_trace,
+    summarize_traces,
+    trace_span,
+)
+
+
+def test_spans_are_written_by_the_background_writer(tmp_path, monkeypatch):
+    configure_tracing(enabled=True, directory=str(tmp_path))
+    writers = set()
+    open_file = open
+
+    def recording_open(*args, **kwargs):
+        writers.add(threading.current_thread().name)
+        return open_file(*args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", recording_open)
+    try:
+        run_id = start_trace("run")
+        with trace_span("step", index=1):
+            with trace_span("dom.serialize") as span:
+                span.set(tokens=120)
+        record_span("llm.attempt", 0.25, error="TimeoutError")
+        flush_traces()
+    finally:
+        monkeypatch.undo()
+        configure_tracing(enabled=False)
+
+    assert writers == {"trace-writer"}
+    with open(get_trace_path(run_id), encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    by_name = {span["name"]: span for span in spans}
+    assert [span["name"] for span in spans] == ["dom.serialize", "step", "llm.attempt"]
+    assert by_name["dom.serialize"]["parent_id"] == by_name["step"]["span_id"]
+    assert by_name["dom.serialize"]["attributes"] == {"tokens": 120}
+    assert by_name["llm.attempt"]["error"] == "TimeoutError"
+
+
+def test_summary_includes_the_queued_spans(tmp_path):
+    configure_tracing(enabled=True, directory=str(tmp_path))
+    try:
+        for run in range(3):
+            start_trace(f"run-{run}")
+            for _ in range(10):
+                record_span("action", 0.01)
+        summary = summarize_traces()
+    finally:
+        configure_tracing(enabled=False)
+
+    assert summary["action"]["count"] == 30
+    assert summary["action"]["runs"] == 3
+    assert not getattr(tracing, "__queue").unfinished_tasks